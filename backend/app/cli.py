@@ -0,0 +1,72 @@
+"""
+Command line entry points, run from the backend directory:
+
+    python -m app.cli run-batch workflow.json queries.txt > results.ndjson
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import asyncio
+import json
+import sys
+
+from . import schemas
+from .db.chat_logs import chat_log_writer
+from .engine.batch import run_batch, BATCH_CONCURRENCY
+from .engine.graph import compile_workflow, WorkflowGraphError
+from .endpoints.workflow import log_batch_results
+
+
+def read_queries(path):
+    """One query per line; blank lines are skipped. `-` reads stdin."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with stream:
+        return [line.strip() for line in stream if line.strip()]
+
+
+async def run_batch_command(args):
+    with open(args.workflow, encoding="utf-8") as f:
+        workflow = json.load(f)
+    batch = schemas.WorkflowBatch(**{**workflow, "queries": read_queries(args.queries)})
+    plan = compile_workflow(batch.definition, batch.edges)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    errors = 0
+    try:
+        results = log_batch_results(
+            batch.id, run_batch(plan, batch.queries, args.concurrency, use_cache=not args.no_cache)
+        )
+        async for result in results:
+            errors += "error" in result
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        await chat_log_writer.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"Ran {len(batch.queries)} queries, {errors} failed", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("run-batch", help="Run one workflow for many queries, writing NDJSON")
+    batch.add_argument("workflow", help="JSON file with the workflow definition, edges and optional id")
+    batch.add_argument("queries", help="Text file with one query per line, or - for stdin")
+    batch.add_argument("-o", "--output", help="Write results here instead of stdout")
+    batch.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    batch.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+
+    args = parser.parse_args(argv)
+    try:
+        return asyncio.run(run_batch_command(args))
+    except WorkflowGraphError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
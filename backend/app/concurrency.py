@@ -0,0 +1,16 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bound on blocking calls (SDKs without async clients, Chroma, sync
+# SQLAlchemy sessions) that may be in flight at once per worker process.
+BLOCKING_POOL_SIZE = int(os.environ.get("BLOCKING_POOL_SIZE", 32))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the bounded executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
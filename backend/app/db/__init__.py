@@ -1,2 +1,2 @@
-from .database import Base, engine, SessionLocal, get_db
+from .database import Base, engine, SessionLocal, get_db, async_engine, AsyncSessionLocal, get_async_db
 from . import models
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+
+from sqlalchemy import insert
+
+from . import database
+from ..metrics import stage
+from .models import ChatLog
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT, and how long rows may wait for a batch to fill up
+CHAT_LOG_BATCH_SIZE = int(os.environ.get("CHAT_LOG_BATCH_SIZE", 500))
+CHAT_LOG_FLUSH_INTERVAL = float(os.environ.get("CHAT_LOG_FLUSH_INTERVAL", 1.0))
+# Rows kept while the database is unreachable; the oldest are dropped beyond this
+CHAT_LOG_BUFFER_LIMIT = int(os.environ.get("CHAT_LOG_BUFFER_LIMIT", 50000))
+
+
+class ChatLogWriter:
+    """
+    Write-behind buffer for ChatLog rows. Handlers add rows and return
+    straight away; rows are bulk-inserted shortly after, off the response
+    path, and whatever is left is flushed on shutdown.
+    """
+
+    def __init__(self, batch_size=CHAT_LOG_BATCH_SIZE, interval=CHAT_LOG_FLUSH_INTERVAL,
+                 limit=CHAT_LOG_BUFFER_LIMIT):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.limit = limit
+        self._rows = []
+        self._task = None
+        self._flush_lock = None
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        return len(self._rows)
+
+    def pending_for(self, session_id):
+        """Buffered rows of a session, oldest first; they are newer than any stored row."""
+        return [row for row in self._rows if row.get("session_id") == session_id]
+
+    def add(self, workflow_id, query, response, **fields):
+        self._rows.append({"workflow_id": workflow_id, "query": query, "response": response, **fields})
+        if len(self._rows) > self.limit:
+            overflow = len(self._rows) - self.limit
+            del self._rows[:overflow]
+            self.dropped += overflow
+            logger.warning(f"Chat log buffer full, dropped {overflow} oldest rows")
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        while self._rows:
+            if len(self._rows) < self.batch_size:
+                await asyncio.sleep(self.interval)
+            if not await self.flush():
+                # Database unavailable: back off before retrying
+                await asyncio.sleep(self.interval * 5)
+
+    async def flush(self):
+        """Insert buffered rows in batches. Returns False if the database rejected them."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._rows:
+                rows = self._rows[:self.batch_size]
+                try:
+                    with stage("db_write", table="chat_logs"):
+                        async with database.AsyncSessionLocal() as db:
+                            await db.execute(insert(ChatLog), rows)
+                            await db.commit()
+                            # Drop them before yielding again so readers never see a row twice
+                            del self._rows[:len(rows)]
+                            self.written += len(rows)
+                except Exception as e:
+                    logger.error(f"Error writing {len(rows)} chat logs: {str(e)}")
+                    return False
+        return True
+
+    async def close(self):
+        """Stop the background flush and write out what is left."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._rows:
+            await self.flush()
+
+
+chat_log_writer = ChatLogWriter()
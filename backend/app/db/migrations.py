@@ -0,0 +1,54 @@
+"""
+Schema upgrades for databases created by an older version. create_all only
+creates missing tables, so columns and indexes that the models gained since a
+table was created are added here. Every step checks the live schema first,
+so running it on each startup is a no-op once the database is up to date.
+"""
+import logging
+
+from sqlalchemy import column as column_clause, inspect, table as table_clause, text
+
+from .models import Base
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(engine):
+    """Add model columns and indexes missing from existing tables, backfilling their defaults."""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    _add_column(conn, table, column)
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    logger.info(f"Creating index {index.name} on {table.name}")
+                    index.create(conn)
+
+
+def _add_column(conn, table, column):
+    dialect = conn.dialect
+    quote = dialect.identifier_preparer.quote
+    ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=dialect)}"
+    # SQLite can't add a column whose default is an expression like now(), so
+    # existing rows are backfilled below instead
+    if column.server_default is not None and dialect.name != "sqlite":
+        ddl += f" DEFAULT {dialect.ddl_compiler(dialect, None).get_column_default_string(column)}"
+    logger.info(f"Adding column {column.name} to {table.name}")
+    conn.execute(text(ddl))
+
+    if column.server_default is not None:
+        value = column.server_default.arg
+    elif column.default is not None and column.default.is_scalar:
+        value = column.default.arg
+    else:
+        return
+    # A bare table clause, so onupdate defaults of columns not added yet stay out of the UPDATE
+    target = column_clause(column.name)
+    conn.execute(table_clause(table.name, target).update().where(target.is_(None)).values({column.name: value}))
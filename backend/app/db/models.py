@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -7,8 +7,25 @@ class Document(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
+    # One row per document key; re-uploads bump the version in place
+    document_key = Column(String, unique=True, index=True)
+    knowledge_base = Column(String, index=True, default="default")
+    content_hash = Column(String)
+    version = Column(Integer, default=1)
     meta_data = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    status = Column(String, default="queued")
+    embedding_provider = Column(String)
+    knowledge_base = Column(String, default="default")
+    files = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class Workflow(Base):
     __tablename__ = "workflows"
@@ -16,13 +33,42 @@ class Workflow(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     definition = Column(JSON)
+    edges = Column(JSON)
+    # Builder node positions by component id, only used to redraw the canvas
+    layout = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class ChatLog(Base):
     __tablename__ = "chat_logs"
+    # History is paged newest-first by id within a workflow or a session
+    __table_args__ = (
+        Index("ix_chat_logs_workflow_id_id", "workflow_id", "id"),
+        Index("ix_chat_logs_session_id_id", "session_id", "id"),
+        Index("ix_chat_logs_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     workflow_id = Column(Integer)
+    session_id = Column(String)
     query = Column(String)
     response = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    session_id = Column(String, primary_key=True)
+    summary = Column(String)
+    # Turns up to and including this chat log id are folded into the summary
+    last_log_id = Column(Integer)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class KnowledgeBaseGeneration(Base):
+    __tablename__ = "knowledge_base_generations"
+
+    # Bumped whenever a knowledge base's documents change, so every replica can
+    # tell which cached responses were built on an older corpus
+    knowledge_base = Column(String, primary_key=True)
+    generation = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,90 +1,106 @@
-from fastapi import APIRouter, APIRouter, File, UploadFile, Form
-from typing import List
-from ..llm.openai import OpenAI
-from ..llm.gemini import Gemini
-from ..vector_store.chroma import ChromaDB
-from ..db.models import Document
-from ..db.database import SessionLocal
-import pymupdf
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import schemas
+from ..db import database, models
+from ..vector_store.backend import DEFAULT_KNOWLEDGE_BASE, validate_knowledge_base
+from ..vector_store.retrieval import vector_store, embedders
+from ..ingestion.extract import spool_upload, remove_spooled
+from ..ingestion.jobs import ingestion_queue
+import asyncio
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-chroma = ChromaDB()
 
 @router.post("/upload")
 async def upload_documents(
+    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
-    embedding_provider: str = Form(default="gemini")
+    embedding_provider: str = Form(default="gemini"),
+    knowledge_base: str = Form(default=DEFAULT_KNOWLEDGE_BASE)
 ):
-    """Upload PDF documents and store embeddings"""
+    """Queue PDF documents for background parsing and embedding into a knowledge base"""
     try:
-        results = []
-        db = SessionLocal()
-        
-        for file in files:
-            # Extract text from PDF
-            content = await file.read()
-            pdf_document = pymupdf.open(stream=content, filetype="pdf")
-            text = ""
-            for page in pdf_document:
-                text += page.get_text()
-            
-            # Generate embeddings based on provider
-            try:
-                if embedding_provider.lower() == "openai":
-                    api_key = os.getenv("OPENAI_API_KEY")
-                    if not api_key or api_key == "your_openai_api_key":
-                        db.close()
-                        return {
-                            "error": "OpenAI API key not configured. Please add a valid key to backend/.env",
-                            "status": "failed"
-                        }
-                    openai_client = OpenAI()
-                    embedding = openai_client.get_embedding(text)
-                else:  # Default to Gemini
-                    api_key = os.getenv("GEMINI_API_KEY")
-                    if not api_key or api_key.startswith("your_"):
-                        db.close()
-                        return {
-                            "error": "Gemini API key not configured. Please add a valid key to backend/.env",
-                            "status": "failed"
-                        }
-                    gemini_client = Gemini()
-                    embedding = gemini_client.get_embedding(text)
-                
-                # Store in vector database
-                chroma.add_document(
-                    text=text,
-                    embedding=embedding,
-                    metadata={"filename": file.filename}
-                )
-                
-                # Store metadata in PostgreSQL
-                doc = Document(filename=file.filename, content_preview=text[:500])
-                db.add(doc)
-                db.commit()
-                
-                results.append({
-                    "filename": file.filename,
-                    "status": "success",
-                    "text_length": len(text)
-                })
-                
-            except Exception as e:
-                logger.error(f"Error processing {file.filename}: {str(e)}")
-                db.close()
+        validate_knowledge_base(knowledge_base)
+        if embedding_provider.lower() == "openai":
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key or api_key == "your_openai_api_key":
                 return {
-                    "error": f"Error generating embeddings: {str(e)}",
-                    "status": "failed",
-                    "filename": file.filename
+                    "error": "OpenAI API key not configured. Please add a valid key to backend/.env",
+                    "status": "failed"
                 }
-        
-        db.close()
-        return {"documents": results, "status": "success"}
-        
+            embedder = embedders["openai"]
+        else:  # Default to Gemini
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key or api_key.startswith("your_"):
+                return {
+                    "error": "Gemini API key not configured. Please add a valid key to backend/.env",
+                    "status": "failed"
+                }
+            embedder = embedders["gemini"]
+
+        # UploadFile handles are closed once the response is sent, so copy them
+        # to disk now; the job parses them from there and removes them
+        payload = []
+        try:
+            for file in files:
+                payload.append((file.filename, *await spool_upload(file)))
+            job_id = await ingestion_queue.create_job(payload, embedding_provider.lower(), knowledge_base)
+        except Exception:
+            for _, path, _ in payload:
+                remove_spooled(path)
+            raise
+        background_tasks.add_task(ingestion_queue.run, job_id, payload, embedder, vector_store, knowledge_base)
+
+        logger.info(f"Queued ingestion job {job_id} with {len(payload)} files for knowledge base {knowledge_base}")
+        return {"job_id": job_id, "status": "queued", "files": len(payload), "knowledge_base": knowledge_base}
+
     except Exception as e:
         logger.error(f"Upload failed: {str(e)}")
         return {"error": str(e), "status": "failed"}
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.IngestionJob)
+async def get_ingestion_job(job_id: str):
+    """Report the status and per-file progress of an ingestion job"""
+    job = await asyncio.to_thread(ingestion_queue.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+    return job
+
+
+@router.get("/documents", response_model=List[schemas.Document])
+async def list_documents(
+    knowledge_base: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """The live documents, one entry per file name, optionally of one knowledge base"""
+    query = select(models.Document).order_by(models.Document.id)
+    if knowledge_base is not None:
+        query = query.where(models.Document.knowledge_base == knowledge_base)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+@router.get("/bases", response_model=List[schemas.KnowledgeBase])
+async def list_knowledge_bases(db: AsyncSession = Depends(database.get_async_db)):
+    """Knowledge bases that have documents, with their document and chunk counts"""
+    result = await db.execute(select(models.Document.knowledge_base, models.Document.meta_data))
+    bases = {}
+    for knowledge_base, meta_data in result.all():
+        base = bases.setdefault(knowledge_base or DEFAULT_KNOWLEDGE_BASE, {"documents": 0, "chunks": 0})
+        base["documents"] += 1
+        base["chunks"] += (meta_data or {}).get("chunks") or 0
+    return [{"name": name, **counts} for name, counts in sorted(bases.items())]
+
+
+@router.delete("/documents/{document_id}")
+async def delete_document(document_id: int):
+    """Remove a document from the vector store, the keyword index and the database"""
+    if not await ingestion_queue.delete_document(document_id, vector_store):
+        raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+    return {"success": True}
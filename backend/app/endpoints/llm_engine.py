@@ -1,20 +1,54 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from ..llm.openai import openai_client
 from ..llm.gemini import gemini_client
+from ..llm.router import llm_router
+from ..engine.streaming import sse_event
+import logging
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
-@router.post("/")
-async def llm_engine(query: str, context: str = None, prompt: str = None, llm_provider: str = "openai"):
+CLIENTS = {"openai": openai_client, "gemini": gemini_client, "router": llm_router}
+
+def _build_prompt(query: str, context: str = None, prompt: str = None):
     final_prompt = query
     if context:
         final_prompt = f"Context: {context}\n\nQuery: {query}"
     if prompt:
         final_prompt = f"Instruction: {prompt}\n\n{final_prompt}"
+    return final_prompt
+
+@router.post("/")
+async def llm_engine(query: str, context: str = None, prompt: str = None, llm_provider: str = "openai"):
+    final_prompt = _build_prompt(query, context, prompt)
 
-    if llm_provider == "openai":
-        return {"message": "LLM engine received request", "response": openai_client.get_chat_completion(final_prompt)}
-    elif llm_provider == "gemini":
-        return {"message": "LLM engine received request", "response": gemini_client.get_chat_completion(final_prompt)}
-    else:
+    if llm_provider not in CLIENTS:
         return {"message": "Invalid LLM provider"}
+    return {"message": "LLM engine received request", "response": await CLIENTS[llm_provider].aget_chat_completion(final_prompt)}
+
+@router.post("/stream")
+async def llm_engine_stream(query: str, context: str = None, prompt: str = None, llm_provider: str = "openai"):
+    """Stream the completion as server-sent events, ending with a `done` event."""
+    if llm_provider not in CLIENTS:
+        raise HTTPException(status_code=400, detail=f"Invalid LLM provider: {llm_provider}")
+    final_prompt = _build_prompt(query, context, prompt)
+
+    async def events():
+        tokens = []
+        try:
+            async for token in CLIENTS[llm_provider].astream_chat_completion(final_prompt):
+                tokens.append(token)
+                yield sse_event({"type": "token", "token": token})
+        except Exception as e:
+            logger.error(f"Error streaming LLM response: {str(e)}")
+            yield sse_event({"type": "error", "detail": f"LLM error: {str(e)}"})
+            return
+        yield sse_event({"type": "done", "response": "".join(tokens)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/router")
+async def router_stats():
+    """Observed latency, p95 and error rate of each routing candidate"""
+    return llm_router.snapshot()
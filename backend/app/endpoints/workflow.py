@@ -1,114 +1,311 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from ..db import models
 from .. import schemas
 from ..db import database
-from ..llm.openai import openai_client
-from ..vector_store.chroma import chroma_db
-from ..tools.serpapi import serpapi_client
-from ..llm.gemini import gemini_client
+from ..db.chat_logs import chat_log_writer
+from ..engine.graph import compile_workflow, WorkflowGraphError
+from ..engine.executor import execute_plan, plan_response
+from ..engine.streaming import stream_plan
+from ..engine.cache import response_cache, plan_signature
+from ..engine.batch import run_batch, BATCH_CONCURRENCY
+from ..engine.plans import plan_cache
+from ..engine.history import uses_history
+from ..engine.scheduler import workflow_scheduler
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-@router.post("/run")
-async def run_workflow(workflow: schemas.Workflow, db: Session = Depends(database.get_db)):
-    """
-    Execute a workflow by processing components in sequence.
-    """
+async def log_batch_results(workflow_id, results):
+    """Pass batch results through, queueing a ChatLog per answered query."""
+    async for result in results:
+        if workflow_id and "response" in result:
+            chat_log_writer.add(workflow_id=workflow_id, query=result["query"], response=result["response"])
+        yield result
+
+def _cacheable(plan, use_cache, session_id):
+    # Answers that depend on a session's earlier turns are not shared
+    return use_cache and not (session_id and uses_history(plan))
+
+def _admission(request, plan, workflow_id, priority, deadline=None):
+    """Scheduler arguments for a run: whose it is, its class and how long it may queue."""
+    return {
+        # Unsaved workflows are told apart by their structure
+        "workflow": workflow_id or plan_signature(plan),
+        "client": request.headers.get("X-Client-Id") or (request.client.host if request.client else None),
+        "priority": priority,
+        "deadline": deadline,
+    }
+
+def _log_turn(workflow_id, query, response, session_id):
+    if workflow_id or session_id:
+        chat_log_writer.add(workflow_id=workflow_id, query=query, response=response, session_id=session_id)
+
+async def _run_plan(plan, query, use_cache, workflow_id, session_id=None, admission=None):
+    use_cache = _cacheable(plan, use_cache, session_id)
     try:
-        query = workflow.query
-        response = ""
-        context = ""
-        
-        logger.info(f"Starting workflow execution with query: {query}")
-
-        for component in workflow.definition:
-            component_type = component.type
-            component_config = component.config or {}
-            
-            logger.info(f"Processing component: {component_type}")
-            
-            if component_type == "user_query":
-                # Query is already available
-                pass
-                
-            elif component_type == "knowledge_base":
-                try:
-                    # Query the vector store for relevant context
-                    n_results = component_config.get("n_results", 3)
-                    results = chroma_db.query(query_texts=[query], n_results=n_results)
-                    
-                    if results and results.get('documents') and len(results['documents']) > 0:
-                        context = " ".join(results['documents'][0])
-                        logger.info(f"Retrieved {len(results['documents'][0])} context chunks")
-                except Exception as e:
-                    logger.error(f"Error querying knowledge base: {str(e)}")
-                    # Continue without context if knowledge base fails
-                    
-            elif component_type == "llm_engine":
-                # Get LLM provider and model
-                llm_provider = component_config.get("llm_provider", "openai")
-                model = component_config.get("model", "gpt-3.5-turbo" if llm_provider == "openai" else "gemini-1.5-flash")
-                custom_prompt = component_config.get("custom_prompt", "")
-                use_serpapi = component_config.get("use_serpapi", False)
-                
-                # Build the final prompt
-                final_prompt = query
-                
-                # Add context if available
-                if context:
-                    final_prompt = f"Context: {context}\n\nQuery: {query}"
-                
-                # Add custom prompt if provided
-                if custom_prompt:
-                    final_prompt = f"{custom_prompt}\n\n{final_prompt}"
-                
-                # Add web search results if enabled
-                if use_serpapi:
-                    try:
-                        search_results = serpapi_client.search(query)
-                        # Extract organic results
-                        if 'organic_results' in search_results:
-                            search_snippets = [r.get('snippet', '') for r in search_results['organic_results'][:3]]
-                            final_prompt += "\n\nWeb Search Results: " + " ".join(search_snippets)
-                        logger.info("Added web search results to prompt")
-                    except Exception as e:
-                        logger.error(f"Error fetching SerpAPI results: {str(e)}")
-                
-                # Call the LLM
-                try:
-                    if llm_provider == "openai":
-                        response = openai_client.get_chat_completion(final_prompt, model=model)
-                    elif llm_provider == "gemini":
-                        response = gemini_client.get_chat_completion(final_prompt, model=model)
-                    else:
-                        raise HTTPException(status_code=400, detail=f"Invalid LLM provider: {llm_provider}")
-                    
-                    logger.info("LLM response generated successfully")
-                except Exception as e:
-                    logger.error(f"Error calling LLM: {str(e)}")
-                    raise HTTPException(status_code=500, detail=f"LLM error: {str(e)}")
-                    
-            elif component_type == "output":
-                # The response will be returned to the user
-                pass
-
-        # Save to chat logs if workflow has an ID
-        if workflow.id:
-            chat_log = models.ChatLog(
-                workflow_id=workflow.id, 
-                query=workflow.query, 
-                response=response
-            )
-            db.add(chat_log)
-            db.commit()
+        response = None
+        if use_cache:
+            response = await response_cache.get(plan, query)
+            if response is not None:
+                logger.info("Serving workflow response from cache")
+
+        if response is None:
+            # Cached answers skip the queue; raises 429 if the run isn't admitted
+            async with workflow_scheduler.slot(**(admission or {})):
+                results = await execute_plan(plan, query, session_id=session_id)
+            response = plan_response(plan, results)
+            if use_cache and response:
+                await response_cache.set(plan, query, response)
+
+        # Save to chat logs if workflow or session has an ID; written after the response is sent
+        _log_turn(workflow_id, query, response, session_id)
 
         return {"response": response, "success": True}
-        
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Unexpected error in workflow execution: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Workflow execution error: {str(e)}")
+
+async def _stream_plan_response(plan, query, use_cache, workflow_id, session_id=None, admission=None):
+    use_cache = _cacheable(plan, use_cache, session_id)
+    cached = await response_cache.get(plan, query) if use_cache else None
+    # Taken before the response starts so a rejection is still a 429; held until the stream ends
+    ticket = await workflow_scheduler.acquire(**(admission or {})) if cached is None else None
+
+    async def save_response(response):
+        if use_cache and cached is None and response:
+            await response_cache.set(plan, query, response)
+        _log_turn(workflow_id, query, response, session_id)
+
+    async def release():
+        if ticket is not None:
+            workflow_scheduler.release(ticket)
+
+    async def events():
+        try:
+            async for event in stream_plan(
+                plan, query, on_complete=save_response, cached_response=cached, session_id=session_id
+            ):
+                yield event
+        finally:
+            await release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the slot if the client left before the stream started
+        background=BackgroundTask(release),
+    )
+
+@router.post("/run")
+async def run_workflow(workflow: schemas.Workflow, request: Request):
+    """
+    Execute a workflow, running independent components concurrently.
+    """
+    logger.info(f"Starting workflow execution with query: {workflow.query}")
+
+    try:
+        plan = compile_workflow(workflow.definition, workflow.edges)
+    except WorkflowGraphError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await _run_plan(
+        plan, workflow.query, workflow.use_cache, workflow.id, workflow.session_id,
+        _admission(request, plan, workflow.id, workflow.priority, workflow.deadline),
+    )
+
+
+@router.post("/run/stream")
+async def run_workflow_stream(workflow: schemas.Workflow, request: Request):
+    """
+    Execute a workflow and stream the final LLM tokens as server-sent events.
+    The complete response is logged once the stream ends.
+    """
+    logger.info(f"Starting streamed workflow execution with query: {workflow.query}")
+
+    try:
+        plan = compile_workflow(workflow.definition, workflow.edges)
+    except WorkflowGraphError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await _stream_plan_response(
+        plan, workflow.query, workflow.use_cache, workflow.id, workflow.session_id,
+        _admission(request, plan, workflow.id, workflow.priority, workflow.deadline),
+    )
+
+
+@router.post("/run_batch")
+async def run_workflow_batch(batch: schemas.WorkflowBatch, request: Request):
+    """
+    Execute one workflow for many queries and stream one JSON object per line
+    as each query finishes. Lines carry the query's `index` in the request.
+    Queries run as background work unless `priority` says otherwise.
+    """
+    logger.info(f"Starting batch workflow execution with {len(batch.queries)} queries")
+
+    try:
+        plan = compile_workflow(batch.definition, batch.edges)
+    except WorkflowGraphError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Turn the batch away up front rather than failing each of its queries
+    workflow_scheduler.check_admission(batch.priority)
+    results = log_batch_results(
+        batch.id,
+        run_batch(
+            plan, batch.queries, batch.concurrency or BATCH_CONCURRENCY, use_cache=batch.use_cache,
+            admission=_admission(request, plan, batch.id, batch.priority),
+        ),
+    )
+
+    async def lines():
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    """Hit/miss counters of the workflow response cache"""
+    return response_cache.stats()
+
+
+@router.delete("/cache")
+async def clear_cache():
+    response_cache.clear()
+    return {"success": True}
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    """Running and queued runs per priority class, estimated waits and admission counters"""
+    return workflow_scheduler.stats()
+
+
+# Saved workflows. Declared last so the literal paths above take precedence
+# over /{workflow_id}.
+
+def _compile_saved(workflow: models.Workflow):
+    return compile_workflow(
+        [schemas.WorkflowComponent(**component) for component in workflow.definition or []],
+        [schemas.WorkflowEdge(**edge) for edge in workflow.edges or []],
+    )
+
+async def _load_plan(workflow_id: int):
+    async with database.AsyncSessionLocal() as db:
+        workflow = await db.get(models.Workflow, workflow_id)
+        return _compile_saved(workflow) if workflow is not None else None
+
+async def get_saved_plan(workflow_id: int):
+    """Compiled plan for a saved workflow, from the plan cache when possible."""
+    plan = plan_cache.get(workflow_id)
+    if plan is None:
+        plan = await _load_plan(workflow_id)
+        if plan is None:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+        plan_cache.set(workflow_id, plan)
+    return plan
+
+def _validate(workflow: schemas.WorkflowCreate):
+    try:
+        return compile_workflow(workflow.definition, workflow.edges)
+    except WorkflowGraphError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _get_or_404(db: AsyncSession, workflow_id: int):
+    workflow = await db.get(models.Workflow, workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return workflow
+
+def _apply(record: models.Workflow, workflow: schemas.WorkflowCreate):
+    record.name = workflow.name
+    record.definition = [component.model_dump() for component in workflow.definition]
+    record.edges = [edge.model_dump() for edge in workflow.edges]
+    record.layout = workflow.layout
+
+@router.post("/", response_model=schemas.WorkflowRecord)
+async def create_workflow(workflow: schemas.WorkflowCreate, db: AsyncSession = Depends(database.get_async_db)):
+    """Save a workflow so it can be run by id"""
+    plan = _validate(workflow)
+    record = models.Workflow()
+    _apply(record, workflow)
+    db.add(record)
+    await db.commit()
+    await db.refresh(record)
+    plan_cache.set(record.id, plan)
+    return record
+
+@router.get("/", response_model=List[schemas.WorkflowRecord])
+async def list_workflows(db: AsyncSession = Depends(database.get_async_db)):
+    result = await db.execute(select(models.Workflow).order_by(models.Workflow.id))
+    return result.scalars().all()
+
+@router.get("/{workflow_id}", response_model=schemas.WorkflowRecord)
+async def get_workflow(workflow_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    return await _get_or_404(db, workflow_id)
+
+@router.put("/{workflow_id}", response_model=schemas.WorkflowRecord)
+async def update_workflow(workflow_id: int, workflow: schemas.WorkflowCreate, db: AsyncSession = Depends(database.get_async_db)):
+    plan = _validate(workflow)
+    record = await _get_or_404(db, workflow_id)
+    _apply(record, workflow)
+    await db.commit()
+    await db.refresh(record)
+    plan_cache.set(workflow_id, plan)
+    return record
+
+@router.delete("/{workflow_id}")
+async def delete_workflow(workflow_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    await db.delete(await _get_or_404(db, workflow_id))
+    await db.commit()
+    plan_cache.invalidate(workflow_id)
+    return {"success": True}
+
+@router.post("/{workflow_id}/run")
+async def run_saved_workflow(workflow_id: int, request: schemas.WorkflowRunRequest, http_request: Request):
+    """Execute a saved workflow; only the query travels with the request."""
+    logger.info(f"Starting execution of saved workflow {workflow_id} with query: {request.query}")
+    plan = await get_saved_plan(workflow_id)
+    return await _run_plan(
+        plan, request.query, request.use_cache, workflow_id, request.session_id,
+        _admission(http_request, plan, workflow_id, request.priority, request.deadline),
+    )
+
+@router.post("/{workflow_id}/run/stream")
+async def run_saved_workflow_stream(workflow_id: int, request: schemas.WorkflowRunRequest, http_request: Request):
+    """Streaming variant of /{workflow_id}/run, as server-sent events."""
+    logger.info(f"Starting streamed execution of saved workflow {workflow_id} with query: {request.query}")
+    plan = await get_saved_plan(workflow_id)
+    return await _stream_plan_response(
+        plan, request.query, request.use_cache, workflow_id, request.session_id,
+        _admission(http_request, plan, workflow_id, request.priority, request.deadline),
+    )
+
+@router.get("/{workflow_id}/history", response_model=schemas.ChatHistoryPage)
+async def get_history(workflow_id: int, session_id: Optional[str] = None, limit: int = Query(50, ge=1, le=500),
+                      before: Optional[int] = None, db: AsyncSession = Depends(database.get_async_db)):
+    """
+    Chat logs of a workflow, newest first, optionally for one session. Pass the
+    returned `next_cursor` as `before` to page back; pages are keyed on id, so
+    deep pages cost the same as the first.
+    """
+    statement = select(models.ChatLog).where(models.ChatLog.workflow_id == workflow_id)
+    if session_id:
+        statement = statement.where(models.ChatLog.session_id == session_id)
+    if before is not None:
+        statement = statement.where(models.ChatLog.id < before)
+    result = await db.execute(statement.order_by(models.ChatLog.id.desc()).limit(limit))
+    items = result.scalars().all()
+    return {"items": items, "next_cursor": items[-1].id if len(items) == limit else None}
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+
+from ..vector_store.retrieval import retriever
+from .cache import response_cache
+from .executor import execute_plan, plan_response, retrieval_options
+from .scheduler import workflow_scheduler, BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Queries executed at once within a batch
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+# Queries retrieved together in one multi-query call and held in memory at once
+BATCH_WINDOW = int(os.environ.get("BATCH_WINDOW", 256))
+
+
+async def prefetch_retrieval(plan, queries):
+    """
+    Run each knowledge_base node once for all `queries`, so they are embedded
+    in one batched call and searched in one multi-query call. Returns a
+    `{node_id: hits}` dict per query.
+    """
+    nodes = [node for node in plan.nodes if node.type == "knowledge_base"]
+    retrieved = [{} for _ in queries]
+    if not nodes or not queries:
+        return retrieved
+
+    results = await asyncio.gather(
+        *(retriever.search(queries, **retrieval_options(node.config)) for node in nodes),
+        return_exceptions=True,
+    )
+    for node, hits_per_query in zip(nodes, results):
+        if isinstance(hits_per_query, Exception):
+            logger.error(f"Error querying knowledge base for batch: {str(hits_per_query)}")
+            # Same as a single run: continue without context
+            hits_per_query = [[] for _ in queries]
+        for index, hits in enumerate(hits_per_query):
+            retrieved[index][node.id] = hits
+    return retrieved
+
+
+async def run_batch(plan, queries, concurrency=BATCH_CONCURRENCY, use_cache=True, admission=None):
+    """
+    Execute a plan for many queries, yielding `{"index", "query", "response"}`
+    (or `"error"`) for each query as it finishes. Cached answers are yielded
+    first; the rest run with at most `concurrency` plans in flight, each
+    taking a scheduler slot with the `admission` keyword arguments
+    (a background run by default).
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+    admission = admission or {"priority": BACKGROUND}
+
+    async def run_one(index, query, retrieved):
+        async with slots:
+            try:
+                async with workflow_scheduler.slot(**admission):
+                    results = await execute_plan(plan, query, retrieved=retrieved)
+            except Exception as e:
+                logger.error(f"Batch query {index} failed: {str(e)}")
+                return {"index": index, "query": query, "error": getattr(e, "detail", None) or str(e)}
+        response = plan_response(plan, results)
+        if use_cache and response:
+            await response_cache.set(plan, query, response)
+        return {"index": index, "query": query, "response": response}
+
+    for start in range(0, len(queries), BATCH_WINDOW):
+        pending = []
+        for index, query in enumerate(queries[start:start + BATCH_WINDOW], start):
+            cached = await response_cache.get(plan, query) if use_cache else None
+            if cached is not None:
+                yield {"index": index, "query": query, "response": cached, "cached": True}
+            else:
+                pending.append((index, query))
+
+        retrieved = await prefetch_retrieval(plan, [query for _, query in pending])
+        tasks = [
+            asyncio.ensure_future(run_one(index, query, prefetched))
+            for (index, query), prefetched in zip(pending, retrieved)
+        ]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # The consumer went away (e.g. the client disconnected)
+            for task in tasks:
+                task.cancel()
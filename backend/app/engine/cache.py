@@ -0,0 +1,248 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..db import database
+from ..db.models import KnowledgeBaseGeneration
+from ..llm.openai import openai_client
+from ..llm.gemini import gemini_client
+from ..llm.embedding_cache import CachedEmbedder
+from ..vector_store.backend import knowledge_base_names
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+# Cosine similarity above which a cached answer is reused for a different
+# phrasing of the question. 0 disables the embedding tier.
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0))
+RESPONSE_CACHE_EMBEDDING_PROVIDER = os.environ.get("RESPONSE_CACHE_EMBEDDING_PROVIDER", "openai")
+
+# Component config that changes the answer; anything else (labels, file
+# names shown in the builder) is ignored when keying the cache.
+CACHE_KEY_FIELDS = (
+    "llm_provider", "model", "custom_prompt", "n_results", "use_serpapi", "num_results",
+    "filter", "embedding_provider", "retrieval_mode", "rerank", "context_tokens",
+    "candidates", "history_turns", "search_queries", "knowledge_bases",
+)
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def plan_signature(plan):
+    """Hash of a plan's structure and answer-relevant config, independent of node ids."""
+    positions = {node.id: index for index, node in enumerate(plan.nodes)}
+    shape = [
+        {
+            "type": node.type,
+            "config": {key: node.config[key] for key in CACHE_KEY_FIELDS if key in node.config},
+            "deps": sorted(positions[dep] for dep in node.deps),
+        }
+        for node in plan.nodes
+    ]
+    return hashlib.sha256(json.dumps(shape, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def plan_knowledge_bases(plan):
+    """Knowledge bases searched by a plan's knowledge base nodes."""
+    return {
+        name
+        for node in plan.nodes if node.type == "knowledge_base"
+        for name in knowledge_base_names(node.config.get("knowledge_bases"))
+    }
+
+
+class ResponseCache:
+    """
+    In-process cache of workflow responses with an exact-match tier keyed on
+    (plan signature, normalized query) and an optional embedding-similarity
+    tier. Entries expire after `ttl` seconds and are evicted LRU-first.
+
+    Answers grounded on knowledge bases also record the generation of each
+    one, kept in the database and bumped by ingestion and deletes on any
+    replica; an entry whose generations are no longer current is a miss.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 similarity_threshold=RESPONSE_CACHE_SIMILARITY,
+                 embedding_provider=RESPONSE_CACHE_EMBEDDING_PROVIDER):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedder = CachedEmbedder(gemini_client if embedding_provider == "gemini" else openai_client)
+        self._entries = OrderedDict()
+        self._query_embeddings = OrderedDict()
+        # Generations read by get(), so set() records the corpus the answer was built on
+        self._lookup_generations = OrderedDict()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    async def get(self, plan, query):
+        signature = plan_signature(plan)
+        key = (signature, normalize_query(query))
+        generations = await self._generations(plan_knowledge_bases(plan))
+        if generations is None:
+            self.counters["misses"] += 1
+            return None
+        self._lookup_generations[key] = generations
+        while len(self._lookup_generations) > 256:
+            self._lookup_generations.popitem(last=False)
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires"] > now and entry["generations"] == generations:
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry["response"]
+        if entry is not None:
+            del self._entries[key]
+
+        if self.similarity_threshold > 0:
+            response = await self._get_similar(signature, key[1], generations, now)
+            if response is not None:
+                self.counters["semantic_hits"] += 1
+                return response
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, plan, query, response):
+        signature = plan_signature(plan)
+        normalized = normalize_query(query)
+        key = (signature, normalized)
+        knowledge_bases = plan_knowledge_bases(plan)
+        # Prefer the generations seen before the plan ran: an ingestion that
+        # finished meanwhile must not vouch for an answer built without it
+        generations = self._lookup_generations.pop(key, None)
+        if generations is None:
+            generations = await self._generations(knowledge_bases)
+            if generations is None:
+                return
+        embedding = None
+        if self.similarity_threshold > 0:
+            embedding = await self._embed(normalized)
+
+        self._entries[key] = {
+            "response": response,
+            "expires": time.monotonic() + self.ttl,
+            "embedding": embedding,
+            "knowledge_bases": knowledge_bases,
+            "generations": generations,
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def _get_similar(self, signature, normalized, generations, now):
+        embedding = await self._embed(normalized)
+        if embedding is None:
+            return None
+
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in self._entries.items():
+            if (key[0] != signature or entry["embedding"] is None or entry["expires"] <= now
+                    or entry["generations"] != generations):
+                continue
+            score = float(np.dot(embedding, entry["embedding"]))
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]["response"]
+
+    async def _embed(self, normalized):
+        """Unit-normalized query embedding, memoized so get() and set() share one call."""
+        if normalized in self._query_embeddings:
+            self._query_embeddings.move_to_end(normalized)
+            return self._query_embeddings[normalized]
+        try:
+            vector = np.asarray(await self.embedder.aget_embedding(normalized), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Error embedding query for response cache: {str(e)}")
+            return None
+        vector /= np.linalg.norm(vector) or 1.0
+        self._query_embeddings[normalized] = vector
+        while len(self._query_embeddings) > 256:
+            self._query_embeddings.popitem(last=False)
+        return vector
+
+    async def _generations(self, knowledge_bases):
+        """Current generation of each knowledge base, or None if the database can't be read."""
+        if not knowledge_bases:
+            return {}
+        try:
+            async with database.AsyncSessionLocal() as db:
+                rows = await db.execute(
+                    select(KnowledgeBaseGeneration.knowledge_base, KnowledgeBaseGeneration.generation)
+                    .where(KnowledgeBaseGeneration.knowledge_base.in_(knowledge_bases))
+                )
+                current = dict(rows.all())
+        except Exception as e:
+            logger.error(f"Error reading knowledge base generations for response cache: {str(e)}")
+            return None
+        return {name: current.get(name, 0) for name in knowledge_bases}
+
+    async def _bump_generation(self, knowledge_base):
+        table = KnowledgeBaseGeneration
+        statement = update(table).values(generation=table.generation + 1)
+        if knowledge_base is not None:
+            statement = statement.where(table.knowledge_base == knowledge_base)
+        # Two replicas may create the row at once; the loser bumps the winner's row
+        for attempt in range(2):
+            async with database.AsyncSessionLocal() as db:
+                result = await db.execute(statement)
+                if result.rowcount == 0 and knowledge_base is not None:
+                    db.add(table(knowledge_base=knowledge_base, generation=1))
+                try:
+                    await db.commit()
+                    return
+                except IntegrityError:
+                    if attempt:
+                        raise
+
+    async def invalidate_knowledge_base(self, knowledge_base=None):
+        """
+        Mark answers grounded on the knowledge base, or on any knowledge base
+        if None, as stale on every replica, and drop this replica's copies.
+        """
+        try:
+            await self._bump_generation(knowledge_base)
+        except Exception as e:
+            logger.error(f"Error bumping knowledge base generation: {str(e)}")
+        stale = [
+            key for key, entry in self._entries.items()
+            if entry["knowledge_bases"] and (knowledge_base is None or knowledge_base in entry["knowledge_bases"])
+        ]
+        for key in stale:
+            del self._entries[key]
+        self.counters["invalidations"] += len(stale)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        self._entries.clear()
+        self._query_embeddings.clear()
+        self._lookup_generations.clear()
+        self.counters = dict.fromkeys(self.counters, 0)
+
+    def stats(self):
+        lookups = self.counters["exact_hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
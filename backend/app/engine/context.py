@@ -0,0 +1,52 @@
+import os
+
+from ..ingestion.chunking import count_tokens
+from ..llm.embedding_cache import normalize_text
+
+# Upper bound on knowledge base context sent to the LLM, in the same
+# whitespace tokens used for chunking. 0 disables trimming.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+# Token-set overlap above which two chunks count as the same passage
+NEAR_DUPLICATE_THRESHOLD = 0.9
+# A truncated chunk shorter than this is dropped instead
+MIN_PARTIAL_TOKENS = 20
+
+
+def _is_near_duplicate(tokens, kept):
+    for other in kept:
+        union = len(tokens | other)
+        if union and len(tokens & other) / union >= NEAR_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+def pack_context(hits, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Turn ranked retrieval hits into the context passages for a prompt: drop
+    repeated ids and near-duplicate text, then keep hits in rank order until
+    `token_budget` is reached, truncating the last one to fit.
+    """
+    seen_ids = set()
+    kept_tokens = []
+    passages = []
+    used = 0
+    for hit in hits:
+        text = normalize_text(hit["text"])
+        hit_id = hit.get("id")
+        if not text or (hit_id is not None and hit_id in seen_ids):
+            continue
+        tokens = set(text.lower().split())
+        if _is_near_duplicate(tokens, kept_tokens):
+            continue
+        seen_ids.add(hit_id)
+        kept_tokens.append(tokens)
+
+        size = count_tokens(text)
+        if token_budget and used + size > token_budget:
+            remaining = token_budget - used
+            if remaining >= MIN_PARTIAL_TOKENS:
+                passages.append(" ".join(text.split()[:remaining]))
+            break
+        passages.append(text)
+        used += size
+    return passages
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+
+from fastapi import HTTPException
+
+from ..llm.openai import openai_client
+from ..llm.gemini import gemini_client
+from ..llm.router import llm_router
+from ..metrics import stage, span, workflow_seconds
+from ..tools.serpapi import serpapi_client
+from ..vector_store.backend import knowledge_base_names
+from ..vector_store.retrieval import retriever
+from .context import pack_context, CONTEXT_TOKEN_BUDGET
+from .history import conversation_history, history_turns
+
+logger = logging.getLogger(__name__)
+
+
+LLM_CLIENTS = {"openai": openai_client, "gemini": gemini_client, "router": llm_router}
+
+
+async def run_user_query(node, inputs, ctx):
+    return {"query": ctx.query}
+
+
+def retrieval_options(config):
+    """Retriever.search keyword arguments for a knowledge_base node's config."""
+    return {
+        "n_results": config.get("n_results", 3),
+        "where": config.get("filter"),
+        "provider": config.get("embedding_provider"),
+        "mode": config.get("retrieval_mode", "hybrid"),
+        "rerank": config.get("rerank", False),
+        # Only the named knowledge bases are searched, the default one if none are named
+        "knowledge_bases": knowledge_base_names(config.get("knowledge_bases")),
+    }
+
+
+async def run_knowledge_base(node, inputs, ctx):
+    try:
+        # Batch runs retrieve for many queries up front; otherwise query the vector store now
+        hits = ctx.retrieved.get(node.id)
+        if hits is None:
+            hits = (await retriever.search([ctx.query], **retrieval_options(node.config)))[0]
+
+        context = pack_context(hits, node.config.get("context_tokens", CONTEXT_TOKEN_BUDGET))
+        logger.info(f"Retrieved {len(hits)} context chunks, packed {len(context)}")
+        return {"context": context}
+    except Exception as e:
+        logger.error(f"Error querying knowledge base: {str(e)}")
+        # Continue without context if knowledge base fails
+    return {"context": []}
+
+
+def search_queries(config, query):
+    """
+    The query plus any reformulations configured as `search_queries`, where
+    "{query}" stands for the user's query, e.g. "{query} site:docs.python.org".
+    """
+    queries = [query]
+    for template in config.get("search_queries") or []:
+        reformulated = template.replace("{query}", query).strip()
+        if reformulated and reformulated not in queries:
+            queries.append(reformulated)
+    return queries
+
+
+async def run_web_search(node, inputs, ctx):
+    try:
+        # Reformulations run concurrently and their organic results are merged
+        organic_results = await serpapi_client.asearch_many(search_queries(node.config, ctx.query))
+        if organic_results:
+            num_results = node.config.get("num_results", 3)
+            logger.info("Fetched web search results")
+            return {"snippets": [r.get('snippet', '') for r in organic_results[:num_results]]}
+    except Exception as e:
+        logger.error(f"Error fetching SerpAPI results: {str(e)}")
+    return {"snippets": []}
+
+
+def build_prompt(config, inputs, query, history=""):
+    context = []
+    snippets = []
+    for upstream, result in inputs:
+        context.extend(result.get("context", []))
+        if upstream.type == "llm_engine" and result.get("response"):
+            context.append(result["response"])
+        snippets.extend(result.get("snippets", []))
+
+    final_prompt = query
+
+    # Add context if available
+    if context:
+        final_prompt = f"Context: {' '.join(context)}\n\nQuery: {query}"
+
+    # Add custom prompt if provided
+    custom_prompt = config.get("custom_prompt", "")
+    if custom_prompt:
+        final_prompt = f"{custom_prompt}\n\n{final_prompt}"
+
+    # Add web search results if enabled
+    if snippets:
+        final_prompt += "\n\nWeb Search Results: " + " ".join(snippets)
+
+    # Earlier turns of the session go first, like a chat transcript
+    if history:
+        final_prompt = f"Conversation so far:\n{history}\n\n{final_prompt}"
+
+    return final_prompt
+
+
+async def run_llm_engine(node, inputs, ctx):
+    llm_provider = node.config.get("llm_provider", "openai")
+    if llm_provider not in LLM_CLIENTS:
+        raise HTTPException(status_code=400, detail=f"Invalid LLM provider: {llm_provider}")
+
+    turns = history_turns(node.config) if ctx.session_id else 0
+    history = ""
+    if turns:
+        try:
+            history = await conversation_history.prompt_block(ctx.session_id, turns)
+        except Exception as e:
+            logger.error(f"Error loading conversation history: {str(e)}")
+
+    final_prompt = build_prompt(node.config, inputs, ctx.query, history)
+    client = LLM_CLIENTS[llm_provider]
+    if llm_provider == "router":
+        # Optional "provider:model" list; the router picks and hedges among them
+        options = {"model": node.config.get("candidates"), "hedge": node.config.get("hedge")}
+    else:
+        options = {"model": node.config.get("model", "gpt-3.5-turbo" if llm_provider == "openai" else "gemini-1.5-flash")}
+
+    try:
+        if ctx.emit and node.id in ctx.streamed:
+            tokens = []
+            async for token in client.astream_chat_completion(final_prompt, **options):
+                tokens.append(token)
+                await ctx.emit(node.id, token)
+            response = "".join(tokens)
+        else:
+            response = await client.aget_chat_completion(final_prompt, **options)
+        logger.info(f"LLM response generated successfully for component {node.id}")
+    except Exception as e:
+        logger.error(f"Error calling LLM: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"LLM error: {str(e)}")
+
+    if turns:
+        conversation_history.schedule_refresh(
+            ctx.session_id, turns, lambda prompt: client.aget_chat_completion(prompt, **options)
+        )
+    return {"response": response}
+
+
+async def run_output(node, inputs, ctx):
+    # Fan-in: combine the responses of the LLM engines wired into this output
+    responses = [result["response"] for _, result in inputs if result.get("response")]
+    return {"response": "\n\n".join(responses)}
+
+
+NODE_HANDLERS = {
+    "user_query": run_user_query,
+    "knowledge_base": run_knowledge_base,
+    "web_search": run_web_search,
+    "llm_engine": run_llm_engine,
+    "output": run_output,
+}
+
+
+class RunContext:
+    """Per-run state shared by the node handlers of one workflow execution."""
+
+    def __init__(self, query, emit=None, streamed=(), retrieved=None, session_id=None):
+        self.query = query
+        self.session_id = session_id
+        # Called as `await emit(node_id, token)` for nodes in `streamed`
+        self.emit = emit
+        self.streamed = set(streamed)
+        # Knowledge base hits already fetched for this query, by node id
+        self.retrieved = retrieved or {}
+
+
+async def execute_plan(plan, query, emit=None, retrieved=None, session_id=None):
+    """
+    Run every node of an execution plan as soon as its dependencies finish,
+    so independent branches run concurrently. Returns results by node id.
+
+    When `emit` is given, LLM engines that produce the final response stream
+    their tokens through it as they arrive. With a `session_id`, LLM engines
+    that set `history_turns` see the earlier turns of that session.
+    """
+    ctx = RunContext(query, emit, plan.streamed_nodes() if emit else (), retrieved, session_id)
+    tasks = {}
+
+    async def run_node(node):
+        inputs = [(plan.by_id[dep], await tasks[dep]) for dep in node.deps]
+        handler = NODE_HANDLERS.get(node.type)
+        if handler is None:
+            logger.warning(f"Skipping unknown component type: {node.type}")
+            return {}
+        logger.info(f"Processing component: {node.type} ({node.id})")
+        with stage(node.type, node_id=node.id):
+            return await handler(node, inputs, ctx)
+
+    # Node tasks are created inside the span so their spans nest under it
+    with span("workflow", nodes=len(plan.nodes)), workflow_seconds.time():
+        for node in plan.nodes:
+            tasks[node.id] = asyncio.ensure_future(run_node(node))
+
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+    return dict(zip(tasks, results))
+
+
+def plan_response(plan, results):
+    responses = [results[node.id].get("response", "") for node in plan.final_nodes()]
+    return "\n\n".join(response for response in responses if response)
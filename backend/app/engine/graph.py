@@ -0,0 +1,139 @@
+import logging
+
+from ..vector_store.backend import knowledge_base_names
+
+logger = logging.getLogger(__name__)
+
+# The React Flow builder uses camelCase node types
+TYPE_ALIASES = {
+    "userQuery": "user_query",
+    "knowledgeBase": "knowledge_base",
+    "llmEngine": "llm_engine",
+}
+
+# Used to infer dependencies when a workflow is submitted without edges: a
+# component depends on every earlier component of a lower stage, except that
+# an output only depends on the last LLM engine before it.
+STAGES = {
+    "user_query": 0,
+    "knowledge_base": 1,
+    "web_search": 1,
+    "llm_engine": 2,
+    "output": 3,
+}
+
+
+class WorkflowGraphError(ValueError):
+    pass
+
+
+class PlanNode:
+    def __init__(self, id, type, config, deps=()):
+        self.id = id
+        self.type = type
+        self.config = config
+        self.deps = list(deps)
+
+    def __repr__(self):
+        return f"PlanNode(id={self.id!r}, type={self.type!r}, deps={self.deps!r})"
+
+
+class ExecutionPlan:
+    """Workflow components in topological order, each with its dependencies."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.by_id = {node.id: node for node in nodes}
+
+    def final_nodes(self):
+        """Nodes whose results form the workflow response."""
+        outputs = [node for node in self.nodes if node.type == "output"]
+        if outputs:
+            return outputs
+        engines = [node for node in self.nodes if node.type == "llm_engine"]
+        return engines[-1:]
+
+    def streamed_nodes(self):
+        """Ids of the LLM engines whose output reaches the response directly."""
+        streamed = set()
+        for node in self.final_nodes():
+            if node.type == "llm_engine":
+                streamed.add(node.id)
+            streamed.update(dep for dep in node.deps if self.by_id[dep].type == "llm_engine")
+        return streamed
+
+
+def compile_workflow(definition, edges=None):
+    """
+    Build an execution plan from workflow components and optional builder
+    edges. Web search is split out of llm_engine components into its own
+    node so it can run alongside knowledge base retrieval.
+    """
+    nodes = []
+    for component in definition:
+        component_type = TYPE_ALIASES.get(component.type, component.type)
+        nodes.append(PlanNode(component.id, component_type, dict(component.config or {})))
+    by_id = {node.id: node for node in nodes}
+    if len(by_id) != len(nodes):
+        raise WorkflowGraphError("Workflow component ids must be unique")
+
+    if edges:
+        for edge in edges:
+            if edge.source not in by_id or edge.target not in by_id:
+                logger.warning(f"Ignoring edge {edge.source} -> {edge.target} with unknown endpoint")
+                continue
+            if edge.source not in by_id[edge.target].deps:
+                by_id[edge.target].deps.append(edge.source)
+    else:
+        for index, node in enumerate(nodes):
+            stage = STAGES.get(node.type)
+            if stage is None:
+                continue
+            node.deps = [
+                earlier.id for earlier in nodes[:index]
+                if STAGES.get(earlier.type, stage) < stage
+            ]
+            engines = [dep for dep in node.deps if by_id[dep].type == "llm_engine"]
+            if node.type == "output" and engines:
+                # As in a sequential run, the last LLM engine's answer is the response
+                node.deps = engines[-1:]
+
+    for node in list(nodes):
+        if node.type == "knowledge_base":
+            # Normalized here so the response cache keys equivalent spellings alike
+            try:
+                node.config["knowledge_bases"] = knowledge_base_names(
+                    node.config.get("knowledge_bases", node.config.get("knowledge_base"))
+                )
+            except ValueError as e:
+                raise WorkflowGraphError(f"Component {node.id}: {e}")
+        if node.type == "llm_engine" and node.config.get("use_serpapi"):
+            search = PlanNode(f"{node.id}:web_search", "web_search", {
+                "num_results": node.config.get("num_results", 3),
+                "search_queries": node.config.get("search_queries") or [],
+            })
+            nodes.append(search)
+            node.deps.append(search.id)
+
+    return ExecutionPlan(_toposort(nodes))
+
+
+def _toposort(nodes):
+    by_id = {node.id: node for node in nodes}
+    ordered = []
+    state = {}  # node id -> "visiting" | "done"
+
+    def visit(node):
+        if state.get(node.id) == "done":
+            return
+        if state.get(node.id) == "visiting":
+            raise WorkflowGraphError(f"Workflow contains a cycle through component {node.id}")
+        state[node.id] = "visiting"
+        for dep in node.deps:
+            visit(by_id[dep])
+        state[node.id] = "done"
+        ordered.append(node)
+
+    for node in nodes:
+        visit(node)
+    return ordered
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+
+from sqlalchemy import select
+
+from ..db import database, models
+from ..db.chat_logs import chat_log_writer
+from ..ingestion.chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the history block of a prompt, in whitespace tokens
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 1000))
+# Older turns folded into the rolling summary per refresh
+HISTORY_SUMMARY_BATCH = int(os.environ.get("HISTORY_SUMMARY_BATCH", 20))
+
+SUMMARY_PROMPT = (
+    "Update the summary of a conversation with the new turns below. Keep facts, "
+    "names and decisions the user may refer back to; stay under {words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{turns}\n\nUpdated summary:"
+)
+
+
+def history_turns(config):
+    """Number of recent turns an llm_engine node includes verbatim (0 = no history)."""
+    try:
+        return max(0, int(config.get("history_turns") or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def uses_history(plan):
+    return any(node.type == "llm_engine" and history_turns(node.config) for node in plan.nodes)
+
+
+def format_turns(turns):
+    return "\n".join(f"User: {turn['query']}\nAssistant: {turn['response']}" for turn in turns)
+
+
+class ConversationHistory:
+    """Recent turns and the rolling summary of older ones, per session."""
+
+    def __init__(self):
+        self._refreshing = {}
+
+    def schedule_refresh(self, session_id, keep, summarize):
+        """Refresh the session's summary in the background, at most once at a time."""
+        task = self._refreshing.get(session_id)
+        if task is not None and not task.done():
+            return
+        task = asyncio.ensure_future(self._refresh_logged(session_id, keep, summarize))
+        self._refreshing[session_id] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(session_id, None))
+
+    async def _refresh_logged(self, session_id, keep, summarize):
+        try:
+            await self.refresh_summary(session_id, keep, summarize)
+        except Exception as e:
+            logger.error(f"Error refreshing summary of session {session_id}: {str(e)}")
+
+    async def recent_turns(self, session_id, limit):
+        """The last `limit` turns, oldest first, including ones not yet written."""
+        turns = [
+            {"id": None, "query": row["query"], "response": row["response"]}
+            for row in chat_log_writer.pending_for(session_id)
+        ][-limit:]
+        if len(turns) < limit:
+            async with database.AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(models.ChatLog.id, models.ChatLog.query, models.ChatLog.response)
+                    .where(models.ChatLog.session_id == session_id)
+                    .order_by(models.ChatLog.id.desc())
+                    .limit(limit - len(turns))
+                )
+                stored = [{"id": id, "query": query, "response": response} for id, query, response in result]
+            turns = stored[::-1] + turns
+        return turns
+
+    async def summary(self, session_id):
+        async with database.AsyncSessionLocal() as db:
+            record = await db.get(models.ConversationSummary, session_id)
+        return (record.summary, record.last_log_id) if record else ("", 0)
+
+    async def prompt_block(self, session_id, limit, budget=HISTORY_TOKEN_BUDGET):
+        """
+        History text for a prompt: the rolling summary followed by as many of
+        the last `limit` turns as fit in `budget`, newest kept first.
+        """
+        summary, _ = await self.summary(session_id)
+        turns = await self.recent_turns(session_id, limit)
+
+        used = count_tokens(summary)
+        kept = []
+        for turn in reversed(turns):
+            size = count_tokens(turn["query"]) + count_tokens(turn["response"] or "")
+            if used + size > budget:
+                break
+            kept.append(turn)
+            used += size
+        kept.reverse()
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation: {summary}")
+        if kept:
+            parts.append(format_turns(kept))
+        return "\n".join(parts)
+
+    async def refresh_summary(self, session_id, keep, summarize, budget=HISTORY_TOKEN_BUDGET):
+        """
+        Fold stored turns older than the last `keep` into the rolling summary.
+        `summarize(prompt)` is awaited to produce the new summary. Called after
+        a response is sent, so it never delays an answer.
+        """
+        summary, last_log_id = await self.summary(session_id)
+        # Pending turns are newer than stored ones and count towards `keep`
+        keep_stored = max(0, keep - len(chat_log_writer.pending_for(session_id)))
+        async with database.AsyncSessionLocal() as db:
+            # Oldest stored turn that is still shown verbatim
+            cutoff = await db.scalar(
+                select(models.ChatLog.id)
+                .where(models.ChatLog.session_id == session_id)
+                .order_by(models.ChatLog.id.desc())
+                .offset(keep_stored - 1 if keep_stored else 0)
+                .limit(1)
+            )
+            if cutoff is None:
+                return summary
+            result = await db.execute(
+                select(models.ChatLog.id, models.ChatLog.query, models.ChatLog.response)
+                .where(
+                    models.ChatLog.session_id == session_id,
+                    models.ChatLog.id > last_log_id,
+                    models.ChatLog.id < cutoff if keep_stored else models.ChatLog.id <= cutoff,
+                )
+                .order_by(models.ChatLog.id)
+                .limit(HISTORY_SUMMARY_BATCH)
+            )
+            older = [{"id": id, "query": query, "response": response} for id, query, response in result]
+        if not older:
+            return summary
+
+        # No connection is held while the LLM writes the summary
+        prompt = SUMMARY_PROMPT.format(
+            words=max(50, budget // 2), summary=summary or "(none)", turns=format_turns(older)
+        )
+        summary = (await summarize(prompt)).strip()
+
+        async with database.AsyncSessionLocal() as db:
+            record = await db.get(models.ConversationSummary, session_id)
+            if record is None:
+                record = models.ConversationSummary(session_id=session_id)
+                db.add(record)
+            record.summary = summary
+            record.last_log_id = older[-1]["id"]
+            await db.commit()
+        logger.info(f"Folded {len(older)} turns into the summary of session {session_id}")
+        return summary
+
+
+conversation_history = ConversationHistory()
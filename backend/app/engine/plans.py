@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", 256))
+# Updates invalidate this worker's entry right away; the TTL bounds how long
+# other workers can keep running a plan that was changed through them.
+PLAN_CACHE_TTL = float(os.environ.get("PLAN_CACHE_TTL", 300))
+
+
+class PlanCache:
+    """LRU cache of compiled execution plans for saved workflows, by workflow id."""
+
+    def __init__(self, max_entries=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workflow_id):
+        with self._lock:
+            entry = self._entries.get(workflow_id)
+            if entry is None or entry[1] <= time.monotonic():
+                self._entries.pop(workflow_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(workflow_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, workflow_id, plan):
+        with self._lock:
+            self._entries[workflow_id] = (plan, time.monotonic() + self.ttl)
+            self._entries.move_to_end(workflow_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, workflow_id):
+        with self._lock:
+            self._entries.pop(workflow_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+plan_cache = PlanCache()
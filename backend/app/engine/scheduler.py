@@ -0,0 +1,250 @@
+"""
+Admission control in front of the workflow executor. Every run takes a slot
+before it executes. Slots are bounded globally, per workflow and per client,
+and background runs may only hold a share of them, so interactive chat keeps
+headroom during batch jobs. Waiting runs are served interactive first, then
+in arrival order. A run whose estimated queueing time already exceeds its
+deadline is rejected up front with 429 and a Retry-After hint, rather than
+waiting until the providers time out.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from ..metrics import workflow_queue_wait, workflow_rejections
+
+logger = logging.getLogger(__name__)
+
+# Workflow runs executing at once per worker process; 0 disables admission control
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get("SCHEDULER_MAX_CONCURRENCY", 64))
+# Runs of one workflow, and runs from one client, executing at once; 0 for no limit
+SCHEDULER_WORKFLOW_CONCURRENCY = int(os.environ.get("SCHEDULER_WORKFLOW_CONCURRENCY", 32))
+SCHEDULER_CLIENT_CONCURRENCY = int(os.environ.get("SCHEDULER_CLIENT_CONCURRENCY", 16))
+# Share of the slots background runs may hold
+SCHEDULER_BACKGROUND_SHARE = float(os.environ.get("SCHEDULER_BACKGROUND_SHARE", 0.5))
+# Runs waiting per priority class before new ones are turned away
+SCHEDULER_QUEUE_SIZE = int(os.environ.get("SCHEDULER_QUEUE_SIZE", 256))
+# Seconds a run may wait for a slot unless the request sets its own deadline; 0 waits indefinitely
+SCHEDULER_INTERACTIVE_DEADLINE = float(os.environ.get("SCHEDULER_INTERACTIVE_DEADLINE", 30))
+SCHEDULER_BACKGROUND_DEADLINE = float(os.environ.get("SCHEDULER_BACKGROUND_DEADLINE", 0))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+# Highest priority first
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+DEFAULT_DEADLINES = {INTERACTIVE: SCHEDULER_INTERACTIVE_DEADLINE, BACKGROUND: SCHEDULER_BACKGROUND_DEADLINE}
+
+# Weight of the latest run in the moving average of run time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class Overloaded(HTTPException):
+    """429 with a Retry-After hint, raised when a run is not admitted."""
+
+    def __init__(self, detail, retry_after):
+        self.retry_after = retry_after
+        super().__init__(
+            status_code=429, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+
+class Ticket:
+    """A run's place in the queue, then its slot until released."""
+
+    def __init__(self, workflow, client, priority):
+        self.workflow = workflow
+        self.client = client
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.released = False
+        self.future = None
+
+
+class WorkflowScheduler:
+    def __init__(self, max_concurrency=SCHEDULER_MAX_CONCURRENCY, workflow_concurrency=SCHEDULER_WORKFLOW_CONCURRENCY,
+                 client_concurrency=SCHEDULER_CLIENT_CONCURRENCY, background_share=SCHEDULER_BACKGROUND_SHARE,
+                 queue_size=SCHEDULER_QUEUE_SIZE, deadlines=None):
+        self.max_concurrency = max_concurrency
+        self.workflow_concurrency = workflow_concurrency
+        self.client_concurrency = client_concurrency
+        self.background_limit = max(1, int(max_concurrency * background_share))
+        self.queue_size = queue_size
+        self.deadlines = dict(deadlines or DEFAULT_DEADLINES)
+        self.running = dict.fromkeys(PRIORITIES, 0)
+        self._queues = {priority: [] for priority in PRIORITIES}
+        self._by_workflow = {}
+        self._by_client = {}
+        # Moving average of run time in seconds, None until a run completes
+        self.service_time = None
+        # Totals since startup; stats() reports the current queue per priority as "queued"
+        self.counters = {"admitted": 0, "queued_total": 0, "rejected": 0, "timed_out": 0}
+
+    @property
+    def enabled(self):
+        return self.max_concurrency > 0
+
+    def queued(self, priority):
+        return len(self._queues[priority])
+
+    def estimate_wait(self, priority=INTERACTIVE):
+        """
+        Expected seconds a run arriving now waits for a slot: the runs queued
+        ahead of it, at the rate its class of slots frees up. 0 until a run
+        has completed, since there is nothing to estimate from.
+        """
+        if not self.enabled or self.service_time is None:
+            return 0.0
+        ahead = sum(self.queued(p) for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        free = self.max_concurrency - sum(self.running.values())
+        if priority == BACKGROUND:
+            free = min(free, self.background_limit - self.running[BACKGROUND])
+        if ahead == 0 and free > 0:
+            return 0.0
+        capacity = self.max_concurrency if priority == INTERACTIVE else self.background_limit
+        return (ahead + 1) * self.service_time / capacity
+
+    def check_admission(self, priority=INTERACTIVE, deadline=None):
+        """Raise Overloaded if a run of this class would be turned away right now."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if not self.enabled:
+            return
+        wait = self.estimate_wait(priority)
+        if self.queued(priority) >= self.queue_size:
+            self._reject(priority, "queue_full", f"Too many {priority} workflow runs queued", wait)
+        deadline = self.deadlines[priority] if deadline is None else deadline
+        if deadline and wait > deadline:
+            self._reject(
+                priority, "deadline", f"Estimated wait of {wait:.1f}s exceeds the {deadline:g}s deadline", wait
+            )
+
+    async def acquire(self, workflow=None, client=None, priority=INTERACTIVE, deadline=None):
+        """
+        Wait for a slot and return its ticket, to be passed to release().
+        Raises Overloaded if the run is not admitted, or if it is still
+        queued when its deadline passes.
+        """
+        ticket = Ticket(workflow, client, priority)
+        if not self.enabled:
+            return ticket
+        self.check_admission(priority, deadline)
+        deadline = self.deadlines[priority] if deadline is None else deadline
+        # Runs are started as soon as slots free up, so anything still queued
+        # is blocked by a limit this run may not share
+        if self._can_start(ticket):
+            self._start(ticket)
+            return ticket
+
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(ticket)
+        self.counters["queued_total"] += 1
+        try:
+            await asyncio.wait_for(ticket.future, deadline or None)
+        except asyncio.TimeoutError:
+            self._abandon(ticket)
+            self.counters["timed_out"] += 1
+            self._reject(
+                priority, "timeout", f"No workflow slot freed up within {deadline:g}s", self.estimate_wait(priority)
+            )
+        except asyncio.CancelledError:
+            # The client went away while queued
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket):
+        """Free the ticket's slot and start whichever queued runs can now go. Safe to call twice."""
+        if ticket.started is None or ticket.released:
+            return
+        ticket.released = True
+        elapsed = time.monotonic() - ticket.started
+        if self.service_time is None:
+            self.service_time = elapsed
+        else:
+            self.service_time += SERVICE_TIME_SMOOTHING * (elapsed - self.service_time)
+        self.running[ticket.priority] -= 1
+        _decrement(self._by_workflow, ticket.workflow)
+        _decrement(self._by_client, ticket.client)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, workflow=None, client=None, priority=INTERACTIVE, deadline=None):
+        ticket = await self.acquire(workflow, client, priority, deadline)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _can_start(self, ticket):
+        if sum(self.running.values()) >= self.max_concurrency:
+            return False
+        if ticket.priority == BACKGROUND and self.running[BACKGROUND] >= self.background_limit:
+            return False
+        if self.workflow_concurrency and self._by_workflow.get(ticket.workflow, 0) >= self.workflow_concurrency:
+            return False
+        if self.client_concurrency and self._by_client.get(ticket.client, 0) >= self.client_concurrency:
+            return False
+        return True
+
+    def _start(self, ticket):
+        ticket.started = time.monotonic()
+        self.running[ticket.priority] += 1
+        if ticket.workflow is not None:
+            self._by_workflow[ticket.workflow] = self._by_workflow.get(ticket.workflow, 0) + 1
+        if ticket.client is not None:
+            self._by_client[ticket.client] = self._by_client.get(ticket.client, 0) + 1
+        self.counters["admitted"] += 1
+        workflow_queue_wait.labels(priority=ticket.priority).observe(ticket.started - ticket.enqueued)
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            for ticket in list(queue):
+                if sum(self.running.values()) >= self.max_concurrency:
+                    return
+                if ticket.future.done():
+                    # Timed out or cancelled, and about to be abandoned
+                    queue.remove(ticket)
+                elif self._can_start(ticket):
+                    queue.remove(ticket)
+                    self._start(ticket)
+                    ticket.future.set_result(None)
+
+    def _abandon(self, ticket):
+        if ticket in self._queues[ticket.priority]:
+            self._queues[ticket.priority].remove(ticket)
+        # The slot may have been granted just as the wait ended
+        self.release(ticket)
+
+    def _reject(self, priority, reason, detail, retry_after):
+        self.counters["rejected"] += 1
+        workflow_rejections.labels(priority=priority, reason=reason).inc()
+        logger.warning(f"Rejected {priority} workflow run ({reason}): {detail}")
+        raise Overloaded(detail, retry_after)
+
+    def stats(self):
+        return {
+            **self.counters,
+            "running": dict(self.running),
+            "queued": {priority: self.queued(priority) for priority in PRIORITIES},
+            "estimated_wait": {priority: self.estimate_wait(priority) for priority in PRIORITIES},
+            "service_time": self.service_time,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+def _decrement(counts, key):
+    if key is None:
+        return
+    counts[key] -= 1
+    if not counts[key]:
+        del counts[key]
+
+
+workflow_scheduler = WorkflowScheduler()
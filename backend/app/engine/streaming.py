@@ -0,0 +1,63 @@
+import asyncio
+import json
+import logging
+
+from fastapi import HTTPException
+
+from .executor import execute_plan, plan_response
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+
+async def stream_plan(plan, query, on_complete=None, cached_response=None, session_id=None):
+    """
+    Execute a plan and yield server-sent events: a `token` event per streamed
+    token, then a single `done` event with the full response (or `error`).
+    `on_complete(response)` is awaited before the `done` event is sent.
+
+    When `cached_response` is given the plan is not executed and the cached
+    text is sent as a single token.
+    """
+    if cached_response is not None:
+        yield sse_event({"type": "token", "node": None, "token": cached_response, "cached": True})
+        if on_complete is not None:
+            await on_complete(cached_response)
+        yield sse_event({"type": "done", "response": cached_response, "cached": True})
+        return
+
+    queue = asyncio.Queue()
+
+    async def emit(node_id, token):
+        await queue.put({"type": "token", "node": node_id, "token": token})
+
+    task = asyncio.ensure_future(execute_plan(plan, query, emit=emit, session_id=session_id))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield sse_event(event)
+
+        try:
+            results = task.result()
+        except HTTPException as e:
+            yield sse_event({"type": "error", "detail": e.detail})
+            return
+        except Exception as e:
+            logger.error(f"Unexpected error in streamed workflow execution: {str(e)}")
+            yield sse_event({"type": "error", "detail": f"Workflow execution error: {str(e)}"})
+            return
+
+        response = plan_response(plan, results)
+        if on_complete is not None:
+            await on_complete(response)
+        yield sse_event({"type": "done", "response": response})
+    finally:
+        # The client went away before the run finished
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,53 @@
+import os
+from itertools import islice
+
+# Chunk sizes are measured in whitespace-delimited tokens. This tracks model
+# tokens closely enough to keep embedding requests bounded without pulling in
+# a provider-specific tokenizer.
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", 300))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", 50))
+
+
+def count_tokens(text):
+    return len(text.split())
+
+
+def chunk_pages(pages, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """
+    Split an iterable of page texts into overlapping, token-bounded chunks.
+
+    Chunks may span page boundaries; each one records the page it starts on.
+    """
+    if overlap >= chunk_tokens:
+        raise ValueError("overlap must be smaller than chunk_tokens")
+
+    buffer = []  # (token, page_number) pairs not yet emitted
+    index = 0
+    for page_number, text in enumerate(pages, start=1):
+        buffer.extend((token, page_number) for token in text.split())
+        while len(buffer) >= chunk_tokens:
+            yield _make_chunk(buffer[:chunk_tokens], index)
+            index += 1
+            buffer = buffer[chunk_tokens - overlap:]
+
+    # The tail always repeats `overlap` tokens of the previous chunk, so only
+    # emit it when it carries something new.
+    if buffer and (index == 0 or len(buffer) > overlap):
+        yield _make_chunk(buffer, index)
+
+
+def _make_chunk(window, index):
+    return {
+        "text": " ".join(token for token, _ in window),
+        "page": window[0][1],
+        "index": index,
+    }
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
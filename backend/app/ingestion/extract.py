@@ -0,0 +1,82 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from collections import deque
+from itertools import islice
+
+import pymupdf
+
+logger = logging.getLogger(__name__)
+
+# Uploads are copied here until their job finishes; defaults to the system temp dir
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR") or None
+SPOOL_CHUNK_BYTES = int(os.environ.get("UPLOAD_SPOOL_CHUNK_BYTES", 1024 * 1024))
+# Pages parsed per worker task, and tasks in flight per document
+PARSE_WINDOW_PAGES = int(os.environ.get("INGEST_PARSE_WINDOW_PAGES", 16))
+PARSE_AHEAD = int(os.environ.get("INGEST_PARSE_AHEAD", 2))
+
+
+async def spool_upload(file, directory=UPLOAD_SPOOL_DIR, chunk_bytes=SPOOL_CHUNK_BYTES):
+    """
+    Copy an UploadFile to a temporary file in fixed-size chunks. Returns its
+    path and the SHA-256 of its content.
+    """
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".pdf", dir=directory)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await file.read(chunk_bytes):
+                digest.update(chunk)
+                await asyncio.to_thread(spool.write, chunk)
+    except BaseException:
+        remove_spooled(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def remove_spooled(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove spooled upload {path}: {str(e)}")
+
+
+def page_count(path):
+    with pymupdf.open(path) as pdf_document:
+        return pdf_document.page_count
+
+
+def extract_page_range(path, start, stop):
+    """Return the text of pages [start, stop) of a PDF. Runs inside a worker process."""
+    with pymupdf.open(path) as pdf_document:
+        return [pdf_document[number].get_text() for number in range(start, stop)]
+
+
+def iter_pages(path, count, pool=None, window=PARSE_WINDOW_PAGES, ahead=PARSE_AHEAD):
+    """
+    Yield the text of each page of a PDF in order. Windows of `window` pages
+    are parsed on `pool` with at most `ahead` of them in flight, so memory is
+    bounded by the window rather than the size of the file. Without a pool the
+    pages are parsed in the calling thread.
+    """
+    ranges = ((start, min(start + window, count)) for start in range(0, count, window))
+    if pool is None:
+        for start, stop in ranges:
+            yield from extract_page_range(path, start, stop)
+        return
+
+    pending = deque(pool.submit(extract_page_range, path, start, stop) for start, stop in islice(ranges, ahead))
+    try:
+        while pending:
+            pages = pending.popleft().result()
+            for start, stop in islice(ranges, 1):
+                pending.append(pool.submit(extract_page_range, path, start, stop))
+            yield from pages
+    finally:
+        # The consumer stopped early or failed: don't parse pages nobody reads
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,383 @@
+import asyncio
+import functools
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+
+from ..concurrency import run_blocking
+from ..db import database
+from ..db.models import Document, IngestionJob
+from ..engine.cache import response_cache
+from ..vector_store.backend import DEFAULT_KNOWLEDGE_BASE
+from ..vector_store.bm25 import bm25_index
+from .extract import iter_pages, page_count, remove_spooled, PARSE_AHEAD
+from .pipeline import index_document, document_key, chunk_ids, delete_chunks
+
+logger = logging.getLogger(__name__)
+
+# 0 parses in the default thread pool instead of spawning worker processes.
+PARSE_WORKERS = int(os.environ.get("INGEST_PARSE_WORKERS", os.cpu_count() or 1))
+EMBED_CONCURRENCY = int(os.environ.get("INGEST_EMBED_CONCURRENCY", 4))
+# Unfinished jobs are touched this often by the worker running them; jobs left
+# untouched for INGEST_STALE_JOB_SECONDS lost their worker and are failed
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("INGEST_JOB_HEARTBEAT_SECONDS", 30))
+STALE_JOB_SECONDS = float(os.environ.get("INGEST_STALE_JOB_SECONDS", 300))
+
+UNFINISHED = ("queued", "running")
+FINISHED_FILE = ("completed", "unchanged", "failed")
+ABANDONED_ERROR = "Interrupted before it finished, upload the file again"
+
+
+def _document_state(record):
+    """What re-indexing needs to know about the stored version of a document."""
+    meta_data = record.meta_data or {}
+    return {
+        "content_hash": record.content_hash,
+        "version": record.version or 1,
+        "pages": meta_data.get("pages"),
+        "chunks": meta_data.get("chunks") or 0,
+        "embedding": (meta_data.get("embedding_provider"), meta_data.get("embedding_model")),
+        "knowledge_base": record.knowledge_base or DEFAULT_KNOWLEDGE_BASE,
+    }
+
+
+class IngestionQueue:
+    """
+    Runs upload jobs off the request path: spooled PDFs are parsed a window
+    of pages at a time on a process pool and streamed into chunking and
+    embedding with bounded concurrency, while per-file progress is written
+    to the ingestion_jobs table.
+    """
+
+    def __init__(self, parse_workers=PARSE_WORKERS, embed_concurrency=EMBED_CONCURRENCY):
+        self.parse_workers = parse_workers
+        self.embed_concurrency = embed_concurrency
+        self._pool = None
+        self._embed_slots = None
+        self._jobs = {}
+        self._locks = {}
+        # Document key -> (lock, tasks holding or waiting on it)
+        self._document_locks = {}
+        self._watcher = None
+
+    @property
+    def active_jobs(self):
+        return len(self._jobs)
+
+    @property
+    def pool(self):
+        if self._pool is None and self.parse_workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        return self._pool
+
+    async def create_job(self, files, embedding_provider, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        """Persist a new queued job for (filename, path, content_hash) entries and return its id."""
+        job_id = uuid.uuid4().hex
+        # The spool path lets an abandoned job's files be cleaned up; the API doesn't expose it
+        files = [{"filename": filename, "status": "queued", "path": path} for filename, path, _ in files]
+        await run_blocking(self._insert_job, job_id, files, embedding_provider, knowledge_base)
+        self._jobs[job_id] = {"status": "queued", "files": files}
+        return job_id
+
+    def _insert_job(self, job_id, files, embedding_provider, knowledge_base):
+        db = database.SessionLocal()
+        try:
+            db.add(IngestionJob(
+                id=job_id,
+                status="queued",
+                embedding_provider=embedding_provider,
+                knowledge_base=knowledge_base,
+                files=files,
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    async def run(self, job_id, files, embedder, store, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        """
+        Process every (filename, path, content_hash) entry of a job
+        concurrently into the knowledge base. The spooled files are removed
+        once processed.
+        """
+        if self._embed_slots is None:
+            self._embed_slots = asyncio.Semaphore(self.embed_concurrency)
+        self._locks[job_id] = asyncio.Lock()
+
+        await self._update(job_id, status="running")
+        await asyncio.gather(*(
+            self._process_file(job_id, index, filename, path, content_hash, embedder, store, knowledge_base)
+            for index, (filename, path, content_hash) in enumerate(files)
+        ))
+
+        failed = any(f["status"] == "failed" for f in self._jobs[job_id]["files"])
+        if any(f["status"] == "completed" for f in self._jobs[job_id]["files"]):
+            # Answers grounded on the previous corpus are now stale
+            await response_cache.invalidate_knowledge_base(knowledge_base)
+        await self._update(job_id, status="failed" if failed else "completed")
+        self._jobs.pop(job_id, None)
+        self._locks.pop(job_id, None)
+
+    @asynccontextmanager
+    async def _document_lock(self, key):
+        """Serializes indexing and deletion of one document within this worker."""
+        lock, users = self._document_locks.get(key, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._document_locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            # Drop the lock once no task holds or waits on it
+            lock, users = self._document_locks[key]
+            if users == 1:
+                del self._document_locks[key]
+            else:
+                self._document_locks[key] = (lock, users - 1)
+
+    async def _process_file(self, job_id, index, filename, path, content_hash, embedder, store, knowledge_base):
+        loop = asyncio.get_running_loop()
+        key = document_key(filename, knowledge_base)
+        keyword_index = bm25_index.shard(knowledge_base)
+        try:
+            async with self._document_lock(key):
+                previous = await asyncio.to_thread(self._load_document, key)
+                if (
+                    previous is not None
+                    and previous["content_hash"] == content_hash
+                    and previous["embedding"] == (embedder.provider, embedder.embedding_model)
+                ):
+                    logger.info(f"{filename} is unchanged since version {previous['version']}")
+                    await self._update(
+                        job_id, index, status="unchanged", pages=previous["pages"], chunks=previous["chunks"]
+                    )
+                    return
+
+                await self._update(job_id, index, status="parsing")
+                count = await loop.run_in_executor(self.pool, page_count, path)
+
+                async with self._embed_slots:
+                    await self._update(job_id, index, status="embedding", pages=count)
+                    collection = await loop.run_in_executor(
+                        None, store.collection, embedder.provider, embedder.embedding_model, knowledge_base
+                    )
+                    # Pages are parsed on the pool while earlier ones are chunked and embedded
+                    pages = iter_pages(path, count, self.pool, ahead=max(PARSE_AHEAD, self.parse_workers))
+                    chunk_count = await loop.run_in_executor(
+                        None, functools.partial(
+                            index_document, filename, pages, embedder, collection,
+                            keyword_index=keyword_index, knowledge_base=knowledge_base
+                        )
+                    )
+
+                if previous is not None:
+                    await asyncio.to_thread(self._delete_stale, key, previous, chunk_count, embedder, store)
+                await asyncio.to_thread(
+                    self._save_document, key, filename, knowledge_base, content_hash, count, chunk_count, embedder
+                )
+            await self._update(job_id, index, status="completed", chunks=chunk_count)
+        except Exception as e:
+            logger.error(f"Error processing {filename} in job {job_id}: {str(e)}")
+            await self._update(job_id, index, status="failed", error=str(e))
+        finally:
+            await asyncio.to_thread(remove_spooled, path)
+
+    def _delete_stale(self, key, previous, chunk_count, embedder, store):
+        """Remove chunks of the previous version that the new one did not overwrite."""
+        provider, model = previous["embedding"]
+        knowledge_base = previous["knowledge_base"]
+        if (provider, model) == (embedder.provider, embedder.embedding_model):
+            delete_chunks(
+                store.collection(provider, model, knowledge_base), chunk_ids(key, chunk_count, previous["chunks"])
+            )
+        elif provider is not None:
+            # Re-embedded with another model: the old collection loses the whole document
+            delete_chunks(store.collection(provider, model, knowledge_base), chunk_ids(key, 0, previous["chunks"]))
+        # Keyword entries share ids across collections, so only the tail is stale
+        if previous["chunks"] > chunk_count:
+            bm25_index.shard(knowledge_base).delete(chunk_ids(key, chunk_count, previous["chunks"]))
+        logger.info(f"Replaced version {previous['version']} of document {key}")
+
+    def _load_document(self, key):
+        db = database.SessionLocal()
+        try:
+            record = db.scalar(select(Document).where(Document.document_key == key))
+            return _document_state(record) if record is not None else None
+        finally:
+            db.close()
+
+    def _save_document(self, key, filename, knowledge_base, content_hash, page_count, chunk_count, embedder):
+        db = database.SessionLocal()
+        try:
+            record = db.scalar(select(Document).where(Document.document_key == key))
+            if record is None:
+                record = Document(document_key=key, version=0)
+                db.add(record)
+            record.name = filename
+            record.knowledge_base = knowledge_base
+            record.content_hash = content_hash
+            record.version = (record.version or 0) + 1
+            record.meta_data = {
+                "pages": page_count,
+                "chunks": chunk_count,
+                "embedding_provider": embedder.provider,
+                "embedding_model": embedder.embedding_model,
+                "document_key": key,
+            }
+            db.commit()
+        finally:
+            db.close()
+
+    async def delete_document(self, document_id, store):
+        """
+        Remove a document's chunks from the vector store and keyword index,
+        then its row. Returns False if there is no such document.
+        """
+        record = await asyncio.to_thread(self._get_document, document_id)
+        if record is None:
+            return False
+        async with self._document_lock(record.document_key):
+            # Re-read under the lock: a re-upload may have changed the chunk count
+            current = await asyncio.to_thread(self._get_document, document_id)
+            if current is None:
+                return False
+            state = _document_state(current)
+            if state["embedding"][0] is not None:
+                collection = await asyncio.to_thread(
+                    store.collection, *state["embedding"], state["knowledge_base"]
+                )
+                await asyncio.to_thread(
+                    delete_chunks, collection, chunk_ids(current.document_key, 0, state["chunks"]),
+                    bm25_index.shard(state["knowledge_base"])
+                )
+            await asyncio.to_thread(self._delete_row, document_id)
+        await response_cache.invalidate_knowledge_base(state["knowledge_base"])
+        logger.info(f"Deleted document {document_id} ({state['chunks']} chunks)")
+        return True
+
+    def _get_document(self, document_id):
+        db = database.SessionLocal()
+        try:
+            return db.get(Document, document_id)
+        finally:
+            db.close()
+
+    def _delete_row(self, document_id):
+        db = database.SessionLocal()
+        try:
+            record = db.get(Document, document_id)
+            if record is not None:
+                db.delete(record)
+                db.commit()
+        finally:
+            db.close()
+
+    async def _update(self, job_id, index=None, status=None, **fields):
+        """Apply a progress change in memory, then persist a snapshot of the job."""
+        async with self._locks[job_id]:
+            job = self._jobs[job_id]
+            if index is None:
+                job["status"] = status
+            else:
+                job["files"][index] = {**job["files"][index], "status": status, **fields}
+            snapshot = {"status": job["status"], "files": list(job["files"])}
+            await asyncio.to_thread(self._persist, job_id, snapshot)
+
+    def _persist(self, job_id, snapshot):
+        db = database.SessionLocal()
+        try:
+            job = db.get(IngestionJob, job_id)
+            if job is not None:
+                job.status = snapshot["status"]
+                job.files = snapshot["files"]
+                db.commit()
+        finally:
+            db.close()
+
+    def get_job(self, job_id):
+        db = database.SessionLocal()
+        try:
+            return db.get(IngestionJob, job_id)
+        finally:
+            db.close()
+
+    def start(self):
+        """Start heartbeating this worker's jobs and failing jobs whose worker went away."""
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_jobs())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        self.shutdown()
+
+    async def _watch_jobs(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await run_blocking(self._heartbeat, list(self._jobs))
+                await run_blocking(self.fail_abandoned_jobs)
+            except Exception as e:
+                logger.warning(f"Could not check ingestion jobs: {str(e)}")
+
+    def _heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        db = database.SessionLocal()
+        try:
+            db.execute(update(IngestionJob).where(IngestionJob.id.in_(job_ids)).values(updated_at=func.now()))
+            db.commit()
+        finally:
+            db.close()
+
+    def fail_abandoned_jobs(self, stale_seconds=STALE_JOB_SECONDS):
+        """
+        Fail unfinished jobs that no worker has touched for stale_seconds,
+        such as jobs of a worker that restarted, and remove their spooled
+        files. Returns the ids of the failed jobs.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_seconds)
+        failed, spooled = [], []
+        db = database.SessionLocal()
+        try:
+            jobs = db.scalars(select(IngestionJob).where(
+                IngestionJob.status.in_(UNFINISHED), IngestionJob.updated_at < cutoff
+            )).all()
+            for job in jobs:
+                if job.id in self._jobs:
+                    continue
+                files = []
+                for entry in job.files or []:
+                    if entry.get("path"):
+                        spooled.append(entry["path"])
+                    if entry.get("status") not in FINISHED_FILE:
+                        entry = {**entry, "status": "failed", "error": ABANDONED_ERROR}
+                    files.append(entry)
+                job.files = files
+                job.status = "failed"
+                failed.append(job.id)
+            db.commit()
+        finally:
+            db.close()
+        for path in spooled:
+            remove_spooled(path)
+        if failed:
+            logger.warning(f"Failed {len(failed)} ingestion jobs abandoned by their worker: {', '.join(failed)}")
+        return failed
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+
+from ..llm.embedding_cache import text_hash
+from ..vector_store.backend import DEFAULT_KNOWLEDGE_BASE
+from .chunking import chunk_pages, batched
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+# Chunks embedded and written per bulk upsert while a document streams in
+INDEX_WINDOW_CHUNKS = int(os.environ.get("INDEX_WINDOW_CHUNKS", 512))
+
+
+def document_key(filename, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+    """Stable identifier for a document, used as the prefix of its chunk ids."""
+    # Default knowledge base keys predate knowledge bases and are kept as they were
+    name = filename if knowledge_base == DEFAULT_KNOWLEDGE_BASE else f"{knowledge_base}/{filename}"
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_ids(key, start, stop):
+    """Ids of chunks `start` to `stop - 1` of the document with the given key."""
+    return [f"{key}-{index}" for index in range(start, stop)]
+
+
+def delete_chunks(store, ids, keyword_index=None):
+    """Remove chunks from a vector store collection and the keyword index."""
+    if not ids:
+        return
+    store.delete_documents(ids)
+    if keyword_index is not None:
+        keyword_index.delete(ids)
+
+
+def embed_texts(embedder, texts, batch_size=EMBEDDING_BATCH_SIZE):
+    embeddings = []
+    for batch in batched(texts, batch_size):
+        embeddings.extend(embedder.get_embeddings(batch))
+    return embeddings
+
+
+def index_document(filename, pages, embedder, store, batch_size=EMBEDDING_BATCH_SIZE, keyword_index=None,
+                   window=INDEX_WINDOW_CHUNKS, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+    """
+    Chunk the pages of a document, embed the chunks in batches and write them
+    to the vector store with one bulk call per `window` chunks. `pages` may be
+    a generator; it is consumed as chunks are written, so only a window of
+    chunks is held at a time. Chunks already stored under the same id and
+    content hash are skipped. New chunks are also added to `keyword_index`
+    when given. Returns the number of chunks.
+    """
+    key = document_key(filename, knowledge_base)
+    total = 0
+    indexed = 0
+    for chunks in batched(chunk_pages(pages), window):
+        total += len(chunks)
+        indexed += _index_chunks(key, filename, chunks, embedder, store, batch_size, keyword_index, knowledge_base)
+
+    if total and not indexed:
+        logger.info(f"All {total} chunks of {filename} are already indexed")
+    elif total:
+        logger.info(f"Indexed {indexed} of {total} chunks from {filename}")
+    return total
+
+
+def _index_chunks(key, filename, chunks, embedder, store, batch_size, keyword_index, knowledge_base):
+    ids = [f"{key}-{chunk['index']}" for chunk in chunks]
+    hashes = [text_hash(chunk["text"]) for chunk in chunks]
+
+    existing = store.get_documents(ids)
+    stored_hashes = {
+        id: (metadata or {}).get("content_hash")
+        for id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+    pending = [i for i, id in enumerate(ids) if stored_hashes.get(id) != hashes[i]]
+    if not pending:
+        return 0
+
+    documents = [chunks[i]["text"] for i in pending]
+    metadatas = [
+        {
+            "filename": filename,
+            "knowledge_base": knowledge_base,
+            "page": chunks[i]["page"],
+            "chunk": chunks[i]["index"],
+            "content_hash": hashes[i],
+        }
+        for i in pending
+    ]
+    embeddings = embed_texts(embedder, documents, batch_size)
+    store.upsert_documents(
+        documents=documents,
+        metadatas=metadatas,
+        ids=[ids[i] for i in pending],
+        embeddings=embeddings,
+    )
+    if keyword_index is not None:
+        keyword_index.add([ids[i] for i in pending], documents, metadatas)
+    return len(pending)
@@ -0,0 +1,127 @@
+"""
+Startup and health state. The LLM SDKs and the Chroma client are created on
+first use, so importing the app stays fast. On startup the lifespan creates
+the schema in the background, adding the columns older databases lack,
+retrying until the database accepts connections, and warms those clients
+meanwhile. Liveness only says the
+process is serving; readiness says the database and vector store are usable.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+from .db import database, migrations, models
+from .llm.gemini import get_genai
+from .llm.openai import get_async_client
+from .vector_store.retrieval import vector_store
+
+logger = logging.getLogger(__name__)
+
+# Create clients during startup instead of on the first request that needs them
+WARMUP_CLIENTS = os.environ.get("WARMUP_CLIENTS", "true").lower() == "true"
+# Schema creation and required warmups back off exponentially between attempts, up to the max
+DB_CONNECT_BACKOFF = float(os.environ.get("DB_CONNECT_BACKOFF", 0.5))
+DB_CONNECT_BACKOFF_MAX = float(os.environ.get("DB_CONNECT_BACKOFF_MAX", 10))
+READINESS_TIMEOUT = float(os.environ.get("READINESS_TIMEOUT", 2))
+
+# Checks that must pass before the app reports ready; the LLM providers are
+# optional and are retried on first use if their warmup fails
+REQUIRED_CHECKS = ("database", "vector_store")
+
+
+class Lifecycle:
+    def __init__(self):
+        self.checks = {"database": "pending"}
+        self._task = None
+
+    def start(self):
+        self.checks = {"database": "pending"}
+        if WARMUP_CLIENTS:
+            self.checks.update(vector_store="pending", openai="pending", gemini="pending")
+        self._task = asyncio.create_task(self.warmup())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def warmup(self):
+        steps = [self.init_database()]
+        if WARMUP_CLIENTS:
+            steps += [
+                self._warm("vector_store", vector_store.collections),
+                self._warm("openai", get_async_client),
+                self._warm("gemini", get_genai),
+            ]
+        await asyncio.gather(*steps)
+
+    async def init_database(self):
+        """Create missing tables and columns, waiting for the database to come up."""
+        delay = DB_CONNECT_BACKOFF
+        attempt = 1
+        while True:
+            try:
+                await asyncio.to_thread(models.Base.metadata.create_all, bind=database.engine)
+                await asyncio.to_thread(migrations.add_missing_columns, database.engine)
+                self.checks["database"] = "ok"
+                return
+            except Exception as e:
+                self.checks["database"] = f"unavailable: {_first_line(e)}"
+                logger.warning(f"Database not ready (attempt {attempt}), retrying in {delay:.1f}s: {_first_line(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, DB_CONNECT_BACKOFF_MAX)
+                attempt += 1
+
+    async def _warm(self, name, create):
+        """
+        Create a client ahead of use. Checks that readiness depends on are
+        retried with backoff until they pass; the others are left to be
+        retried on first use.
+        """
+        start = time.perf_counter()
+        delay = DB_CONNECT_BACKOFF
+        while True:
+            try:
+                await asyncio.to_thread(create)
+                self.checks[name] = "ok"
+                logger.info(f"Warmed up {name} in {time.perf_counter() - start:.2f}s")
+                return
+            except Exception as e:
+                self.checks[name] = f"failed: {_first_line(e)}"
+                if name not in REQUIRED_CHECKS:
+                    logger.warning(f"Warmup of {name} failed, it will be retried on first use: {_first_line(e)}")
+                    return
+                logger.warning(f"Warmup of {name} failed, retrying in {delay:.1f}s: {_first_line(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, DB_CONNECT_BACKOFF_MAX)
+
+    async def readiness(self):
+        """(ready, checks): warmup results plus a live database ping."""
+        checks = dict(self.checks)
+        if checks.get("database") == "ok":
+            try:
+                await asyncio.wait_for(_ping_database(), READINESS_TIMEOUT)
+            except Exception as e:
+                checks["database"] = f"unavailable: {_first_line(e) or 'timed out'}"
+        # Without warmup the vector store opens on first use, so it can't hold readiness back
+        ready = all(checks.get(name, "ok") == "ok" for name in REQUIRED_CHECKS)
+        return ready, checks
+
+
+async def _ping_database():
+    async with database.async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def _first_line(error):
+    return str(error).strip().split("\n")[0]
+
+
+lifecycle = Lifecycle()
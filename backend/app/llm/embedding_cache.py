@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from ..concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Kept next to the Chroma data by default so it survives redeploys with the
+# same volume. Set to an empty string to disable the cache.
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.environ.get("CHROMA_PERSIST_DIRECTORY", "./chroma_data"), "embedding_cache.sqlite3"),
+)
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def text_hash(text):
+    """sha256 of the normalized text; also stored on chunks to detect unchanged content."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent (provider, model, text hash) -> vector store backed by SQLite."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " provider TEXT NOT NULL, model TEXT NOT NULL, text_hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL, PRIMARY KEY (provider, model, text_hash))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, provider, model, hashes):
+        """Return cached vectors aligned with `hashes`, None where missing."""
+        found = {}
+        conn = self._connection()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE provider = ? AND model = ?"
+                f" AND text_hash IN ({','.join('?' * len(batch))})",
+                [provider, model, *batch],
+            )
+            for digest, blob in rows:
+                found[digest] = np.frombuffer(blob, dtype=np.float32).tolist()
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return [found.get(digest) for digest in hashes]
+
+    def put_many(self, provider, model, hashes, vectors):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (provider, model, text_hash, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (provider, model, digest, np.asarray(vector, dtype=np.float32).tobytes())
+                    for digest, vector in zip(hashes, vectors)
+                ],
+            )
+
+
+class CachedEmbedder:
+    """
+    Wraps an OpenAI or Gemini client so embedding calls are served from the
+    cache and only texts that have never been embedded reach the provider.
+    """
+
+    def __init__(self, embedder, cache=None):
+        self.embedder = embedder
+        self.cache = cache if cache is not None else embedding_cache
+        self.provider = embedder.provider
+        self.embedding_model = embedder.embedding_model
+
+    def get_embedding(self, text, model=None):
+        return self.get_embeddings([text], model=model)[0]
+
+    def get_embeddings(self, texts, model=None):
+        model = model or self.embedding_model
+        if not self.cache.enabled:
+            return self.embedder.get_embeddings(texts, model=model)
+
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.provider, model, hashes)
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self.embedder.get_embeddings([texts[index] for index in missing], model=model)
+            self.cache.put_many(self.provider, model, [hashes[index] for index in missing], fresh)
+            for index, vector in zip(missing, fresh):
+                vectors[index] = vector
+        return vectors
+
+    async def aget_embedding(self, text, model=None):
+        return (await self.aget_embeddings([text], model=model))[0]
+
+    async def aget_embeddings(self, texts, model=None):
+        model = model or self.embedding_model
+        if not self.cache.enabled:
+            return await self.embedder.aget_embeddings(texts, model=model)
+
+        hashes = [text_hash(text) for text in texts]
+        vectors = await run_blocking(self.cache.get_many, self.provider, model, hashes)
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = await self.embedder.aget_embeddings([texts[index] for index in missing], model=model)
+            await run_blocking(self.cache.put_many, self.provider, model, [hashes[index] for index in missing], fresh)
+            for index, vector in zip(missing, fresh):
+                vectors[index] = vector
+        return vectors
+
+
+embedding_cache = EmbeddingCache()
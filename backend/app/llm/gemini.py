@@ -1,16 +1,123 @@
-import google.generativeai as genai
+import functools
 import os
+import threading
+
+from ..metrics import record_llm_usage
+from .limits import RateLimiter, call_with_retry, acall_with_retry, estimate_tokens
+
+# GEMINI_API_ENDPOINT points the SDK's REST transport at another host, e.g. the
+# benchmark stubs. That transport only serves the synchronous calls.
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
+
+# google.generativeai takes a second or more to import, so it is loaded and
+# configured on first use (or at warmup)
+genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    global genai
+    if genai is None:
+        with _genai_lock:
+            if genai is None:
+                import google.generativeai as sdk
+
+                if GEMINI_API_ENDPOINT:
+                    sdk.configure(
+                        api_key=os.environ.get("GEMINI_API_KEY"), transport="rest",
+                        client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+                    )
+                else:
+                    sdk.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+                genai = sdk
+    return genai
+
+rate_limiter = RateLimiter.from_env("GEMINI")
+
+EMBEDDING_MODEL = "models/embedding-001"
+
+
+def _record(model, prompt, response, completion=""):
+    usage = getattr(response, "usage_metadata", None)
+    record_llm_usage(
+        "gemini", model, prompt, completion,
+        getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None),
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def generative_model(name):
+    """Model handles are reused across calls; genai keeps the transport pooled."""
+    return get_genai().GenerativeModel(name)
 
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
 class Gemini:
-    def get_embedding(self, text, model="models/embedding-001"):
-        result = genai.embed_content(model=model, content=text)
+    provider = "gemini"
+    embedding_model = EMBEDDING_MODEL
+
+    def get_embedding(self, text, model=EMBEDDING_MODEL):
+        result = call_with_retry(
+            lambda: get_genai().embed_content(model=model, content=text), rate_limiter, estimate_tokens(text)
+        )
+        record_llm_usage("gemini", model, text)
+        return result['embedding']
+
+    def get_embeddings(self, texts, model=EMBEDDING_MODEL):
+        texts = list(texts)
+        result = call_with_retry(
+            lambda: get_genai().embed_content(model=model, content=texts), rate_limiter, estimate_tokens(*texts)
+        )
+        record_llm_usage("gemini", model, " ".join(texts))
         return result['embedding']
 
     def get_chat_completion(self, prompt, model="gemini-1.5-flash"):
-        model = genai.GenerativeModel(model)
-        response = model.generate_content(prompt)
+        response = call_with_retry(
+            lambda: generative_model(model).generate_content(prompt), rate_limiter, estimate_tokens(prompt)
+        )
+        _record(model, prompt, response, response.text)
         return response.text
 
+    async def aget_embedding(self, text, model=EMBEDDING_MODEL):
+        result = await acall_with_retry(
+            lambda: get_genai().embed_content_async(model=model, content=text), rate_limiter, estimate_tokens(text)
+        )
+        record_llm_usage("gemini", model, text)
+        return result['embedding']
+
+    async def aget_embeddings(self, texts, model=EMBEDDING_MODEL):
+        texts = list(texts)
+        result = await acall_with_retry(
+            lambda: get_genai().embed_content_async(model=model, content=texts), rate_limiter, estimate_tokens(*texts)
+        )
+        record_llm_usage("gemini", model, " ".join(texts))
+        return result['embedding']
+
+    async def aget_chat_completion(self, prompt, model="gemini-1.5-flash"):
+        response = await acall_with_retry(
+            lambda: generative_model(model).generate_content_async(prompt), rate_limiter, estimate_tokens(prompt)
+        )
+        _record(model, prompt, response, response.text)
+        return response.text
+
+    async def astream_chat_completion(self, prompt, model="gemini-1.5-flash"):
+        # Only opening the stream is retried; once tokens flow a failure is final
+        response = await acall_with_retry(
+            lambda: generative_model(model).generate_content_async(prompt, stream=True),
+            rate_limiter, estimate_tokens(prompt),
+        )
+        tokens = []
+        try:
+            async for chunk in response:
+                # Safety-blocked and finish-only chunks have no text part, and
+                # the .text accessor raises on them
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue
+                if text:
+                    tokens.append(text)
+                    yield text
+        finally:
+            record_llm_usage("gemini", model, prompt, "".join(tokens))
+
 gemini_client = Gemini()
\ No newline at end of file
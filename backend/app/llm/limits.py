@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 4))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 20))
+
+# HTTP statuses worth retrying: timeouts, rate limits and server-side errors
+TRANSIENT_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# Exception class names raised by the OpenAI SDK / httpx / grpc for network
+# failures that carry no status code
+TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "DeadlineExceeded"}
+
+
+def estimate_tokens(*texts):
+    """Rough token count (about 4 characters per token) used to charge the token bucket."""
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at `per_minute` units per minute. Callers
+    reserve units up front and are told how long to wait, so the debt is
+    paid off in arrival order and waiters are served first come, first served.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated = None
+
+    def reserve(self, amount, now):
+        if self.updated is not None:
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+        # A single request larger than the bucket still goes through eventually
+        self.available -= min(amount, self.capacity)
+        return max(0.0, -self.available / self.rate)
+
+
+class RateLimiter:
+    """Per-provider request and token budgets. A limit of 0 disables that bucket."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    @classmethod
+    def from_env(cls, prefix):
+        return cls(
+            int(os.environ.get(f"{prefix}_REQUESTS_PER_MINUTE", 0)),
+            int(os.environ.get(f"{prefix}_TOKENS_PER_MINUTE", 0)),
+        )
+
+    def _reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.reserve(tokens, now))
+            if delay:
+                self.throttled += 1
+            return delay
+
+    def acquire(self, tokens=1):
+        delay = self._reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens=1):
+        delay = self._reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def _status(exc):
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_transient(exc):
+    return _status(exc) in TRANSIENT_STATUSES or type(exc).__name__ in TRANSIENT_ERRORS
+
+
+def backoff_delay(exc, attempt):
+    """Server-provided Retry-After when present, otherwise full-jitter exponential backoff."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        retry_after = None
+    if retry_after is not None:
+        return min(retry_after, LLM_BACKOFF_MAX)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+def call_with_retry(func, limiter, tokens=1, max_retries=LLM_MAX_RETRIES):
+    """Call `func()` within the limiter's budget, retrying transient failures."""
+    for attempt in range(max_retries + 1):
+        limiter.acquire(tokens)
+        try:
+            return func()
+        except Exception as e:
+            if attempt == max_retries or not is_transient(e):
+                raise
+            delay = backoff_delay(e, attempt)
+            logger.warning(f"Transient provider error ({str(e)}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+async def acall_with_retry(func, limiter, tokens=1, max_retries=LLM_MAX_RETRIES):
+    """Async version of `call_with_retry`; `func()` returns an awaitable."""
+    for attempt in range(max_retries + 1):
+        await limiter.aacquire(tokens)
+        try:
+            return await func()
+        except Exception as e:
+            if attempt == max_retries or not is_transient(e):
+                raise
+            delay = backoff_delay(e, attempt)
+            logger.warning(f"Transient provider error ({str(e)}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
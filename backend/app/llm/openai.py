@@ -1,25 +1,135 @@
-import openai
+import httpx
 import os
+import threading
 
-from openai import OpenAI as OpenAIClient
+from ..metrics import record_llm_usage
+from .limits import RateLimiter, call_with_retry, acall_with_retry, estimate_tokens
+
+# One pooled client per process; retries are handled by `limits`, not the SDK,
+# so they share the rate limiter's budget.
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 100))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 60))
+_pool_limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS // 5 or 1)
+
+# The SDK is slow to import, so the clients are created on first use (or at
+# warmup) rather than when the app is imported.
+client = None
+async_client = None
+_clients_lock = threading.Lock()
+
+
+def _create_clients():
+    global client, async_client
+    from openai import OpenAI as OpenAIClient, AsyncOpenAI as AsyncOpenAIClient
+
+    with _clients_lock:
+        if client is None:
+            client = OpenAIClient(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=LLM_TIMEOUT,
+                http_client=httpx.Client(limits=_pool_limits, timeout=LLM_TIMEOUT),
+            )
+        if async_client is None:
+            async_client = AsyncOpenAIClient(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=LLM_TIMEOUT,
+                http_client=httpx.AsyncClient(limits=_pool_limits, timeout=LLM_TIMEOUT),
+            )
+
+
+def get_client():
+    if client is None:
+        _create_clients()
+    return client
+
+
+def get_async_client():
+    if async_client is None:
+        _create_clients()
+    return async_client
+
+
+rate_limiter = RateLimiter.from_env("OPENAI")
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def _record(model, prompt, response, completion=""):
+    usage = getattr(response, "usage", None)
+    record_llm_usage(
+        "openai", model, prompt, completion,
+        getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None),
+    )
 
-client = OpenAIClient(api_key=os.environ.get("OPENAI_API_KEY"))
 
 class OpenAI:
-    def get_embedding(self, text, model="text-embedding-ada-002"):
-        text = text.replace("\n", " ")
-        response = client.embeddings.create(input=[text], model=model)
-        return response.data[0].embedding
+    provider = "openai"
+    embedding_model = EMBEDDING_MODEL
+
+    def get_embedding(self, text, model=EMBEDDING_MODEL):
+        return self.get_embeddings([text], model=model)[0]
+
+    def get_embeddings(self, texts, model=EMBEDDING_MODEL):
+        texts = [text.replace("\n", " ") for text in texts]
+        response = call_with_retry(
+            lambda: get_client().embeddings.create(input=texts, model=model),
+            rate_limiter, estimate_tokens(*texts),
+        )
+        _record(model, " ".join(texts), response)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
     def get_chat_completion(self, prompt, model="gpt-3.5-turbo"):
         messages = [{"role": "user", "content": prompt}]
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0,
+        response = call_with_retry(
+            lambda: get_client().chat.completions.create(model=model, messages=messages, temperature=0),
+            rate_limiter, estimate_tokens(prompt),
         )
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        _record(model, prompt, response, content)
+        return content
 
+    async def aget_embedding(self, text, model=EMBEDDING_MODEL):
+        return (await self.aget_embeddings([text], model=model))[0]
 
-openai_client = OpenAI()
+    async def aget_embeddings(self, texts, model=EMBEDDING_MODEL):
+        texts = [text.replace("\n", " ") for text in texts]
+        response = await acall_with_retry(
+            lambda: get_async_client().embeddings.create(input=texts, model=model),
+            rate_limiter, estimate_tokens(*texts),
+        )
+        _record(model, " ".join(texts), response)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
+    async def aget_chat_completion(self, prompt, model="gpt-3.5-turbo"):
+        messages = [{"role": "user", "content": prompt}]
+        response = await acall_with_retry(
+            lambda: get_async_client().chat.completions.create(model=model, messages=messages, temperature=0),
+            rate_limiter, estimate_tokens(prompt),
+        )
+        content = response.choices[0].message.content
+        _record(model, prompt, response, content)
+        return content
+
+    async def astream_chat_completion(self, prompt, model="gpt-3.5-turbo"):
+        messages = [{"role": "user", "content": prompt}]
+        # Only opening the stream is retried; once tokens flow a failure is final
+        stream = await acall_with_retry(
+            lambda: get_async_client().chat.completions.create(
+                model=model, messages=messages, temperature=0, stream=True,
+            ),
+            rate_limiter, estimate_tokens(prompt),
+        )
+        tokens = []
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    tokens.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Streams carry no usage block, so the counts are estimates
+            record_llm_usage("openai", model, prompt, "".join(tokens))
+
+
+openai_client = OpenAI()
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from .openai import openai_client
+from .gemini import gemini_client
+
+logger = logging.getLogger(__name__)
+
+# "provider:model" pairs the router may choose between, in preference order
+LLM_ROUTER_CANDIDATES = os.environ.get(
+    "LLM_ROUTER_CANDIDATES", "openai:gpt-3.5-turbo,gemini:gemini-1.5-flash"
+)
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "true").lower() == "true"
+# Hedge deadline before enough latencies have been observed to estimate p95
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", 2.0))
+LATENCY_WINDOW = 200
+# Weight of the newest observation in the moving averages
+EWMA_ALPHA = 0.2
+
+
+def parse_candidates(spec):
+    """Turn "openai:gpt-4o,gemini:gemini-1.5-flash" (or a list of those) into pairs."""
+    if isinstance(spec, str):
+        spec = spec.split(",")
+    candidates = []
+    for entry in spec:
+        provider, _, model = entry.strip().partition(":")
+        if provider and model:
+            candidates.append((provider, model))
+    return candidates
+
+
+class CandidateStats:
+    """Observed latency and error rate of one provider/model pair."""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+
+    def record(self, latency, ok):
+        self.calls += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latencies.append(latency)
+            self.latency = latency if self.latency is None else self.latency + EWMA_ALPHA * (latency - self.latency)
+
+    def p95(self):
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def score(self):
+        # Untried candidates sort first so every one gets measured
+        if self.calls == 0:
+            return 0.0
+        latency = self.latency if self.latency is not None else LLM_HEDGE_MIN_DELAY
+        return latency * (1 + 4 * self.error_rate)
+
+    def snapshot(self):
+        return {"calls": self.calls, "latency": self.latency, "p95": self.p95(), "error_rate": self.error_rate}
+
+
+class LLMRouter:
+    """
+    Chat completion client that picks between providers by observed latency
+    and error rate. A request that outlives the primary's p95 latency is
+    hedged with the next candidate and the first answer wins; failed
+    requests fail over to the remaining candidates.
+    """
+
+    provider = "router"
+
+    def __init__(self, clients, candidates=LLM_ROUTER_CANDIDATES, hedge=LLM_HEDGE_ENABLED):
+        self.clients = clients
+        self.candidates = [c for c in parse_candidates(candidates) if c[0] in clients]
+        self.hedge = hedge
+        self.stats = {}
+
+    def _stats(self, candidate):
+        return self.stats.setdefault(candidate, CandidateStats())
+
+    def rank(self, candidates=None):
+        pool = [c for c in parse_candidates(candidates) if c[0] in self.clients] if candidates else self.candidates
+        if not pool:
+            raise ValueError("No usable LLM router candidates")
+        # sorted() is stable, so ties keep the configured preference order
+        return sorted(pool, key=lambda candidate: self._stats(candidate).score())
+
+    def _hedge_delay(self, candidate):
+        return self._stats(candidate).p95() or LLM_HEDGE_MIN_DELAY
+
+    async def _call(self, candidate, prompt):
+        provider, model = candidate
+        started = time.monotonic()
+        try:
+            response = await self.clients[provider].aget_chat_completion(prompt, model=model)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._stats(candidate).record(time.monotonic() - started, ok=False)
+            raise
+        self._stats(candidate).record(time.monotonic() - started, ok=True)
+        return response
+
+    async def aget_chat_completion(self, prompt, model=None, hedge=None):
+        """`model` optionally restricts the candidates, as "provider:model" entries."""
+        hedge = self.hedge if hedge is None else hedge
+        queue = deque(self.rank(model))
+        running = {}
+        last_error = None
+
+        def launch():
+            candidate = queue.popleft()
+            running[asyncio.ensure_future(self._call(candidate, prompt))] = candidate
+
+        launch()
+        try:
+            while running:
+                primary = next(iter(running.values()))
+                timeout = self._hedge_delay(primary) if hedge and queue and len(running) == 1 else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"Hedging {primary[0]}:{primary[1]} after {timeout:.2f}s")
+                    launch()
+                    continue
+                for task in done:
+                    candidate = running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"LLM candidate {candidate[0]}:{candidate[1]} failed: {str(last_error)}")
+                if not running and queue:
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+        raise last_error
+
+    async def astream_chat_completion(self, prompt, model=None, hedge=None):
+        """
+        Streams from the best candidate. Streams are not hedged, but a
+        candidate that fails before its first token is replaced by the next.
+        """
+        last_error = None
+        for candidate in self.rank(model):
+            provider, model_name = candidate
+            started = time.monotonic()
+            first_token = False
+            try:
+                async for token in self.clients[provider].astream_chat_completion(prompt, model=model_name):
+                    if not first_token:
+                        first_token = True
+                        self._stats(candidate).record(time.monotonic() - started, ok=True)
+                    yield token
+                if not first_token:
+                    self._stats(candidate).record(time.monotonic() - started, ok=True)
+                return
+            except Exception as e:
+                if first_token:
+                    raise
+                self._stats(candidate).record(time.monotonic() - started, ok=False)
+                logger.warning(f"LLM candidate {provider}:{model_name} failed: {str(e)}")
+                last_error = e
+        raise last_error
+
+    def snapshot(self):
+        return {f"{provider}:{model}": self._stats((provider, model)).snapshot() for provider, model in self.candidates}
+
+
+llm_router = LLMRouter({"openai": openai_client, "gemini": gemini_client})
@@ -2,20 +2,43 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from fastapi import FastAPI, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from .api import api_router
-from .db import models, database, get_db
-from sqlalchemy.orm import Session
-import os
+from .db import database
+from .db.chat_logs import chat_log_writer
+from .engine.cache import response_cache
+from .engine.plans import plan_cache
+from .engine.scheduler import workflow_scheduler, PRIORITIES
+from .ingestion.jobs import ingestion_queue
+from .lifecycle import lifecycle
+from .llm.embedding_cache import embedding_cache
+from .tools.serpapi import serpapi_client
+from . import metrics
+import time
 
-if not os.environ.get("TESTING"):
-    models.Base.metadata.create_all(bind=database.engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema creation and client warmup run in the background, so the process
+    # answers liveness probes while the database is still coming up
+    lifecycle.start()
+    ingestion_queue.start()
+    yield
+    await lifecycle.stop()
+    await ingestion_queue.stop()
+    # Write out chat logs still buffered before the pool goes away
+    await chat_log_writer.close()
+    await serpapi_client.close()
+    await database.async_engine.dispose()
 
 app = FastAPI(
     title="Workflow Builder API",
     description="API for building and executing intelligent workflows",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS - Allow all origins for development
@@ -27,4 +50,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(api_router, prefix="/api", dependencies=[Depends(get_db)])
+# Routes that need a database session declare their own dependency
+app.include_router(api_router, prefix="/api")
+
+
+def route_template(scope):
+    """Request path with path parameters put back as {name}, to keep label sets bounded."""
+    if scope.get("route") is None:
+        return "unmatched"
+    names = {str(value): name for name, value in (scope.get("path_params") or {}).items()}
+    return "/".join(f"{{{names[part]}}}" if part in names else part for part in scope["path"].split("/"))
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    metrics.http_requests_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.http_requests_in_flight.dec()
+        metrics.http_request_seconds.labels(
+            method=request.method, route=route_template(request.scope), status=status
+        ).observe(time.perf_counter() - start)
+
+
+def collect_app_stats():
+    """Metrics read from the counters kept by the caches and queues."""
+    cache_lookups, cache_hit_ratio, queue_depth, runs_in_flight = metrics.stats_families()
+    response = response_cache.stats()
+    for result in ("exact_hits", "semantic_hits", "misses"):
+        cache_lookups.add_metric(["response", result], response[result])
+    cache_hit_ratio.add_metric(["response"], response["hit_rate"])
+    for name, cache in (("plan", plan_cache), ("embedding", embedding_cache)):
+        cache_lookups.add_metric([name, "hits"], cache.hits)
+        cache_lookups.add_metric([name, "misses"], cache.misses)
+        lookups = cache.hits + cache.misses
+        cache_hit_ratio.add_metric([name], cache.hits / lookups if lookups else 0.0)
+    web = serpapi_client.stats()
+    for result in ("hits", "misses", "coalesced"):
+        cache_lookups.add_metric(["web_search", result], web[result])
+    lookups = web["hits"] + web["misses"] + web["coalesced"]
+    cache_hit_ratio.add_metric(["web_search"], (web["hits"] + web["coalesced"]) / lookups if lookups else 0.0)
+    queue_depth.add_metric(["chat_logs"], chat_log_writer.pending)
+    queue_depth.add_metric(["ingestion_jobs"], ingestion_queue.active_jobs)
+    for priority in PRIORITIES:
+        queue_depth.add_metric([f"workflow_{priority}"], workflow_scheduler.queued(priority))
+        runs_in_flight.add_metric([priority], workflow_scheduler.running[priority])
+    return [cache_lookups, cache_hit_ratio, queue_depth, runs_in_flight]
+
+
+metrics.add_collector(collect_app_stats)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    """Liveness probe: the event loop is serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    """Readiness probe: 503 until the database and vector store are usable"""
+    ready, checks = await lifecycle.readiness()
+    return JSONResponse(
+        {"status": "ready" if ready else "starting", "checks": checks}, status_code=200 if ready else 503
+    )
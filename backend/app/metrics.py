@@ -0,0 +1,127 @@
+"""
+Prometheus metrics for /metrics, kept with prometheus_client in its default
+registry, and OpenTelemetry spans when the opentelemetry API is installed.
+Without an SDK configured the spans are no-ops.
+"""
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, disable_created_metrics
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .llm.limits import estimate_tokens
+
+try:
+    from opentelemetry import trace
+except ImportError:  # tracing is optional
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+# Skip the *_created series that would double the number of counter and histogram series
+disable_created_metrics()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# USD per 1000 prompt and completion tokens; LLM_PRICES (JSON) adds or overrides models
+LLM_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4": (0.03, 0.06),
+    "gemini-1.5-flash": (0.000075, 0.0003),
+    "gemini-1.5-pro": (0.00125, 0.005),
+    "text-embedding-ada-002": (0.0001, 0.0),
+}
+LLM_PRICES.update({model: tuple(price) for model, price in json.loads(os.environ.get("LLM_PRICES") or "{}").items()})
+
+
+class _ScrapeCollector:
+    """Builds metric families on each scrape from stats kept elsewhere (caches, queues)."""
+
+    def __init__(self, collect):
+        self._collect = collect
+
+    def describe(self):
+        # Nothing to check for name clashes, and collect() must not run at registration
+        return []
+
+    def collect(self):
+        try:
+            return list(self._collect())
+        except Exception as e:
+            logger.error(f"Error collecting metrics: {str(e)}")
+            return []
+
+
+def add_collector(collect, registry=REGISTRY):
+    """Call collect() on each scrape; it returns metric families such as those of stats_families()."""
+    registry.register(_ScrapeCollector(collect))
+
+
+def stats_families():
+    """Empty families for the metrics read at scrape time: lookups, hit ratio, queue depth, runs in flight."""
+    return (
+        CounterMetricFamily("cache_lookups", "Cache lookups by cache and result", labels=["cache", "result"]),
+        GaugeMetricFamily("cache_hit_ratio", "Share of cache lookups that were hits", labels=["cache"]),
+        GaugeMetricFamily("queue_depth", "Items waiting in in-process queues", labels=["queue"]),
+        GaugeMetricFamily(
+            "workflow_runs_in_flight", "Workflow runs holding an execution slot", labels=["priority"]
+        ),
+    )
+
+
+stage_seconds = Histogram(
+    "workflow_stage_seconds", "Time spent per workflow component and storage stage", ["stage"],
+    buckets=DEFAULT_BUCKETS,
+)
+workflow_seconds = Histogram("workflow_run_seconds", "End-to-end workflow execution time", buckets=DEFAULT_BUCKETS)
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled")
+http_request_seconds = Histogram(
+    "http_request_seconds", "Request handling time until the response starts", ["method", "route", "status"],
+    buckets=DEFAULT_BUCKETS,
+)
+llm_tokens = Counter("llm_tokens_total", "Prompt and completion tokens per model", ["provider", "model", "type"])
+llm_cost = Counter("llm_cost_usd_total", "Estimated spend per model in USD, from LLM_PRICES", ["provider", "model"])
+workflow_queue_wait = Histogram(
+    "workflow_queue_wait_seconds", "Time workflow runs waited for an execution slot", ["priority"],
+    buckets=DEFAULT_BUCKETS,
+)
+workflow_rejections = Counter(
+    "workflow_rejections_total", "Workflow runs turned away by admission control", ["priority", "reason"]
+)
+
+
+def _tokens(count, *texts):
+    # SDK usage fields when present, otherwise the rate limiter's estimate
+    return count if isinstance(count, int) else estimate_tokens(*texts)
+
+
+def record_llm_usage(provider, model, prompt, completion="", prompt_tokens=None, completion_tokens=None):
+    """Count tokens and estimated cost of one LLM or embedding call."""
+    prompt_count = _tokens(prompt_tokens, prompt)
+    completion_count = _tokens(completion_tokens, completion) if completion else 0
+    llm_tokens.labels(provider=provider, model=model, type="prompt").inc(prompt_count)
+    if completion_count:
+        llm_tokens.labels(provider=provider, model=model, type="completion").inc(completion_count)
+    prompt_price, completion_price = LLM_PRICES.get(model, (0.0, 0.0))
+    cost = (prompt_count * prompt_price + completion_count * completion_price) / 1000
+    if cost:
+        llm_cost.labels(provider=provider, model=model).inc(cost)
+
+
+@contextmanager
+def span(name, **attributes):
+    """An OpenTelemetry span when tracing is available, otherwise nothing."""
+    if trace is None:
+        yield None
+        return
+    with trace.get_tracer(__name__).start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+@contextmanager
+def stage(name, **attributes):
+    """Time a stage into workflow_stage_seconds and wrap it in a span."""
+    with span(name, **attributes), stage_seconds.labels(stage=name).time():
+        yield
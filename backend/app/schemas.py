@@ -1,10 +1,44 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
+from datetime import datetime
+
+# Scheduling class of a run: interactive runs are served before background ones
+Priority = Literal["interactive", "background"]
 
 class Document(BaseModel):
     id: int
     name: str
+    document_key: Optional[str] = None
+    knowledge_base: Optional[str] = None
+    content_hash: Optional[str] = None
+    version: Optional[int] = None
     meta_data: Dict
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class KnowledgeBase(BaseModel):
+    name: str
+    documents: int
+    chunks: int
+
+class IngestionFile(BaseModel):
+    filename: str
+    status: str
+    pages: Optional[int] = None
+    chunks: Optional[int] = None
+    error: Optional[str] = None
+
+class IngestionJob(BaseModel):
+    id: str
+    status: str
+    embedding_provider: Optional[str] = None
+    knowledge_base: Optional[str] = None
+    files: List[IngestionFile] = Field(default_factory=list)
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -14,20 +48,68 @@ class WorkflowComponent(BaseModel):
     type: str
     config: Dict = Field(default_factory=dict)
 
+class WorkflowEdge(BaseModel):
+    source: str
+    target: str
+
 class Workflow(BaseModel):
     id: Optional[int] = None
     name: Optional[str] = "Untitled Workflow"
     definition: List[WorkflowComponent]
+    edges: List[WorkflowEdge] = Field(default_factory=list)
     query: str
+    use_cache: bool = True
+    session_id: Optional[str] = None
+    priority: Priority = "interactive"
+    # Seconds the caller is willing to wait for an execution slot
+    deadline: Optional[float] = Field(default=None, gt=0)
+
+    class Config:
+        from_attributes = True
+
+class WorkflowCreate(BaseModel):
+    name: Optional[str] = "Untitled Workflow"
+    definition: List[WorkflowComponent]
+    edges: List[WorkflowEdge] = Field(default_factory=list)
+    layout: Optional[Dict] = None
+
+class WorkflowRecord(WorkflowCreate):
+    id: int
+    edges: Optional[List[WorkflowEdge]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class WorkflowRunRequest(BaseModel):
+    query: str
+    use_cache: bool = True
+    session_id: Optional[str] = None
+    priority: Priority = "interactive"
+    deadline: Optional[float] = Field(default=None, gt=0)
+
+class WorkflowBatch(BaseModel):
+    id: Optional[int] = None
+    definition: List[WorkflowComponent]
+    edges: List[WorkflowEdge] = Field(default_factory=list)
+    queries: List[str]
+    concurrency: Optional[int] = None
+    use_cache: bool = True
+    priority: Priority = "background"
+
 class ChatLog(BaseModel):
     id: int
-    workflow_id: int
+    workflow_id: Optional[int] = None
+    session_id: Optional[str] = None
     query: str
     response: str
+    created_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatLog]
+    # Pass as `before` to fetch the next (older) page; None on the last page
+    next_cursor: Optional[int] = None
@@ -1,17 +1,143 @@
-from serpapi import GoogleSearch
+import asyncio
+import httpx
+import json
+import logging
 import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SERPAPI_URL = os.environ.get("SERPAPI_URL", "https://serpapi.com/search.json")
+SERPAPI_TIMEOUT = float(os.environ.get("SERPAPI_TIMEOUT", 20))
+# Searches are billed per call, so repeated queries are served from memory
+SERPAPI_CACHE_SIZE = int(os.environ.get("SERPAPI_CACHE_SIZE", 1024))
+SERPAPI_CACHE_TTL = float(os.environ.get("SERPAPI_CACHE_TTL", 3600))
+
+SERPAPI_MAX_CONNECTIONS = int(os.environ.get("SERPAPI_MAX_CONNECTIONS", 20))
+
+# Created on first use, and again after close(), so a later lifespan in the
+# same process (reloads, repeated test clients) gets a fresh pool
+http_client = None
+
+
+def get_http_client():
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=SERPAPI_TIMEOUT, limits=httpx.Limits(max_connections=SERPAPI_MAX_CONNECTIONS)
+        )
+    return http_client
+
+
+def search_key(query, params):
+    """Cache key: the normalized query plus any other search parameters."""
+    normalized = " ".join(query.lower().split())
+    return json.dumps([normalized, params], sort_keys=True)
+
+
+def merge_results(results):
+    """
+    Interleave the organic results of several searches rank by rank, keeping
+    the first occurrence of each link.
+    """
+    lists = [result.get("organic_results") or [] for result in results]
+    merged = []
+    seen = set()
+    for rank in range(max((len(items) for items in lists), default=0)):
+        for items in lists:
+            if rank < len(items):
+                item = items[rank]
+                link = item.get("link") or item.get("snippet")
+                if link not in seen:
+                    seen.add(link)
+                    merged.append(item)
+    return merged
+
 
 class SerpAPI:
-    def __init__(self):
+    def __init__(self, max_entries=SERPAPI_CACHE_SIZE, ttl=SERPAPI_CACHE_TTL):
         self.api_key = os.environ.get("SERPAPI_API_KEY")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def fetch(self, params):
+        """One billed call to the SerpAPI JSON endpoint."""
+        response = await get_http_client().get(
+            SERPAPI_URL, params={"engine": "google", **params, "api_key": self.api_key}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def asearch(self, query, **params):
+        """
+        Search results for a query, from the TTL cache when possible. Concurrent
+        identical searches share one in-flight call.
+        """
+        key = search_key(query, params)
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch_and_store(key, {"q": query, **params}))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # A cancelled caller must not cancel the call other callers are waiting on
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        # Mark the error as seen even if every caller went away
+        if not task.cancelled():
+            task.exception()
 
-    def search(self, query):
-        params = {
-            "api_key": self.api_key,
-            "q": query,
-        }
-        search = GoogleSearch(params)
-        results = search.get_dict()
+    async def _fetch_and_store(self, key, params):
+        results = await self.fetch(params)
+        self._cache[key] = (time.monotonic() + self.ttl, results)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
         return results
 
+    async def asearch_many(self, queries, **params):
+        """
+        Run several formulations of a query at once and merge their organic
+        results. Failed searches are skipped unless all of them fail.
+        """
+        results = await asyncio.gather(*(self.asearch(query, **params) for query in queries), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        for error in errors:
+            logger.warning(f"One of {len(queries)} web searches failed: {str(error)}")
+        return merge_results([result for result in results if not isinstance(result, BaseException)])
+
+    async def close(self):
+        """Close the pooled connections; called on shutdown."""
+        global http_client
+        client, http_client = http_client, None
+        if client is not None:
+            await client.aclose()
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = self.coalesced = 0
+
+    def stats(self):
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
 serpapi_client = SerpAPI()
@@ -0,0 +1,113 @@
+import os
+import re
+
+# "chroma" (default) or "numpy" for the in-process memory-mapped index
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+
+COLLECTION_PREFIX = "documents"
+# Damping constant of reciprocal rank fusion
+RRF_K = int(os.environ.get("RRF_K", 60))
+
+# Uploads and knowledge_base components that name no knowledge base use this one
+DEFAULT_KNOWLEDGE_BASE = "default"
+_KNOWLEDGE_BASE_NAME = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9_-]{0,62}$")
+
+
+def validate_knowledge_base(name):
+    """Return the name if it can be used in collection and file names, else raise ValueError."""
+    if not isinstance(name, str) or not _KNOWLEDGE_BASE_NAME.match(name):
+        raise ValueError(
+            f"Invalid knowledge base name {name!r}: use up to 63 letters, digits, '-' or '_'"
+        )
+    return name
+
+
+def knowledge_base_names(value):
+    """
+    Knowledge bases named by a component config or request: a list, or a
+    comma-separated string as the builder's text field sends it.
+    """
+    if isinstance(value, str):
+        value = value.split(",")
+    names = [name.strip() for name in value or [] if name and name.strip()]
+    return [validate_knowledge_base(name) for name in dict.fromkeys(names)] or [DEFAULT_KNOWLEDGE_BASE]
+
+
+def collection_name(provider, model, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+    """
+    Collection holding vectors from one embedding provider/model in one
+    knowledge base. The default knowledge base keeps the unprefixed names.
+    """
+    if knowledge_base == DEFAULT_KNOWLEDGE_BASE:
+        name = f"{COLLECTION_PREFIX}__{provider}__{model}"
+    else:
+        name = f"{COLLECTION_PREFIX}__kb-{knowledge_base}__{provider}__{model}"
+    return re.sub(r"[^a-zA-Z0-9._-]", "-", name)[:512]
+
+
+def collection_in_knowledge_bases(name, knowledge_bases):
+    """
+    Whether a name from `collection_name` can belong to one of the knowledge
+    bases (any if None), so other knowledge bases' collections aren't opened.
+    """
+    if knowledge_bases is None:
+        return True
+    for knowledge_base in knowledge_bases:
+        if knowledge_base == DEFAULT_KNOWLEDGE_BASE:
+            if not name.startswith(f"{COLLECTION_PREFIX}__kb-"):
+                return True
+        elif name.startswith(f"{COLLECTION_PREFIX}__kb-{knowledge_base}__"):
+            return True
+    return False
+
+
+def where_to_sql(where, column="metadata"):
+    """Translate the equality subset of Chroma's `where` syntax to SQL."""
+    clauses, params = [], []
+    for key, value in where.items():
+        if key == "$and":
+            for part in value:
+                sql, part_params = where_to_sql(part, column)
+                clauses.append(sql)
+                params.extend(part_params)
+            continue
+        if isinstance(value, dict):
+            if set(value) == {"$eq"}:
+                value = value["$eq"]
+            elif set(value) == {"$in"}:
+                clauses.append(f"json_extract({column}, ?) IN ({','.join('?' * len(value['$in']))})")
+                params.extend([f"$.{key}", *value["$in"]])
+                continue
+            else:
+                raise ValueError(f"Unsupported filter operator for {key}: {list(value)}")
+        clauses.append(f"json_extract({column}, ?) = ?")
+        params.extend([f"$.{key}", value])
+    return " AND ".join(clauses) or "1", params
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked hit lists by summing 1 / (k + rank); the fused score is kept on each hit."""
+    fused, scores = {}, {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (k + rank + 1)
+            # Keep the first copy seen, so dense hits retain their distance
+            fused.setdefault(hit["id"], dict(hit))
+    for id, hit in fused.items():
+        hit["score"] = scores[id]
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)
+
+
+def create_vector_store(kind=VECTOR_STORE):
+    """
+    Both backends expose collection(provider, model, knowledge_base),
+    collections(knowledge_bases) and acollections(knowledge_bases); their
+    collections share the same add/upsert/get/query API.
+    """
+    if kind == "numpy":
+        from .numpy_store import NumpyStore
+        return NumpyStore()
+    if kind == "chroma":
+        from .chroma import chroma_db
+        return chroma_db
+    raise ValueError(f"Unknown VECTOR_STORE: {kind}")
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from ..concurrency import run_blocking
+from ..metrics import stage
+from .backend import DEFAULT_KNOWLEDGE_BASE, reciprocal_rank_fusion, validate_knowledge_base, where_to_sql
+
+# Set to an empty string to disable keyword search.
+BM25_INDEX_PATH = os.environ.get(
+    "BM25_INDEX_PATH",
+    os.path.join(os.environ.get("CHROMA_PERSIST_DIRECTORY", "./chroma_data"), "bm25.sqlite3"),
+)
+
+_TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what "
+    "when where which who why how with".split()
+)
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Incremental inverted index scored with Okapi BM25. Postings, document
+    frequencies and corpus totals are kept in SQLite and updated as chunks are
+    added or removed, so nothing is rebuilt on ingest. Each knowledge base is
+    a separate shard with its own file and statistics; this index is the
+    default knowledge base's shard.
+    """
+
+    def __init__(self, path=BM25_INDEX_PATH, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def shard(self, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        """The index of one knowledge base, stored next to this one as <name>.<knowledge base>.sqlite3."""
+        if knowledge_base == DEFAULT_KNOWLEDGE_BASE or not self.enabled:
+            return self
+        with self._shards_lock:
+            if knowledge_base not in self._shards:
+                root, ext = os.path.splitext(self.path)
+                self._shards[knowledge_base] = BM25Index(f"{root}.{knowledge_base}{ext}", self.k1, self.b)
+            return self._shards[knowledge_base]
+
+    def knowledge_bases(self):
+        """The default knowledge base plus every one with a shard on disk."""
+        names = [DEFAULT_KNOWLEDGE_BASE]
+        directory = os.path.dirname(self.path) or "."
+        root, ext = os.path.splitext(os.path.basename(self.path))
+        if not self.enabled or not os.path.isdir(directory):
+            return names
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith(f"{root}.") and filename.endswith(ext) and filename != f"{root}{ext}":
+                try:
+                    names.append(validate_knowledge_base(filename[len(root) + 1:len(filename) - len(ext)]))
+                except ValueError:
+                    continue
+        return names
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL, text TEXT, metadata TEXT);"
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_id));"
+                "CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);"
+                "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " chunks INTEGER NOT NULL, length INTEGER NOT NULL);"
+                "INSERT OR IGNORE INTO totals VALUES (0, 0, 0);"
+            )
+            self._local.conn = conn
+        return conn
+
+    def add(self, ids, texts, metadatas):
+        """Index chunks, replacing any already indexed under the same ids."""
+        if not self.enabled:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._delete(conn, ids)
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    counts = Counter(tokenize(text))
+                    length = sum(counts.values())
+                    conn.execute(
+                        "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                        (chunk_id, length, text, json.dumps(metadata or {})),
+                    )
+                    conn.executemany(
+                        "INSERT INTO postings VALUES (?, ?, ?)",
+                        [(term, chunk_id, tf) for term, tf in counts.items()],
+                    )
+                    conn.executemany(
+                        "INSERT INTO terms VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                        [(term,) for term in counts],
+                    )
+                    conn.execute(
+                        "UPDATE totals SET chunks = chunks + 1, length = length + ? WHERE id = 0", (length,)
+                    )
+
+    def delete(self, ids):
+        if not self.enabled:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._delete(conn, ids)
+
+    def _delete(self, conn, ids):
+        for chunk_id in ids:
+            row = conn.execute("SELECT length FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            terms = [term for (term,) in conn.execute("SELECT term FROM postings WHERE chunk_id = ?", (chunk_id,))]
+            conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(term,) for term in terms])
+            conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+            conn.execute("UPDATE totals SET chunks = chunks - 1, length = length - ? WHERE id = 0", (row[0],))
+
+    def search(self, queries, n_results=10, where=None):
+        """Return a list of hits per query, best first, each with its BM25 `score`."""
+        if not self.enabled:
+            return [[] for _ in queries]
+        conn = self._conn()
+        total_chunks, total_length = conn.execute("SELECT chunks, length FROM totals WHERE id = 0").fetchone()
+        if not total_chunks:
+            return [[] for _ in queries]
+        avg_length = total_length / total_chunks
+
+        filter_sql, filter_params = where_to_sql(where, "c.metadata") if where else ("1", [])
+        results = []
+        for query in queries:
+            scores = Counter()
+            for term in set(tokenize(query)):
+                row = conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row is None or row[0] <= 0:
+                    continue
+                idf = math.log(1 + (total_chunks - row[0] + 0.5) / (row[0] + 0.5))
+                for chunk_id, tf, length in conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id"
+                    f" WHERE p.term = ? AND {filter_sql}",
+                    [term, *filter_params],
+                ):
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            results.append(self._hits(conn, scores.most_common(n_results)))
+        return results
+
+    def _hits(self, conn, ranked):
+        if not ranked:
+            return []
+        rows = {
+            chunk_id: (text, json.loads(metadata))
+            for chunk_id, text, metadata in conn.execute(
+                f"SELECT chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(ranked))})",
+                [chunk_id for chunk_id, _ in ranked],
+            )
+        }
+        return [
+            {"id": chunk_id, "text": rows[chunk_id][0], "metadata": rows[chunk_id][1], "score": score}
+            for chunk_id, score in ranked
+        ]
+
+    async def asearch(self, queries, n_results=10, where=None, knowledge_bases=None):
+        """
+        Search the shards of the given knowledge bases (all of them by
+        default) in parallel and keep the best `n_results` hits per query.
+        Each shard scores with its own corpus statistics, so scores from
+        different shards aren't comparable; their rankings are fused by rank
+        instead, and the fused score replaces the BM25 score.
+        """
+        if knowledge_bases is None:
+            knowledge_bases = await run_blocking(self.knowledge_bases)
+        # A knowledge base nothing was uploaded to has no shard to search
+        shards = [
+            shard for shard in map(self.shard, knowledge_bases)
+            if shard is self or os.path.exists(shard.path)
+        ]
+        with stage("keyword_search"):
+            rankings = await asyncio.gather(*(
+                run_blocking(shard.search, queries, n_results, where) for shard in shards
+            ))
+        if len(rankings) == 1:
+            return rankings[0]
+        return [
+            reciprocal_rank_fusion([ranking[index] for ranking in rankings])[:n_results]
+            for index in range(len(queries))
+        ]
+
+
+bm25_index = BM25Index()
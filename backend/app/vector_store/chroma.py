@@ -1,32 +1,168 @@
-import chromadb
 import os
+import threading
+import time
+
+from ..concurrency import run_blocking
+from .backend import COLLECTION_PREFIX, DEFAULT_KNOWLEDGE_BASE, collection_in_knowledge_bases, collection_name
+
+# Seconds the list of collections is reused before asking Chroma again, which
+# is how collections created by other workers show up; 0 lists on every search
+CHROMA_COLLECTIONS_TTL = float(os.environ.get("CHROMA_COLLECTIONS_TTL", 30))
+
+
+class ChromaCollection:
+    """A knowledge base's collection, whose vectors all come from the same embedding model."""
+
+    def __init__(self, collection, provider, model, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        self.collection = collection
+        self.provider = provider
+        self.model = model
+        self.knowledge_base = knowledge_base
+
+    def add_documents(self, documents, metadatas, ids, embeddings):
+        self.collection.add(
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+    def upsert_documents(self, documents, metadatas, ids, embeddings):
+        self.collection.upsert(
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+    def delete_documents(self, ids):
+        self.collection.delete(ids=ids)
+
+    def get_documents(self, ids):
+        """Ids and metadatas of the given ids that exist in the collection."""
+        return self.collection.get(ids=ids, include=["metadatas"])
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where or None,
+            include=["documents", "metadatas", "distances"]
+        )
+
+    def count(self):
+        return self.collection.count()
+
 
 class ChromaDB:
+    """
+    Persistent Chroma client with one collection per knowledge base and
+    embedding model, so a search only touches the knowledge bases it names. Chroma's
+    own embedding function is never used: callers always pass vectors, so
+    queries are embedded with the model the collection was built with.
+    """
+
     def __init__(self):
-        # Use persistent storage
-        persist_directory = os.environ.get("CHROMA_PERSIST_DIRECTORY", "./chroma_data")
-        self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.client.get_or_create_collection("documents")
-
-    def add_documents(self, documents, metadatas, ids, embeddings=None):
-        if embeddings:
-            self.collection.add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-        else:
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+        self.persist_directory = os.environ.get("CHROMA_PERSIST_DIRECTORY", "./chroma_data")
+        self._client = None
+        self._lock = threading.Lock()
+        self._collections = {}
+        # Handles by collection name, None for collections that aren't ours
+        self._handles = {}
+        # (monotonic time listed, collection names)
+        self._names = None
+
+    @property
+    def client(self):
+        """The persistent client, opened on first use: chromadb is slow to import."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+
+                    self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        # e.g. an in-memory client
+        self._client = client
+
+    def collection(self, provider, model, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        key = (provider, model, knowledge_base)
+        if key not in self._collections:
+            name = collection_name(provider, model, knowledge_base)
+            collection = self.client.get_or_create_collection(
+                name,
+                embedding_function=None,
+                metadata={
+                    "embedding_provider": provider,
+                    "embedding_model": model,
+                    "knowledge_base": knowledge_base,
+                    "hnsw:space": "cosine",
+                },
             )
+            self._collections[key] = ChromaCollection(collection, provider, model, knowledge_base)
+            self._handles[name] = self._collections[key]
+            names = self._names
+            if names is not None:
+                self._names = (names[0], names[1] | {name})
+        return self._collections[key]
 
-    def query(self, query_texts, n_results=10):
-        return self.collection.query(
-            query_texts=query_texts,
-            n_results=n_results
-        )
+    def delete_collection(self, provider, model, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        name = collection_name(provider, model, knowledge_base)
+        self.client.delete_collection(name)
+        self._forget(name)
+
+    def collections(self, knowledge_bases=None):
+        """
+        Every collection created through `collection()`, including other
+        workers', optionally only those of the given knowledge bases. Handles
+        are opened once and reused by later searches.
+        """
+        found = []
+        for name in sorted(self._collection_names()):
+            if not name.startswith(f"{COLLECTION_PREFIX}__"):
+                continue
+            # Names encode the knowledge base, so other knowledge bases' collections aren't even opened
+            if not collection_in_knowledge_bases(name, knowledge_bases):
+                continue
+            if name not in self._handles:
+                self._handles[name] = self._open(name)
+            handle = self._handles[name]
+            if handle is not None and (knowledge_bases is None or handle.knowledge_base in knowledge_bases):
+                found.append(handle)
+        return found
+
+    def _open(self, name):
+        collection = self.client.get_collection(name, embedding_function=None)
+        metadata = collection.metadata or {}
+        if "embedding_provider" not in metadata or "embedding_model" not in metadata:
+            return None
+        # Collections from before knowledge bases existed belong to the default one
+        knowledge_base = metadata.get("knowledge_base", DEFAULT_KNOWLEDGE_BASE)
+        return self.collection(metadata["embedding_provider"], metadata["embedding_model"], knowledge_base)
+
+    def _collection_names(self):
+        names = self._names
+        if names is None or time.monotonic() - names[0] >= CHROMA_COLLECTIONS_TTL:
+            # Depending on the Chroma version entries are Collections or just names
+            listed = {getattr(entry, "name", entry) for entry in self.client.list_collections()}
+            # Collections another worker deleted
+            for name in set(self._handles) - listed:
+                self._forget(name)
+            names = self._names = (time.monotonic(), listed)
+        return names[1]
+
+    def _forget(self, name):
+        handle = self._handles.pop(name, None)
+        if handle is not None:
+            self._collections.pop((handle.provider, handle.model, handle.knowledge_base), None)
+        names = self._names
+        if names is not None:
+            self._names = (names[0], names[1] - {name})
+
+    async def acollections(self, knowledge_bases=None):
+        return await run_blocking(self.collections, knowledge_bases)
 
 chroma_db = ChromaDB()
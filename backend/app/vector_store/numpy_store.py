@@ -0,0 +1,436 @@
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from ..concurrency import run_blocking
+from .backend import DEFAULT_KNOWLEDGE_BASE, collection_in_knowledge_bases, collection_name, where_to_sql
+
+logger = logging.getLogger(__name__)
+
+NUMPY_STORE_PATH = os.environ.get("NUMPY_STORE_PATH", "./vector_data")
+# Number of IVF lists to build per collection; 0 keeps exact brute-force search.
+NUMPY_INDEX_LISTS = int(os.environ.get("NUMPY_INDEX_LISTS", 0))
+NUMPY_INDEX_PROBES = int(os.environ.get("NUMPY_INDEX_PROBES", 8))
+# Rewrite the vector file once this fraction of rows are tombstones.
+NUMPY_COMPACT_RATIO = float(os.environ.get("NUMPY_COMPACT_RATIO", 0.2))
+
+
+class StaleState(Exception):
+    """A compaction renumbered the rows while a read was using the previous numbering."""
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyCollection:
+    """
+    Vectors for one embedding model in an append-only float32 file that is
+    memory-mapped for search, so every worker process shares the same pages.
+    Ids, documents and metadata live in SQLite; replaced and deleted rows are
+    tombstoned there and dropped from the vector file by `compact()`.
+
+    Compaction renumbers rows, so the manifest and SQLite both carry a
+    generation. Compaction writes the new vector file next to the old one,
+    then renumbers the rows and bumps the generation in one transaction, and
+    only then swaps the manifest. Reads check the generation inside the
+    same SQLite snapshot and retry against the new state if it moved.
+    """
+
+    def __init__(self, path, provider, model, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        self.path = path
+        self.provider = provider
+        self.model = model
+        self.knowledge_base = knowledge_base
+        os.makedirs(path, exist_ok=True)
+        self._manifest_path = os.path.join(path, "manifest.json")
+        self._index_path = os.path.join(path, "ivf.npz")
+        self._db_path = os.path.join(path, "rows.sqlite3")
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._state = None
+        self._state_version = None
+
+        with self._write_lock():
+            if not os.path.exists(self._manifest_path):
+                self._write_manifest({
+                    "provider": provider, "model": model, "knowledge_base": knowledge_base,
+                    "dim": None, "rows": 0, "index_rows": 0, "generation": 0,
+                })
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " row INTEGER PRIMARY KEY, id TEXT NOT NULL, document TEXT,"
+                " metadata TEXT, deleted INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS rows_live_id ON rows (id) WHERE deleted = 0")
+            conn.execute("CREATE TABLE IF NOT EXISTS generation (value INTEGER NOT NULL)")
+            if conn.execute("SELECT COUNT(*) FROM generation").fetchone()[0] == 0:
+                conn.execute("INSERT INTO generation (value) VALUES (?)", (self._read_manifest().get("generation", 0),))
+            conn.commit()
+
+    # -- storage helpers -------------------------------------------------
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across threads and worker processes."""
+        with self._lock, open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self):
+        with open(self._manifest_path) as f:
+            return json.load(f)
+
+    def _vectors_path(self, manifest):
+        # Collections created before generations existed keep their original file
+        generation = manifest.get("generation", 0)
+        return os.path.join(self.path, f"vectors.{generation}.f32" if generation else "vectors.f32")
+
+    def _snapshot(self, generation, sql, params=()):
+        """Rows of a query, read in one snapshot that must still be at `generation`."""
+        conn = self._conn()
+        owned = not conn.in_transaction
+        if owned:
+            conn.execute("BEGIN")
+        try:
+            (current,) = conn.execute("SELECT value FROM generation").fetchone()
+            if current != generation:
+                raise StaleState()
+            return conn.execute(sql, params).fetchall()
+        finally:
+            if owned:
+                conn.execute("COMMIT")
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _load(self):
+        """Memory-map the current vectors, reloading after another writer commits."""
+        while True:
+            try:
+                return self._try_load()
+            except StaleState:
+                # A compaction committed its rows but has not swapped the manifest yet
+                time.sleep(0.01)
+
+    def _try_load(self):
+        stat = os.stat(self._manifest_path)
+        # The manifest is always replaced atomically, so a new inode means new data
+        version = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if self._state is not None and self._state_version == version:
+                return self._state
+
+            manifest = self._read_manifest()
+            rows, dim = manifest["rows"], manifest["dim"]
+            matrix = None
+            if rows and dim:
+                # Mapped before the generation check: once open, a compaction removing the file can't affect it
+                try:
+                    matrix = np.memmap(self._vectors_path(manifest), dtype=np.float32, mode="r", shape=(rows, dim))
+                except FileNotFoundError:
+                    raise StaleState()
+            live = np.zeros(rows, dtype=bool)
+            # Rows past the manifest belong to a write that has not finished yet
+            live_rows = [
+                row for (row,) in self._snapshot(manifest.get("generation", 0), "SELECT row FROM rows WHERE deleted = 0")
+                if row < rows
+            ]
+            live[live_rows] = True
+
+            index = None
+            if manifest.get("index_rows") and os.path.exists(self._index_path):
+                with np.load(self._index_path) as data:
+                    index = {key: data[key] for key in data.files}
+
+            self._state = {"manifest": manifest, "matrix": matrix, "live": live, "index": index}
+            self._state_version = version
+            return self._state
+
+    # -- writes ----------------------------------------------------------
+
+    def add_documents(self, documents, metadatas, ids, embeddings):
+        self.upsert_documents(documents, metadatas, ids, embeddings)
+
+    def upsert_documents(self, documents, metadatas, ids, embeddings):
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate ids in one upsert")
+        vectors = _normalize(embeddings)
+        rows = [(id, document, json.dumps(metadata or {})) for id, document, metadata in zip(ids, documents, metadatas)]
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest["dim"] is None:
+                manifest["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != manifest["dim"]:
+                raise ValueError(f"Expected {manifest['dim']}-dimensional embeddings, got {vectors.shape[1]}")
+
+            conn = self._conn()
+            start = manifest["rows"]
+            try:
+                # Rows past the manifest are left over from a write that failed after committing
+                conn.execute("DELETE FROM rows WHERE row >= ?", (start,))
+                conn.executemany("UPDATE rows SET deleted = 1 WHERE id = ? AND deleted = 0", [(id,) for id in ids])
+                conn.executemany(
+                    "INSERT INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(start + offset, *row) for offset, row in enumerate(rows)],
+                )
+                self._write_vectors(manifest, start, vectors)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            manifest["rows"] = start + len(ids)
+            self._write_manifest(manifest)
+        self._maintain()
+
+    def _write_vectors(self, manifest, start, vectors):
+        """Write vectors as rows `start` onwards, dropping whatever a failed write left past them."""
+        path = self._vectors_path(manifest)
+        offset = start * manifest["dim"] * vectors.itemsize
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(vectors.tobytes())
+
+    def delete_documents(self, ids):
+        with self._write_lock():
+            conn = self._conn()
+            conn.executemany("UPDATE rows SET deleted = 1 WHERE id = ? AND deleted = 0", [(id,) for id in ids])
+            conn.commit()
+            # Bump the manifest so readers reload the live-row mask
+            self._write_manifest(self._read_manifest())
+        self._maintain()
+
+    def _maintain(self):
+        manifest = self._read_manifest()
+        rows = manifest["rows"]
+        if not rows:
+            return
+        (live,) = self._conn().execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()
+        if (rows - live) / rows >= NUMPY_COMPACT_RATIO:
+            self.compact()
+        elif NUMPY_INDEX_LISTS and live >= NUMPY_INDEX_LISTS * 10:
+            indexed = manifest.get("index_rows", 0)
+            if rows - indexed > max(indexed, 1) * 0.1:
+                self.build_index(NUMPY_INDEX_LISTS)
+
+    def compact(self):
+        """Drop tombstoned rows from the vector file and renumber the rest."""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            old_path = self._vectors_path(manifest)
+            compacted = dict(manifest, generation=manifest.get("generation", 0) + 1)
+            conn = self._conn()
+            live_rows = [row for (row,) in conn.execute("SELECT row FROM rows WHERE deleted = 0 ORDER BY row")]
+            # Readers keep using the old file until the manifest points at the new one
+            with open(self._vectors_path(compacted), "wb") as f:
+                if manifest["rows"]:
+                    matrix = np.memmap(old_path, dtype=np.float32, mode="r",
+                                       shape=(manifest["rows"], manifest["dim"]))
+                    for start in range(0, len(live_rows), 65536):
+                        f.write(np.ascontiguousarray(matrix[live_rows[start:start + 65536]]).tobytes())
+                    del matrix
+
+            conn.execute("DELETE FROM rows WHERE deleted = 1")
+            # New row numbers never exceed old ones, so ascending updates cannot collide
+            conn.executemany("UPDATE rows SET row = ? WHERE row = ?", list(enumerate(live_rows)))
+            conn.execute("UPDATE generation SET value = ?", (compacted["generation"],))
+            conn.commit()
+            if os.path.exists(self._index_path):
+                os.remove(self._index_path)
+            compacted.update(rows=len(live_rows), index_rows=0)
+            self._write_manifest(compacted)
+            # Mapped pages of the old file stay readable until the last reader drops them
+            os.remove(old_path)
+            logger.info(f"Compacted {self.path} to {len(live_rows)} rows")
+
+        if NUMPY_INDEX_LISTS and len(live_rows) >= NUMPY_INDEX_LISTS * 10:
+            self.build_index(NUMPY_INDEX_LISTS)
+
+    def build_index(self, n_lists, iterations=10, sample_size=50000, seed=0):
+        """Cluster the current vectors into `n_lists` inverted lists (IVF)."""
+        state = self._load()
+        matrix, live = state["matrix"], state["live"]
+        rows = np.flatnonzero(live)
+        if matrix is None or len(rows) < n_lists:
+            return
+
+        # Train spherical k-means on a sample, then assign every row in blocks
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(matrix[np.sort(rng.choice(rows, min(len(rows), sample_size), replace=False))])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = sample[labels == list_id]
+                if len(members):
+                    centroids[list_id] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assignment = np.concatenate([
+            np.argmax(np.asarray(matrix[rows[start:start + 65536]]) @ centroids.T, axis=1)
+            for start in range(0, len(rows), 65536)
+        ])
+
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if (manifest["rows"], manifest.get("generation")) != (
+                state["manifest"]["rows"], state["manifest"].get("generation")
+            ):
+                return  # Another writer got in first; the next write retries
+            np.savez(self._index_path, centroids=centroids, rows=rows[order], offsets=offsets)
+            manifest["index_rows"] = int(state["manifest"]["rows"])
+            self._write_manifest(manifest)
+
+    # -- reads -----------------------------------------------------------
+
+    def get_documents(self, ids):
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            found.update(
+                (id, json.loads(metadata))
+                for id, metadata in conn.execute(
+                    f"SELECT id, metadata FROM rows WHERE deleted = 0 AND id IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+        return {"ids": list(found), "metadatas": list(found.values())}
+
+    def count(self):
+        (count,) = self._conn().execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()
+        return count
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        while True:
+            try:
+                return self._query(self._load(), query_embeddings, n_results, where)
+            except StaleState:
+                logger.debug(f"{self.path} was compacted during a query, retrying")
+
+    def _query(self, state, query_embeddings, n_results, where):
+        generation = state["manifest"].get("generation", 0)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        allowed = state["live"]
+        if where:
+            allowed = allowed & self._where_mask(where, len(allowed), generation)
+
+        for query in _normalize(query_embeddings):
+            rows, scores = self._search(state, query, allowed, n_results)
+
+            documents = self._fetch(rows, generation)
+            results["ids"].append([documents[row][0] for row in rows])
+            results["documents"].append([documents[row][1] for row in rows])
+            results["metadatas"].append([documents[row][2] for row in rows])
+            results["distances"].append([float(1 - score) for score in scores])
+        return results
+
+    def _search(self, state, query, allowed, n_results):
+        matrix, index = state["matrix"], state["index"]
+        if matrix is None:
+            return [], []
+        if index is None:
+            # Exact search straight over the mapped file
+            candidates = np.flatnonzero(allowed)
+            scores = np.asarray(matrix @ query)[candidates]
+        else:
+            # Probe the nearest lists, plus rows appended since the index was built
+            probes = np.argsort(-(index["centroids"] @ query))[:NUMPY_INDEX_PROBES]
+            offsets = index["offsets"]
+            probed = [index["rows"][offsets[p]:offsets[p + 1]] for p in probes]
+            tail = np.arange(state["manifest"]["index_rows"], len(allowed))
+            candidates = np.concatenate(probed + [tail])
+            candidates = np.sort(candidates[allowed[candidates]])
+            scores = np.asarray(matrix[candidates] @ query)
+
+        if len(scores) > n_results:
+            top = np.argpartition(-scores, n_results - 1)[:n_results]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def _where_mask(self, where, size, generation):
+        clauses, params = where_to_sql(where)
+        mask = np.zeros(size, dtype=bool)
+        rows = [row for (row,) in self._snapshot(
+            generation, f"SELECT row FROM rows WHERE deleted = 0 AND {clauses}", params
+        ) if row < size]
+        mask[rows] = True
+        return mask
+
+    def _fetch(self, rows, generation):
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        return {
+            row: (id, document, json.loads(metadata))
+            for row, id, document, metadata in self._snapshot(
+                generation,
+                f"SELECT row, id, document, metadata FROM rows WHERE row IN ({','.join('?' * len(rows))})",
+                rows,
+            )
+        }
+
+
+class NumpyStore:
+    """Drop-in alternative to ChromaDB backed by memory-mapped NumPy matrices."""
+
+    def __init__(self, path=NUMPY_STORE_PATH):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, provider, model, knowledge_base=DEFAULT_KNOWLEDGE_BASE):
+        key = (provider, model, knowledge_base)
+        with self._lock:
+            if key not in self._collections:
+                self._collections[key] = NumpyCollection(
+                    os.path.join(self.path, collection_name(provider, model, knowledge_base)),
+                    provider, model, knowledge_base,
+                )
+            return self._collections[key]
+
+    def collections(self, knowledge_bases=None):
+        """Existing collections, optionally only those of the given knowledge bases."""
+        found = []
+        for name in sorted(os.listdir(self.path)):
+            manifest_path = os.path.join(self.path, name, "manifest.json")
+            if collection_in_knowledge_bases(name, knowledge_bases) and os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                knowledge_base = manifest.get("knowledge_base", DEFAULT_KNOWLEDGE_BASE)
+                if knowledge_bases is None or knowledge_base in knowledge_bases:
+                    found.append(self.collection(manifest["provider"], manifest["model"], knowledge_base))
+        return found
+
+    async def acollections(self, knowledge_bases=None):
+        return await run_blocking(self.collections, knowledge_bases)
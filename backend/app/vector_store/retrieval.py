@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+
+from ..concurrency import run_blocking
+from ..metrics import stage
+from ..llm.embedding_cache import CachedEmbedder
+from ..llm.openai import openai_client
+from ..llm.gemini import gemini_client
+from .backend import create_vector_store, reciprocal_rank_fusion
+from .bm25 import bm25_index, tokenize
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("hybrid", "dense", "sparse")
+# Each side of a hybrid search contributes n_results * this many candidates
+RETRIEVAL_CANDIDATE_FACTOR = int(os.environ.get("RETRIEVAL_CANDIDATE_FACTOR", 4))
+
+
+def rerank_hits(query, hits):
+    """
+    Cheap local re-ranking: order by how many distinct query terms a chunk
+    contains, then by how many adjacent query term pairs it contains, falling
+    back to the incoming order.
+    """
+    terms = set(tokenize(query))
+    query_tokens = tokenize(query)
+    pairs = set(zip(query_tokens, query_tokens[1:]))
+    if not terms:
+        return hits
+
+    def key(item):
+        rank, hit = item
+        tokens = tokenize(hit["text"])
+        coverage = len(terms.intersection(tokens)) / len(terms)
+        phrases = len(pairs.intersection(zip(tokens, tokens[1:])))
+        return (-coverage, -phrases, rank)
+
+    return [hit for _, hit in sorted(enumerate(hits), key=key)]
+
+
+class Retriever:
+    """
+    Hybrid retrieval over a vector store with one collection per embedding
+    model plus a BM25 keyword index. Dense queries are embedded with the
+    provider/model each collection was built with, and the dense and keyword
+    rankings are merged with reciprocal rank fusion.
+    """
+
+    def __init__(self, store, embedders, keyword_index=None):
+        self.store = store
+        self.embedders = embedders
+        self.keyword_index = keyword_index
+
+    async def search(self, queries, n_results=3, where=None, provider=None, mode="hybrid", rerank=False,
+                     knowledge_bases=None):
+        """
+        Return a list of hits per query, best first. `knowledge_bases` limits
+        the search to those knowledge bases; by default all are searched.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        use_sparse = mode != "dense" and self.keyword_index is not None and self.keyword_index.enabled
+        use_dense = mode != "sparse" or not use_sparse
+        pool = n_results * RETRIEVAL_CANDIDATE_FACTOR if (use_sparse and use_dense) or rerank else n_results
+
+        searches = []
+        if use_dense:
+            searches.append(self.dense_search(queries, pool, where, provider, knowledge_bases))
+        if use_sparse:
+            searches.append(self.keyword_index.asearch(queries, pool, where, knowledge_bases))
+        rankings = await asyncio.gather(*searches)
+
+        results = []
+        for index, query in enumerate(queries):
+            if len(rankings) > 1:
+                hits = reciprocal_rank_fusion([ranking[index] for ranking in rankings])
+            else:
+                hits = rankings[0][index]
+            if rerank:
+                hits = rerank_hits(query, hits)
+            results.append(hits[:n_results])
+        return results
+
+    async def dense_search(self, queries, n_results, where=None, provider=None, knowledge_bases=None):
+        collections = await self.store.acollections(knowledge_bases)
+        if provider:
+            collections = [c for c in collections if c.provider == provider]
+        searchable = []
+        for collection in collections:
+            if collection.provider in self.embedders:
+                searchable.append(collection)
+            else:
+                logger.warning(f"No embedder for provider {collection.provider}, skipping its collection")
+
+        # Knowledge bases built with the same model share the query embeddings
+        models = list(dict.fromkeys((c.provider, c.model) for c in searchable))
+        embeddings = dict(zip(models, await asyncio.gather(*(self._embed(queries, *model) for model in models))))
+        results = await asyncio.gather(*(
+            self._query(collection, embeddings[(collection.provider, collection.model)], n_results, where)
+            for collection in searchable
+        ))
+
+        if len(results) == 1:
+            return [_hits(results[0], index) for index in range(len(queries))]
+        # Distances from different embedding models aren't comparable, so each
+        # collection's ranking is fused by rank. A document indexed under
+        # several models appears once, ranked higher for each model that found it.
+        return [
+            reciprocal_rank_fusion([_hits(result, index) for result in results])[:n_results]
+            for index in range(len(queries))
+        ]
+
+    async def _embed(self, queries, provider, model):
+        with stage("embed_query", provider=provider):
+            return await self.embedders[provider].aget_embeddings(queries, model=model)
+
+    async def _query(self, collection, embeddings, n_results, where):
+        with stage("vector_search", collection=f"{collection.provider}/{collection.model}"):
+            return await run_blocking(collection.query, embeddings, n_results, where)
+
+
+def _hits(results, index):
+    return [
+        {"id": id, "text": text, "metadata": metadata or {}, "distance": distance}
+        for id, text, metadata, distance in zip(
+            results["ids"][index],
+            results["documents"][index],
+            results["metadatas"][index],
+            results["distances"][index],
+        )
+    ]
+
+
+vector_store = create_vector_store()
+# Shared by ingestion and retrieval so both reuse the pooled provider clients
+embedders = {
+    "openai": CachedEmbedder(openai_client),
+    "gemini": CachedEmbedder(gemini_client),
+}
+retriever = Retriever(vector_store, embedders, keyword_index=bm25_index)
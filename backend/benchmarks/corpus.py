@@ -0,0 +1,25 @@
+"""Synthetic PDF corpora for ingestion benchmarks."""
+import random
+
+import pymupdf
+
+VOCABULARY = (
+    "workflow retrieval embedding vector index query latency throughput cache model token "
+    "document chunk page search answer context provider request response batch stream "
+    "knowledge base engine pipeline schema database session history summary metric trace "
+    "the a of and to in is for on with as by that this from at are be it or an"
+).split()
+
+
+def page_text(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def make_pdf(pages, words_per_page=300, seed=0):
+    """Bytes of a PDF with `pages` pages of pseudo-random prose."""
+    rng = random.Random(seed)
+    with pymupdf.open() as pdf_document:
+        for _ in range(pages):
+            page = pdf_document.new_page()
+            page.insert_textbox(page.rect + (36, 36, -36, -36), page_text(rng, words_per_page), fontsize=8)
+        return pdf_document.tobytes()
@@ -0,0 +1,385 @@
+"""
+Offline end-to-end benchmarks. The API runs under uvicorn in a subprocess with
+every provider pointed at local stubs, and this process drives it over HTTP:
+ingestion of synthetic PDFs, then concurrency sweeps over /api/workflow/run
+and /api/workflow/run/stream.
+
+Run from backend/:
+    python -m benchmarks.run                    # report to stdout
+    python -m benchmarks.run --save-baseline    # record benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.25
+
+Exits with status 1 when a metric regressed past the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .corpus import make_pdf
+from .stubs import Latency, StubConfig, StubServer, free_port
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baseline.json")
+# Metrics checked against the baseline, and whether higher values are better
+COMPARED_METRICS = {
+    "p50_ms": False, "p95_ms": False, "ttft_p50_ms": False, "ttft_p95_ms": False,
+    "requests_per_s": True, "goodput_per_s": True, "pages_per_s": True,
+}
+# Error rates may rise by this much (absolute) before counting as a regression
+ERROR_RATE_SLACK = 0.01
+WAVES = 8
+
+
+def percentile(values, q):
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def latency_summary(latencies, prefix=""):
+    return {
+        f"{prefix}p50_ms": _ms(percentile(latencies, 50)),
+        f"{prefix}p95_ms": _ms(percentile(latencies, 95)),
+        f"{prefix}p99_ms": _ms(percentile(latencies, 99)),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _rss_mb(kilobytes):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(kilobytes / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def process_peak_rss_mb(pid):
+    """Peak RSS of a running process so far, where /proc is available."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb(results):
+    """Peak RSS of the API process over the whole run."""
+    peaks = [result["peak_rss_mb"] for result in results.values() if result.get("peak_rss_mb")]
+    if peaks:
+        return max(peaks)
+    # Without /proc, fall back to the largest exited child; the API outweighs the stubs
+    return _rss_mb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def workflow_payload(query):
+    """User Query -> Knowledge Base -> LLM Engine (with web search) -> Output."""
+    return {
+        "definition": [
+            {"id": "query", "type": "user_query", "config": {}},
+            {"id": "kb", "type": "knowledge_base", "config": {"embedding_provider": "openai", "n_results": 3}},
+            {"id": "llm", "type": "llm_engine", "config": {
+                "llm_provider": "openai", "model": "gpt-3.5-turbo", "use_serpapi": True,
+            }},
+            {"id": "output", "type": "output", "config": {}},
+        ],
+        "edges": [
+            {"source": "query", "target": "kb"},
+            {"source": "kb", "target": "llm"},
+            {"source": "llm", "target": "output"},
+        ],
+        "query": query,
+        # The response and search caches would hide the hot path
+        "use_cache": False,
+    }
+
+
+class AppServer:
+    """The API under uvicorn in a subprocess, configured through its environment."""
+
+    def __init__(self, env, port=None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = env
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"API server exited with status {self.process.returncode}")
+            try:
+                # Wait for the optional LLM client warmups too, so they don't overlap the first measurement
+                response = httpx.get(f"{self.url}/health/ready", timeout=1)
+                if response.status_code == 200 and "pending" not in response.json()["checks"].values():
+                    return self
+            except (httpx.HTTPError, ValueError):
+                pass
+            time.sleep(0.1)
+        self.process.terminate()
+        raise RuntimeError("API server did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def peak_rss_mb(self):
+        return process_peak_rss_mb(self.process.pid)
+
+
+async def sweep(client, path, queries, concurrency, stream=False):
+    """Send one request per query with `concurrency` in flight at a time."""
+    latencies, first_bytes = [], []
+    errors = rejected = 0
+    pending = iter(queries)
+
+    async def request(query, headers):
+        nonlocal rejected
+        start = time.perf_counter()
+        if not stream:
+            response = await client.post(path, json=workflow_payload(query), headers=headers)
+            if response.status_code == 429:
+                # Shed by admission control: counted apart, and kept out of the latencies
+                rejected += 1
+                return True
+            latencies.append(time.perf_counter() - start)
+            return response.status_code == 200
+        first_token = None
+        async with client.stream("POST", path, json=workflow_payload(query), headers=headers) as response:
+            if response.status_code == 429:
+                rejected += 1
+                return True
+            ok = response.status_code == 200
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                if event["type"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif event["type"] == "error":
+                    ok = False
+        if first_token is not None:
+            first_bytes.append(first_token)
+        latencies.append(time.perf_counter() - start)
+        return ok
+
+    async def worker(number):
+        nonlocal errors
+        # Each worker is a separate user to the API's per-client limits
+        headers = {"X-Client-Id": f"benchmark-{number}"}
+        # Workers share one iterator, so each query is sent once
+        for query in pending:
+            try:
+                ok = await request(query, headers)
+            except httpx.HTTPError:
+                ok = False
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": len(queries),
+        "concurrency": concurrency,
+        "error_rate": round(errors / len(queries), 4),
+        "rejected_rate": round(rejected / len(queries), 4),
+        "requests_per_s": round(len(queries) / elapsed, 2),
+        # Requests answered successfully per second, the number that should hold up under overload
+        "goodput_per_s": round((len(queries) - errors - rejected) / elapsed, 2),
+        **latency_summary(latencies),
+    }
+    if stream:
+        result.update(latency_summary(first_bytes, prefix="ttft_"))
+    return result
+
+
+async def ingest(client, pages, provider, seed, poll_interval=0.05):
+    """Upload one synthetic PDF and wait for its ingestion job to finish."""
+    pdf = make_pdf(pages, seed=seed)
+    start = time.perf_counter()
+    response = await client.post(
+        "/api/knowledge_base/upload",
+        files=[("files", (f"corpus-{pages}p.pdf", pdf, "application/pdf"))],
+        data={"embedding_provider": provider},
+    )
+    body = response.json()
+    if "job_id" not in body:
+        raise RuntimeError(f"Upload failed: {body}")
+    while True:
+        job = (await client.get(f"/api/knowledge_base/jobs/{body['job_id']}")).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        await asyncio.sleep(poll_interval)
+    elapsed = time.perf_counter() - start
+    return {
+        "pages": pages,
+        "bytes": len(pdf),
+        "status": job["status"],
+        "seconds": round(elapsed, 2),
+        "pages_per_s": round(pages / elapsed, 1),
+    }
+
+
+async def run_scenarios(args, server):
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 4)
+    async with httpx.AsyncClient(base_url=server.url, timeout=300, limits=limits) as client:
+        # Ingest first so the workflows retrieve from a populated knowledge base
+        if "upload" in args.scenarios:
+            for index, pages in enumerate(args.corpus):
+                name = f"upload/{args.embedding_provider}/{pages}p"
+                results[name] = await ingest(client, pages, args.embedding_provider, args.seed + index)
+                results[name]["peak_rss_mb"] = server.peak_rss_mb()
+                _progress(name, results[name])
+
+        for scenario, path, stream in (("run", "/api/workflow/run", False), ("stream", "/api/workflow/run/stream", True)):
+            if scenario not in args.scenarios:
+                continue
+            for concurrency in args.concurrency:
+                name = f"{scenario}/c{concurrency}"
+                # Fresh queries per level, so nothing is served from the search cache
+                # At least WAVES rounds per level, so tail percentiles aren't one round's stragglers
+                count = max(args.requests, concurrency * WAVES)
+                queries = [f"benchmark question {name} {i}" for i in range(count)]
+                results[name] = await sweep(client, path, queries, concurrency, stream=stream)
+                results[name]["peak_rss_mb"] = server.peak_rss_mb()
+                _progress(name, results[name])
+    return results
+
+
+def _progress(name, result):
+    print(f"{name}: {json.dumps(result)}", file=sys.stderr)
+
+
+def app_environment(stub_url, workdir):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "benchmark", "OPENAI_BASE_URL": f"{stub_url}/v1",
+        "GEMINI_API_KEY": "benchmark", "GEMINI_API_ENDPOINT": stub_url,
+        "SERPAPI_API_KEY": "benchmark", "SERPAPI_URL": f"{stub_url}/search.json",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(workdir, "chroma"),
+        "NUMPY_STORE_PATH": os.path.join(workdir, "vectors"),
+        "UPLOAD_SPOOL_DIR": workdir,
+        # Every embedding goes to the stub, as on a cold deployment
+        "EMBEDDING_CACHE_PATH": "",
+        "LLM_HEDGE_ENABLED": "false",
+        "ANONYMIZED_TELEMETRY": "False",
+    })
+    env.pop("TESTING", None)
+    return env
+
+
+def compare(report, baseline, tolerance):
+    """Descriptions of the metrics that got worse than the baseline by more than `tolerance`."""
+    regressions = []
+    for name, previous in baseline.get("results", {}).items():
+        current = report["results"].get(name)
+        if current is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            limit = old * (1 - tolerance) if higher_is_better else old * (1 + tolerance)
+            if (new < limit) if higher_is_better else (new > limit):
+                regressions.append(f"{name} {metric}: {old} -> {new}")
+        if current.get("error_rate", 0) > previous.get("error_rate", 0) + ERROR_RATE_SLACK:
+            regressions.append(f"{name} error_rate: {previous.get('error_rate')} -> {current['error_rate']}")
+    return regressions
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(",") if part]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="upload,run,stream", type=lambda v: v.split(","),
+                        help="comma-separated subset of upload, run, stream")
+    parser.add_argument("--concurrency", default=[1, 8, 32], type=_int_list, help="concurrency levels to sweep")
+    parser.add_argument("--requests", default=64, type=int, help="minimum requests per concurrency level")
+    parser.add_argument("--corpus", default=[10, 100], type=_int_list, help="page counts of the synthetic PDFs")
+    parser.add_argument("--embedding-provider", default="openai", choices=["openai", "gemini"])
+    parser.add_argument("--llm-latency", default="300:450", help="stub LLM latency as median[:p95] in ms")
+    parser.add_argument("--embedding-latency", default="50:75", help="stub embedding latency in ms")
+    parser.add_argument("--search-latency", default="400:600", help="stub SerpAPI latency in ms")
+    parser.add_argument("--failure-rate", default=0.0, type=float, help="share of stub calls that fail with 503")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="fail when results regress against this report")
+    parser.add_argument("--tolerance", default=0.25, type=float, help="allowed relative regression")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, help="store the report as the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = StubConfig(
+        llm=Latency.parse(args.llm_latency), embedding=Latency.parse(args.embedding_latency),
+        search=Latency.parse(args.search_latency), failure_rate=args.failure_rate, seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir, StubServer(config) as stubs:
+        with AppServer(app_environment(stubs.url, workdir)) as server:
+            results = asyncio.run(run_scenarios(args, server))
+        stub_requests = stubs.requests
+
+    report = {
+        "settings": {
+            key: getattr(args, key) for key in (
+                "scenarios", "concurrency", "requests", "corpus", "embedding_provider",
+                "llm_latency", "embedding_latency", "search_latency", "failure_rate",
+            )
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(results),
+        "stub_requests": stub_requests,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as output:
+            output.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as stored:
+            baseline = json.load(stored)
+        if baseline.get("settings") != report["settings"]:
+            print("Warning: baseline was recorded with different settings", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Local stand-ins for the OpenAI, Gemini and SerpAPI HTTP APIs, so benchmarks
+run offline. Every endpoint sleeps for a latency drawn from a log-normal
+distribution and fails a configurable share of requests with a transient
+status, which exercises the app's retries and failover.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import socket
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIM = 64
+ANSWER = "This answer comes from the benchmark stub and has a few dozen tokens so streaming emits several chunks."
+
+
+class Latency:
+    """Log-normal latency given its median and 95th percentile, in milliseconds."""
+
+    def __init__(self, median_ms, p95_ms=None):
+        self.median = median_ms / 1000
+        p95 = (p95_ms if p95_ms is not None else median_ms) / 1000
+        self.sigma = math.log(p95 / self.median) / 1.645 if p95 > self.median > 0 else 0.0
+
+    @classmethod
+    def parse(cls, spec):
+        """'median' or 'median:p95' in milliseconds, e.g. '300:900'."""
+        median, _, p95 = spec.partition(":")
+        return cls(float(median), float(p95) if p95 else None)
+
+    def sample(self, rng=random):
+        if self.median <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median), self.sigma) if self.sigma else self.median
+
+
+class StubConfig:
+    def __init__(self, llm=Latency(300, 900), embedding=Latency(50, 150), search=Latency(400, 1200),
+                 failure_rate=0.0, seed=None):
+        self.llm = llm
+        self.embedding = embedding
+        self.search = search
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+
+def fake_embedding(text):
+    """Deterministic unit vector, so identical texts embed identically."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    values = [digest[i % len(digest)] / 255 - 0.5 for i in range(EMBEDDING_DIM)]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+def create_stub_app(config):
+    app = FastAPI()
+    app.state.requests = {"openai": 0, "gemini": 0, "serpapi": 0, "failed": 0}
+
+    async def delay(provider, latency):
+        app.state.requests[provider] += 1
+        await asyncio.sleep(latency.sample(config.random))
+        if config.failure_rate and config.random.random() < config.failure_rate:
+            app.state.requests["failed"] += 1
+            return JSONResponse({"error": {"message": "stub overloaded"}}, status_code=503)
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        failure = await delay("openai", config.llm)
+        if failure:
+            return failure
+        prompt_tokens = sum(len(m["content"]) // 4 + 1 for m in body["messages"])
+        if body.get("stream"):
+            async def chunks():
+                for word in ANSWER.split(" "):
+                    chunk = {
+                        "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": body["model"],
+                        "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(0.005)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+        return {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 24, "total_tokens": prompt_tokens + 24},
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        failure = await delay("openai", config.embedding)
+        if failure:
+            return failure
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        return {
+            "object": "list", "model": body["model"],
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(t)} for i, t in enumerate(texts)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1beta/models/{target:path}")
+    async def gemini(target: str, request: Request):
+        # Paths look like /v1beta/models/gemini-1.5-flash:generateContent
+        _, _, method = target.partition(":")
+        body = await request.json()
+        if method == "generateContent":
+            failure = await delay("gemini", config.llm)
+            return failure or {
+                "candidates": [{"content": {"parts": [{"text": ANSWER}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+                "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 24, "totalTokenCount": 124},
+            }
+        if method == "embedContent":
+            failure = await delay("gemini", config.embedding)
+            text = " ".join(part.get("text", "") for part in body["content"]["parts"])
+            return failure or {"embedding": {"values": fake_embedding(text)}}
+        if method == "batchEmbedContents":
+            failure = await delay("gemini", config.embedding)
+            return failure or {"embeddings": [
+                {"values": fake_embedding(" ".join(p.get("text", "") for p in r["content"]["parts"]))}
+                for r in body["requests"]
+            ]}
+        return JSONResponse({"error": {"message": f"Unsupported method {method}"}}, status_code=404)
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.requests
+
+    @app.get("/search.json")
+    async def search(q: str):
+        failure = await delay("serpapi", config.search)
+        if failure:
+            return failure
+        return {"organic_results": [
+            {"position": i + 1, "title": f"Result {i + 1} for {q}", "link": f"https://example.com/{i}?q={q}",
+             "snippet": f"Snippet {i + 1} about {q}."}
+            for i in range(5)
+        ]}
+
+    return app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(config, port):
+    uvicorn.run(create_stub_app(config), host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+
+
+class StubServer:
+    """
+    Runs the stub app with uvicorn in a child process, so serving the stubs
+    doesn't compete with the load generator for the GIL.
+    """
+
+    def __init__(self, config, port=None):
+        self.config = config
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._process = multiprocessing.Process(target=_serve, args=(config, self.port), daemon=True)
+
+    @property
+    def requests(self):
+        return httpx.get(f"{self.url}/stats").json()
+
+    def __enter__(self):
+        self._process.start()
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                httpx.get(f"{self.url}/stats", timeout=1)
+                return self
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or not self._process.is_alive():
+                    self._process.terminate()
+                    raise RuntimeError("Stub server did not start")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join(timeout=5)
@@ -0,0 +1,9 @@
+import os
+
+# Set before any test module imports the app, since clients and caches read
+# their configuration at import time.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("INGEST_PARSE_WORKERS", "0")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("BM25_INDEX_PATH", "")
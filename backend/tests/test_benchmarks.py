@@ -0,0 +1,44 @@
+import httpx
+
+from benchmarks.run import compare, percentile
+from benchmarks.stubs import Latency, StubConfig, StubServer
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {"results": {
+        "run/c8": {"p95_ms": 1000, "requests_per_s": 10, "error_rate": 0.0},
+        "upload/openai/100p": {"pages_per_s": 100},
+    }}
+    report = {"results": {
+        "run/c8": {"p95_ms": 1100, "requests_per_s": 7, "error_rate": 0.05},
+        "upload/openai/100p": {"pages_per_s": 90},
+    }}
+
+    assert compare(report, baseline, tolerance=0.2) == [
+        "run/c8 requests_per_s: 10 -> 7",
+        "run/c8 error_rate: 0.0 -> 0.05",
+    ]
+
+
+def test_stub_server_serves_provider_apis():
+    with StubServer(StubConfig(llm=Latency(0), embedding=Latency(0), search=Latency(0))) as stubs:
+        chat = httpx.post(f"{stubs.url}/v1/chat/completions", json={
+            "model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "hi"}],
+        }).json()
+        embeddings = httpx.post(f"{stubs.url}/v1/embeddings", json={
+            "model": "text-embedding-ada-002", "input": ["a", "b"],
+        }).json()
+        search = httpx.get(f"{stubs.url}/search.json", params={"q": "paris"}).json()
+
+        assert chat["choices"][0]["message"]["content"]
+        assert [item["index"] for item in embeddings["data"]] == [0, 1]
+        assert search["organic_results"][0]["title"] == "Result 1 for paris"
+        assert stubs.requests["openai"] == 2
@@ -0,0 +1,293 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from app import schemas
+from app.engine.graph import compile_workflow, WorkflowGraphError
+from app.engine.batch import run_batch
+from app.engine.context import pack_context
+from app.engine.executor import execute_plan, plan_response
+from app.engine.scheduler import WorkflowScheduler, Overloaded, BACKGROUND
+
+
+def components(*specs):
+    return [schemas.WorkflowComponent(id=id, type=type, config=config) for id, type, config in specs]
+
+
+def edges(*pairs):
+    return [schemas.WorkflowEdge(source=source, target=target) for source, target in pairs]
+
+
+def test_compile_infers_stages_without_edges():
+    plan = compile_workflow(components(
+        ("1", "user_query", {}),
+        ("2", "knowledge_base", {}),
+        ("3", "llm_engine", {"use_serpapi": True}),
+        ("4", "output", {}),
+    ))
+
+    assert plan.by_id["2"].deps == ["1"]
+    assert sorted(plan.by_id["3"].deps) == ["1", "2", "3:web_search"]
+    assert plan.by_id["3:web_search"].deps == []
+    assert plan.by_id["4"].deps == ["3"]
+    assert [node.id for node in plan.final_nodes()] == ["4"]
+
+
+def test_compile_uses_builder_edges_and_aliases():
+    plan = compile_workflow(
+        components(("a", "userQuery", {}), ("b", "llmEngine", {}), ("c", "llmEngine", {}), ("d", "output", {})),
+        edges(("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")),
+    )
+
+    assert plan.by_id["b"].type == "llm_engine"
+    assert plan.by_id["d"].deps == ["b", "c"]
+    assert [node.id for node in plan.nodes].index("a") == 0
+
+
+def test_compile_rejects_cycles():
+    with pytest.raises(WorkflowGraphError):
+        compile_workflow(
+            components(("a", "llm_engine", {}), ("b", "llm_engine", {})),
+            edges(("a", "b"), ("b", "a")),
+        )
+
+
+def test_execute_runs_retrieval_and_search_concurrently():
+    started = []
+
+    async def fake_retrieve(queries, n_results, where, provider, mode, rerank, knowledge_bases):
+        started.append("kb")
+        await asyncio.sleep(0.05)
+        assert "search" in started
+        return [[{"id": "1", "text": "doc", "metadata": {}, "distance": 0.1}]]
+
+    async def fake_search(query):
+        started.append("search")
+        await asyncio.sleep(0.05)
+        assert "kb" in started
+        return {"organic_results": [{"snippet": "snippet"}]}
+
+    async def fake_completion(prompt, model):
+        return prompt
+
+    plan = compile_workflow(components(
+        ("1", "user_query", {}),
+        ("2", "knowledge_base", {}),
+        ("3", "llm_engine", {"use_serpapi": True}),
+        ("4", "output", {}),
+    ))
+    with patch("app.engine.executor.retriever.search", fake_retrieve), \
+            patch("app.engine.executor.serpapi_client.asearch", fake_search), \
+            patch("app.engine.executor.openai_client.aget_chat_completion", fake_completion):
+        results = asyncio.run(execute_plan(plan, "question"))
+
+    assert plan_response(plan, results) == "Context: doc\n\nQuery: question\n\nWeb Search Results: snippet"
+
+
+def test_execute_fans_in_multiple_llm_engines():
+    async def fake_completion(prompt, model):
+        return f"{model} answer"
+
+    definition = components(
+        ("1", "user_query", {}),
+        ("2", "llm_engine", {"model": "gpt-4"}),
+        ("3", "llm_engine", {"model": "gpt-3.5-turbo"}),
+        ("4", "output", {}),
+    )
+    # Without edges the output keeps the last engine's answer, as a sequential run did
+    sequential = compile_workflow(definition)
+    fan_in = compile_workflow(definition, edges(("1", "2"), ("1", "3"), ("2", "4"), ("3", "4")))
+    with patch("app.engine.executor.openai_client.aget_chat_completion", fake_completion):
+        sequential_results = asyncio.run(execute_plan(sequential, "question"))
+        fan_in_results = asyncio.run(execute_plan(fan_in, "question"))
+
+    assert sequential.by_id["4"].deps == ["3"]
+    assert plan_response(sequential, sequential_results) == "gpt-3.5-turbo answer"
+    assert plan_response(fan_in, fan_in_results) == "gpt-4 answer\n\ngpt-3.5-turbo answer"
+
+
+def test_response_cache_exact_hit_ttl_and_lru():
+    from app.engine.cache import ResponseCache
+
+    plan = compile_workflow(components(("1", "user_query", {}), ("2", "llm_engine", {"model": "gpt-4"})))
+    other = compile_workflow(components(("1", "user_query", {}), ("2", "llm_engine", {"model": "gpt-3.5-turbo"})))
+    cache = ResponseCache(max_entries=2, ttl=60, similarity_threshold=0)
+
+    async def scenario():
+        await cache.set(plan, "Hello  World", "hi")
+        assert await cache.get(plan, "hello world") == "hi"
+        assert await cache.get(other, "hello world") is None
+
+        await cache.set(plan, "second", "2")
+        await cache.set(plan, "third", "3")
+        assert await cache.get(plan, "hello world") is None
+
+        cache.ttl = -1
+        await cache.set(plan, "expired", "x")
+        assert await cache.get(plan, "expired") is None
+
+    asyncio.run(scenario())
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["exact_hits"] == 1
+
+
+@pytest.fixture
+def generations_db(monkeypatch):
+    """In-memory database shared by every ResponseCache in the test, as replicas share one."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import StaticPool
+    from app.db import database, models
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def create_table():
+        async with engine.begin() as conn:
+            await conn.run_sync(models.KnowledgeBaseGeneration.__table__.create)
+
+    asyncio.run(create_table())
+    monkeypatch.setattr(database, "AsyncSessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+    yield
+    asyncio.run(engine.dispose())
+
+
+def test_response_cache_similarity_tier_and_invalidation(generations_db):
+    from app.engine.cache import ResponseCache
+
+    vectors = {"capital of france": [1.0, 0.0], "france capital": [0.99, 0.05], "weather": [0.0, 1.0]}
+
+    class FakeEmbedder:
+        async def aget_embedding(self, text):
+            return vectors[text]
+
+    plan = compile_workflow(components(("1", "knowledge_base", {}), ("2", "llm_engine", {})))
+    cache = ResponseCache(max_entries=10, ttl=60, similarity_threshold=0.95)
+    cache.embedder = FakeEmbedder()
+
+    async def scenario():
+        await cache.set(plan, "capital of France", "Paris")
+        assert await cache.get(plan, "France capital") == "Paris"
+        assert await cache.get(plan, "weather") is None
+        # Only uploads to a knowledge base the plan searches make its answers stale
+        await cache.invalidate_knowledge_base("hr")
+        assert await cache.get(plan, "capital of France") == "Paris"
+        await cache.invalidate_knowledge_base("default")
+        assert await cache.get(plan, "capital of France") is None
+
+    asyncio.run(scenario())
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_response_cache_sees_invalidations_from_other_replicas(generations_db):
+    from app.engine.cache import ResponseCache
+
+    plan = compile_workflow(components(("1", "knowledge_base", {"knowledge_bases": "hr"}), ("2", "llm_engine", {})))
+    serving, ingesting = ResponseCache(ttl=60), ResponseCache(ttl=60)
+
+    async def scenario():
+        assert await serving.get(plan, "holiday policy") is None
+        # The first upload to the knowledge base lands while the answer is being built
+        await ingesting.invalidate_knowledge_base("hr")
+        await serving.set(plan, "holiday policy", "built on the old corpus")
+        assert await serving.get(plan, "holiday policy") is None
+
+        await serving.set(plan, "holiday policy", "25 days")
+        assert await serving.get(plan, "holiday policy") == "25 days"
+        await ingesting.invalidate_knowledge_base("hr")
+        assert await serving.get(plan, "holiday policy") is None
+
+    asyncio.run(scenario())
+
+
+def test_pack_context_dedups_and_trims_to_budget():
+    words = " ".join(f"w{i}" for i in range(40))
+    hits = [
+        {"id": "1", "text": "alpha beta gamma"},
+        {"id": "1", "text": "alpha beta gamma"},
+        {"id": "2", "text": "gamma  beta alpha"},
+        {"id": "3", "text": words},
+    ]
+
+    assert pack_context(hits, token_budget=0) == ["alpha beta gamma", words]
+    assert pack_context(hits, token_budget=25) == ["alpha beta gamma", " ".join(words.split()[:22])]
+    assert pack_context(hits, token_budget=10) == ["alpha beta gamma"]
+
+
+def test_run_batch_bounds_concurrency_and_reports_errors():
+    in_flight, peak = 0, 0
+
+    async def fake_completion(prompt, model):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if "bad" in prompt:
+            raise RuntimeError("provider down")
+        return prompt.upper()
+
+    async def collect():
+        return [result async for result in run_batch(plan, queries, concurrency=2, use_cache=False)]
+
+    plan = compile_workflow(components(("1", "user_query", {}), ("2", "llm_engine", {})))
+    queries = ["a", "b", "bad", "c", "d"]
+    with patch("app.engine.executor.openai_client.aget_chat_completion", fake_completion):
+        results = sorted(asyncio.run(collect()), key=lambda result: result["index"])
+
+    assert peak == 2
+    assert [result.get("response") for result in results] == ["A", "B", None, "C", "D"]
+    assert results[2]["error"] == "LLM error: provider down"
+
+
+def test_scheduler_serves_interactive_first_within_client_limits():
+    scheduler = WorkflowScheduler(max_concurrency=2, client_concurrency=1, background_share=0.5)
+
+    async def scenario():
+        first = await scheduler.acquire(client="a")
+        second = await scheduler.acquire(client="b")
+        same_client = asyncio.ensure_future(scheduler.acquire(client="a"))
+        background = asyncio.ensure_future(scheduler.acquire(client="c", priority=BACKGROUND))
+        interactive = asyncio.ensure_future(scheduler.acquire(client="d"))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == {"interactive": 2, "background": 1}
+
+        # Client a is at its limit, so the next interactive run overtakes it
+        scheduler.release(second)
+        d = await asyncio.wait_for(interactive, 1)
+        assert d.client == "d"
+        assert scheduler.stats()["queued"] == {"interactive": 1, "background": 1}
+
+        scheduler.release(first)
+        a = await asyncio.wait_for(same_client, 1)
+        assert scheduler.stats()["queued"] == {"interactive": 0, "background": 1}
+
+        scheduler.release(d)
+        c = await asyncio.wait_for(background, 1)
+        scheduler.release(a)
+        scheduler.release(c)
+
+    asyncio.run(scenario())
+    assert scheduler.stats()["running"] == {"interactive": 0, "background": 0}
+    assert (scheduler.stats()["admitted"], scheduler.stats()["queued_total"]) == (5, 3)
+
+
+def test_scheduler_rejects_runs_that_would_miss_their_deadline():
+    scheduler = WorkflowScheduler(max_concurrency=1)
+
+    async def scenario():
+        ticket = await scheduler.acquire()
+        scheduler.service_time = 0.04
+        # One run ahead at 40ms a run: a 20ms deadline can't be met
+        with pytest.raises(Overloaded) as rejected:
+            await scheduler.acquire(deadline=0.02)
+        assert rejected.value.status_code == 429
+        assert rejected.value.headers["Retry-After"] == "1"
+
+        # A 50ms deadline is accepted, but nothing frees up in time
+        with pytest.raises(Overloaded):
+            await scheduler.acquire(deadline=0.05)
+        scheduler.release(ticket)
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert (stats["rejected"], stats["timed_out"], stats["queued"]["interactive"]) == (2, 1, 0)
@@ -0,0 +1,200 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.ingestion.chunking import chunk_pages, batched
+from app.ingestion.pipeline import index_document, document_key
+from app.llm.embedding_cache import CachedEmbedder, EmbeddingCache, text_hash
+
+
+def test_chunk_pages_overlaps_and_bounds_chunks():
+    pages = [" ".join(f"w{i}" for i in range(10))]
+    chunks = list(chunk_pages(pages, chunk_tokens=4, overlap=1))
+
+    assert [c["text"] for c in chunks] == [
+        "w0 w1 w2 w3",
+        "w3 w4 w5 w6",
+        "w6 w7 w8 w9",
+    ]
+    assert all(len(c["text"].split()) <= 4 for c in chunks)
+
+
+def test_chunk_pages_tracks_start_page():
+    chunks = list(chunk_pages(["a b c", "d e f"], chunk_tokens=4, overlap=0))
+
+    assert [(c["page"], c["index"]) for c in chunks] == [(1, 0), (2, 1)]
+
+
+def test_chunk_pages_rejects_overlap_larger_than_chunk():
+    with pytest.raises(ValueError):
+        list(chunk_pages(["a b c"], chunk_tokens=2, overlap=2))
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_index_document_batches_embeddings_and_bulk_writes():
+    embedder = MagicMock()
+    embedder.get_embeddings.side_effect = lambda texts: [[0.1]] * len(texts)
+    store = MagicMock()
+    store.get_documents.return_value = {"ids": [], "metadatas": []}
+    pages = [" ".join(f"w{i}" for i in range(1000))]
+
+    count = index_document("manual.pdf", pages, embedder, store, batch_size=2)
+
+    assert count == 4
+    assert embedder.get_embeddings.call_count == 2
+    store.upsert_documents.assert_called_once()
+    kwargs = store.upsert_documents.call_args.kwargs
+    key = document_key("manual.pdf")
+    assert kwargs["ids"] == [f"{key}-{i}" for i in range(4)]
+    assert len(kwargs["embeddings"]) == 4
+    assert kwargs["metadatas"][0]["page"] == 1
+    assert kwargs["metadatas"][0]["content_hash"] == text_hash(kwargs["documents"][0])
+
+
+def test_index_document_skips_chunks_with_unchanged_hash():
+    embedder = MagicMock()
+    embedder.get_embeddings.side_effect = lambda texts: [[0.1]] * len(texts)
+    store = MagicMock()
+    key = document_key("notes.pdf")
+    store.get_documents.return_value = {
+        "ids": [f"{key}-0"],
+        "metadatas": [{"content_hash": text_hash("a b c")}],
+    }
+
+    count = index_document("notes.pdf", ["a b c"], embedder, store)
+
+    assert count == 1
+    embedder.get_embeddings.assert_not_called()
+    store.upsert_documents.assert_not_called()
+
+
+def test_cached_embedder_only_embeds_new_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    provider = MagicMock(provider="openai", embedding_model="text-embedding-ada-002")
+    provider.get_embeddings.side_effect = lambda texts, model: [[float(len(t))] for t in texts]
+    embedder = CachedEmbedder(provider, cache=cache)
+
+    assert embedder.get_embeddings(["one", "three"]) == [[3.0], [5.0]]
+    assert embedder.get_embeddings(["three ", "four"]) == [[5.0], [4.0]]
+
+    assert provider.get_embeddings.call_args_list[1].args == (["four"],)
+    assert cache.hits == 1
+
+
+def test_index_document_writes_one_window_at_a_time():
+    embedder = MagicMock()
+    embedder.get_embeddings.side_effect = lambda texts: [[0.1]] * len(texts)
+    store = MagicMock()
+    store.get_documents.return_value = {"ids": [], "metadatas": []}
+    pages = (" ".join(f"w{i}" for i in range(250)) for _ in range(4))
+
+    count = index_document("big.pdf", pages, embedder, store, window=2)
+
+    assert count == 4
+    assert store.upsert_documents.call_count == 2
+    assert [c.kwargs["ids"][-1] for c in store.upsert_documents.call_args_list] == [
+        f"{document_key('big.pdf')}-1", f"{document_key('big.pdf')}-3"
+    ]
+
+
+def test_iter_pages_yields_pages_in_order_from_windows(tmp_path):
+    import pymupdf
+    from concurrent.futures import ThreadPoolExecutor
+    from app.ingestion.extract import iter_pages, page_count
+
+    path = str(tmp_path / "pages.pdf")
+    with pymupdf.open() as pdf_document:
+        for number in range(5):
+            pdf_document.new_page().insert_text((72, 72), f"page {number}")
+        pdf_document.save(path)
+
+    assert page_count(path) == 5
+    expected = [f"page {number}" for number in range(5)]
+    assert [text.strip() for text in iter_pages(path, 5, window=2)] == expected
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert [text.strip() for text in iter_pages(path, 5, pool, window=2, ahead=2)] == expected
+
+
+def test_reupload_replaces_stale_chunks_and_delete_removes_document(tmp_path, monkeypatch):
+    import asyncio
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.db import database, models
+    from app.ingestion import jobs
+    from app.vector_store.numpy_store import NumpyStore
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            table.create(conn)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine))
+    # Spooled "PDFs" are text files with one page per line
+    monkeypatch.setattr(jobs, "page_count", lambda path: len(open(path).read().splitlines()))
+    monkeypatch.setattr(jobs, "iter_pages", lambda path, count, pool, ahead: iter(open(path).read().splitlines()))
+
+    embedder = MagicMock(provider="openai", embedding_model="text-embedding-ada-002")
+    embedder.get_embeddings.side_effect = lambda texts: [[1.0, float(len(t))] for t in texts]
+    store = NumpyStore(str(tmp_path / "vectors"))
+    collection = store.collection("openai", "text-embedding-ada-002")
+    queue = jobs.IngestionQueue(parse_workers=0)
+
+    def upload(words, content_hash):
+        path = tmp_path / f"{content_hash}.txt"
+        path.write_text(" ".join(f"{content_hash}{i}" for i in range(words)))
+        job_id = asyncio.run(queue.create_job([("manual.pdf", str(path), content_hash)], "openai"))
+        asyncio.run(queue.run(job_id, [("manual.pdf", str(path), content_hash)], embedder, store))
+        assert not path.exists()
+        return queue.get_job(job_id).files[0]
+
+    assert upload(1000, "v1")["chunks"] == 4
+    assert upload(1000, "v1")["status"] == "unchanged"
+    assert upload(500, "v2")["chunks"] == 2
+    assert collection.count() == 2
+
+    with database.SessionLocal() as db:
+        (document,) = db.query(models.Document).all()
+    assert (document.version, document.content_hash) == (2, "v2")
+
+    assert asyncio.run(queue.delete_document(document.id, store))
+    assert collection.count() == 0
+    assert not asyncio.run(queue.delete_document(document.id, store))
+    assert queue._document_locks == {}
+
+
+def test_fail_abandoned_jobs_fails_stale_unfinished_jobs_only(tmp_path, monkeypatch):
+    import datetime
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.db import database, models
+    from app.ingestion import jobs
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            table.create(conn)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine))
+    spooled = tmp_path / "upload-1.pdf"
+    spooled.write_text("page")
+    long_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+    files = [{"filename": "a.pdf", "status": "completed"}, {"filename": "b.pdf", "status": "embedding", "path": str(spooled)}]
+    with database.SessionLocal() as db:
+        db.add_all([
+            models.IngestionJob(id="abandoned", status="running", files=files, updated_at=long_ago),
+            models.IngestionJob(id="recent", status="running", files=files),
+            models.IngestionJob(id="done", status="completed", files=files, updated_at=long_ago),
+        ])
+        db.commit()
+
+    assert jobs.IngestionQueue(parse_workers=0).fail_abandoned_jobs(stale_seconds=60) == ["abandoned"]
+
+    with database.SessionLocal() as db:
+        statuses = {job.id: job.status for job in db.query(models.IngestionJob)}
+        abandoned = db.get(models.IngestionJob, "abandoned")
+    assert statuses == {"abandoned": "failed", "recent": "running", "done": "completed"}
+    assert [f["status"] for f in abandoned.files] == ["completed", "failed"]
+    assert abandoned.files[1]["error"] == jobs.ABANDONED_ERROR
+    assert not spooled.exists()
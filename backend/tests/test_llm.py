@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.llm.router import LLMRouter
+from app.llm.limits import RateLimiter, TokenBucket, call_with_retry, acall_with_retry, is_transient
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = MagicMock(headers={"retry-after": retry_after} if retry_after else {})
+
+
+def test_token_bucket_makes_later_callers_wait_in_order():
+    bucket = TokenBucket(per_minute=60)
+    delays = [bucket.reserve(30, now=0.0) for _ in range(4)]
+    # 60 units up front, then one unit per second
+    assert delays == [0.0, 0.0, 30.0, 60.0]
+    assert bucket.reserve(1, now=61.0) == pytest.approx(0.0)
+
+
+def test_rate_limiter_disabled_by_default():
+    limiter = RateLimiter()
+    for _ in range(1000):
+        assert limiter._reserve(10_000) == 0.0
+
+
+def test_is_transient():
+    assert is_transient(StatusError(429))
+    assert is_transient(StatusError(503))
+    assert not is_transient(StatusError(400))
+    assert not is_transient(ValueError("bad prompt"))
+
+
+def test_call_with_retry_retries_transient_errors():
+    func = MagicMock(side_effect=[StatusError(429, retry_after="2"), StatusError(500), "ok"])
+    with patch("app.llm.limits.time.sleep") as sleep:
+        assert call_with_retry(func, RateLimiter()) == "ok"
+    assert func.call_count == 3
+    assert sleep.call_args_list[0].args == (2.0,)
+
+
+def test_call_with_retry_gives_up():
+    func = MagicMock(side_effect=StatusError(400))
+    with pytest.raises(StatusError):
+        call_with_retry(func, RateLimiter())
+    assert func.call_count == 1
+
+    func = MagicMock(side_effect=StatusError(503))
+    with patch("app.llm.limits.time.sleep"), pytest.raises(StatusError):
+        call_with_retry(func, RateLimiter(), max_retries=2)
+    assert func.call_count == 3
+
+
+def test_acall_with_retry_waits_for_rate_limit():
+    calls = []
+
+    async def func():
+        calls.append(1)
+        return "ok"
+
+    async def no_sleep(delay):
+        calls.append(delay)
+
+    limiter = RateLimiter(requests_per_minute=1)
+    with patch("app.llm.limits.asyncio.sleep", no_sleep):
+        asyncio.run(acall_with_retry(func, limiter))
+        asyncio.run(acall_with_retry(func, limiter))
+    assert calls[0] == 1 and calls[2] == 1
+    assert calls[1] == pytest.approx(60, abs=0.1)
+    assert limiter.throttled == 1
+
+
+class FakeLLM:
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = []
+
+    async def aget_chat_completion(self, prompt, model):
+        self.calls.append(model)
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return f"{model} answer"
+
+    async def astream_chat_completion(self, prompt, model):
+        self.calls.append(model)
+        if self.error:
+            raise self.error
+        yield f"{model} answer"
+
+
+def test_router_fails_over_to_next_candidate():
+    openai, gemini = FakeLLM(error=StatusError(500)), FakeLLM()
+    router = LLMRouter({"openai": openai, "gemini": gemini}, "openai:gpt,gemini:flash", hedge=False)
+
+    assert asyncio.run(router.aget_chat_completion("q")) == "flash answer"
+    # The failed candidate is now ranked last
+    assert router.rank() == [("gemini", "flash"), ("openai", "gpt")]
+
+    async def stream():
+        return [token async for token in router.astream_chat_completion("q", model=["openai:gpt"])]
+
+    with pytest.raises(StatusError):
+        asyncio.run(stream())
+
+
+def test_router_hedges_slow_requests():
+    slow, fast = FakeLLM(delay=1.0), FakeLLM(delay=0.01)
+    router = LLMRouter({"openai": slow, "gemini": fast}, "openai:gpt,gemini:flash")
+
+    with patch("app.llm.router.LLM_HEDGE_MIN_DELAY", 0.05):
+        assert asyncio.run(router.aget_chat_completion("q")) == "flash answer"
+    assert slow.calls == ["gpt"] and fast.calls == ["flash"]
+    assert router.snapshot()["gemini:flash"]["calls"] == 1
+
+
+def test_gemini_stream_skips_chunks_without_text():
+    from app.llm.gemini import gemini_client
+
+    class Chunk:
+        def __init__(self, text=None):
+            self._text = text
+
+        @property
+        def text(self):
+            if self._text is None:
+                raise ValueError("The `response.text` quick accessor only works when the response contains a valid Part")
+            return self._text
+
+    async def chunks():
+        for chunk in (Chunk("Hello"), Chunk(), Chunk(" world"), Chunk()):
+            yield chunk
+
+    model = MagicMock()
+    model.generate_content_async = lambda prompt, stream: asyncio.sleep(0, chunks())
+
+    async def stream():
+        return [token async for token in gemini_client.astream_chat_completion("q")]
+
+    with patch("app.llm.gemini.generative_model", return_value=model):
+        assert asyncio.run(stream()) == ["Hello", " world"]
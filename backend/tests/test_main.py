@@ -1,39 +1,59 @@
 import os
 os.environ["OPENAI_API_KEY"] = "test"
 os.environ["GEMINI_API_KEY"] = "test"
+os.environ["INGEST_PARSE_WORKERS"] = "0"
+os.environ["EMBEDDING_CACHE_PATH"] = ""
 
+import asyncio
+import json
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
-from app.db import database, models
+from app.db import database, migrations, models
 from app.llm.openai import openai_client
+from app.llm.gemini import generative_model
 from app.tools.serpapi import serpapi_client
-from app.vector_store.chroma import chroma_db
-from unittest.mock import MagicMock, patch
+from app.vector_store.retrieval import retriever
+from app.engine.cache import response_cache
+from app.db.chat_logs import chat_log_writer
+from app.lifecycle import Lifecycle
+from app.engine.scheduler import WorkflowScheduler
+from sqlalchemy.exc import OperationalError
+from unittest.mock import AsyncMock, MagicMock, patch
 
 @pytest.fixture
 def mock_fitz():
-    with patch('fitz.open') as mock_open:
+    with patch('app.ingestion.extract.pymupdf.open') as mock_open:
         mock_doc = MagicMock()
         mock_page = MagicMock()
         mock_page.get_text.return_value = "This is a mock PDF."
-        mock_doc.__iter__.return_value = [mock_page]
+        mock_doc.page_count = 1
+        mock_doc.__getitem__.return_value = mock_page
+        mock_doc.__enter__.return_value = mock_doc
         mock_open.return_value = mock_doc
         yield mock_open
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
 @pytest.fixture
 def client():
     return TestClient(app)
 
 @pytest.fixture
-def mock_db():
+def mock_db(monkeypatch):
     database.engine = MagicMock()
     models.Base.metadata.create_all = MagicMock()
+    monkeypatch.setattr(migrations, "add_missing_columns", MagicMock())
     database.SessionLocal = MagicMock()
     db = MagicMock()
     db.add = MagicMock()
     db.commit = MagicMock()
     db.refresh = MagicMock()
+    db.scalar.return_value = None
     database.SessionLocal.return_value = db
     return db
 
@@ -43,31 +63,43 @@ def mock_openai():
     mock_chat_completion.choices[0].message.content = "This is a mock response."
     
     mock_embedding = MagicMock()
-    mock_embedding.data[0].embedding = [0.1, 0.2, 0.3]
+    mock_embedding.data = [MagicMock(embedding=[0.1, 0.2, 0.3], index=0)]
 
-    with patch('app.llm.openai.client') as mock_client:
+    with patch('app.llm.openai.client') as mock_client, patch('app.llm.openai.async_client') as mock_async_client:
         mock_client.chat.completions.create.return_value = mock_chat_completion
         mock_client.embeddings.create.return_value = mock_embedding
+        mock_async_client.chat.completions.create = AsyncMock(return_value=mock_chat_completion)
+        mock_async_client.embeddings.create = AsyncMock(return_value=mock_embedding)
         yield mock_client
 
 @pytest.fixture
 def mock_gemini():
     with patch('app.llm.gemini.genai') as mock_genai:
+        generative_model.cache_clear()
         mock_model = MagicMock()
         mock_model.generate_content.return_value.text = "This is a mock response from Gemini."
+        mock_model.generate_content_async = AsyncMock(return_value=mock_model.generate_content.return_value)
         mock_genai.GenerativeModel.return_value = mock_model
-        mock_genai.embed_content.return_value = {'embedding': [0.4, 0.5, 0.6]}
+        mock_genai.embed_content.return_value = {'embedding': [[0.4, 0.5, 0.6]]}
         yield mock_genai
 
 @pytest.fixture
 def mock_serpapi():
-    serpapi_client.search = MagicMock(return_value={"organic_results": []})
+    serpapi_client.clear()
+    serpapi_client.fetch = AsyncMock(return_value={"organic_results": []})
     return serpapi_client
 
+@pytest.fixture
+def mock_kb_store():
+    with patch('app.endpoints.knowledge_base.vector_store') as mock_store:
+        mock_collection = mock_store.collection.return_value
+        mock_collection.get_documents.return_value = {"ids": [], "metadatas": []}
+        yield mock_collection
+
 @pytest.fixture
 def mock_chroma():
-    chroma_db.query = MagicMock(return_value={'documents': [['mock document']]})
-    return chroma_db
+    with patch.object(retriever, 'search', AsyncMock(return_value=[[{'id': '1', 'text': 'mock document', 'metadata': {}, 'distance': 0.1}]])) as mock_search:
+        yield mock_search
 
 def test_run_workflow_success(client, mock_db, mock_openai, mock_serpapi, mock_chroma):
     workflow = {
@@ -81,7 +113,7 @@ def test_run_workflow_success(client, mock_db, mock_openai, mock_serpapi, mock_c
     }
     response = client.post("/api/workflow/run", json=workflow)
     assert response.status_code == 200
-    assert response.json() == {"response": "This is a mock response."}
+    assert response.json() == {"response": "This is a mock response.", "success": True}
 
 def test_run_workflow_invalid_workflow(client, mock_db):
     workflow = {
@@ -94,7 +126,7 @@ def test_run_workflow_invalid_workflow(client, mock_db):
     }
     response = client.post("/api/workflow/run", json=workflow)
     assert response.status_code == 200
-    assert response.json() == {"response": ""}
+    assert response.json() == {"response": "", "success": True}
 
 def test_run_workflow_with_serpapi(client, mock_db, mock_openai, mock_serpapi, mock_chroma):
     workflow = {
@@ -108,8 +140,8 @@ def test_run_workflow_with_serpapi(client, mock_db, mock_openai, mock_serpapi, m
     }
     response = client.post("/api/workflow/run", json=workflow)
     assert response.status_code == 200
-    assert response.json() == {"response": "This is a mock response."}
-    mock_serpapi.search.assert_called_once_with("What is the capital of France?")
+    assert response.json() == {"response": "This is a mock response.", "success": True}
+    mock_serpapi.fetch.assert_awaited_once_with({"q": "What is the capital of France?"})
 
 def test_run_workflow_with_knowledge_base(client, mock_db, mock_openai, mock_serpapi, mock_chroma):
     workflow = {
@@ -124,18 +156,26 @@ def test_run_workflow_with_knowledge_base(client, mock_db, mock_openai, mock_ser
     }
     response = client.post("/api/workflow/run", json=workflow)
     assert response.status_code == 200
-    assert response.json() == {"response": "This is a mock response."}
-    mock_chroma.query.assert_called_once_with(query_texts=["What is the capital of France?"], n_results=3)
+    assert response.json() == {"response": "This is a mock response.", "success": True}
+    mock_chroma.assert_called_once_with(
+        ["What is the capital of France?"], n_results=3, where=None, provider=None, mode="hybrid", rerank=False,
+        knowledge_bases=["default"],
+    )
 
-def test_upload_documents(client, mock_db, mock_fitz, mock_openai):
+def test_upload_documents(client, mock_db, mock_fitz, mock_openai, mock_kb_store):
     with open("test.pdf", "wb") as f:
         f.write(b"test content")
     
     with open("test.pdf", "rb") as f:
-        response = client.post("/api/knowledge_base/upload", files={"files": ("test.pdf", f, "application/pdf")})
+        response = client.post("/api/knowledge_base/upload", data={"embedding_provider": "openai"}, files={"files": ("test.pdf", f, "application/pdf")})
 
     assert response.status_code == 200
-    assert response.json() == {"message": "1 documents uploaded and processed."}
+    body = response.json()
+    assert body["status"] == "queued"
+    assert body["files"] == 1
+    assert body["job_id"]
+    mock_kb_store.upsert_documents.assert_called_once()
+    assert mock_kb_store.upsert_documents.call_args.kwargs["documents"] == ["This is a mock PDF."]
 
 def test_run_workflow_with_gemini(client, mock_db, mock_gemini, mock_serpapi, mock_chroma):
     workflow = {
@@ -149,9 +189,9 @@ def test_run_workflow_with_gemini(client, mock_db, mock_gemini, mock_serpapi, mo
     }
     response = client.post("/api/workflow/run", json=workflow)
     assert response.status_code == 200
-    assert response.json() == {"response": "This is a mock response from Gemini."}
+    assert response.json() == {"response": "This is a mock response from Gemini.", "success": True}
 
-def test_upload_documents_with_gemini_embeddings(client, mock_db, mock_fitz, mock_gemini):
+def test_upload_documents_with_gemini_embeddings(client, mock_db, mock_fitz, mock_gemini, mock_kb_store):
     with open("test.pdf", "wb") as f:
         f.write(b"test content")
     
@@ -159,4 +199,376 @@ def test_upload_documents_with_gemini_embeddings(client, mock_db, mock_fitz, moc
         response = client.post("/api/knowledge_base/upload?embedding_provider=gemini", files={"files": ("test.pdf", f, "application/pdf")})
 
     assert response.status_code == 200
-    assert response.json() == {"message": "1 documents uploaded and processed."}
+    assert response.json()["status"] == "queued"
+    mock_gemini.embed_content.assert_called_once()
+    assert mock_kb_store.upsert_documents.call_args.kwargs["embeddings"] == [[0.4, 0.5, 0.6]]
+
+def test_get_ingestion_job_not_found(client, mock_db):
+    mock_db.get.return_value = None
+    response = client.get("/api/knowledge_base/jobs/missing")
+    assert response.status_code == 404
+
+def test_run_workflow_stream(client, mock_serpapi, mock_chroma, mock_chat_logs):
+    async def fake_stream(prompt, model):
+        for token in ["Paris", " is", " the capital."]:
+            yield token
+
+    workflow = {
+        "id": 1,
+        "name": "Test Workflow",
+        "definition": [
+            {"id": "1", "type": "user_query", "config": {}},
+            {"id": "2", "type": "llm_engine", "config": {"model": "gpt-3.5-turbo"}},
+            {"id": "3", "type": "output", "config": {}},
+        ],
+        "query": "What is the capital of France?",
+    }
+    with patch.object(openai_client, "astream_chat_completion", fake_stream):
+        response = client.post("/api/workflow/run/stream", json=workflow)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [e["token"] for e in events if e["type"] == "token"] == ["Paris", " is", " the capital."]
+    assert events[-1] == {"type": "done", "response": "Paris is the capital."}
+    mock_chat_logs.assert_called_once_with(
+        workflow_id=1, query="What is the capital of France?", response="Paris is the capital.", session_id=None
+    )
+
+def test_run_workflow_serves_repeated_query_from_cache(client, mock_db, mock_openai, mock_serpapi, mock_chroma):
+    workflow = {
+        "definition": [
+            {"id": "1", "type": "user_query", "config": {}},
+            {"id": "2", "type": "llm_engine", "config": {"model": "gpt-3.5-turbo"}},
+        ],
+        "query": "What is the capital of France?",
+    }
+    from app.llm import openai as llm_openai
+
+    first = client.post("/api/workflow/run", json=workflow)
+    second = client.post("/api/workflow/run", json={**workflow, "query": "  what is the capital of france?"})
+
+    assert first.json()["response"] == second.json()["response"] == "This is a mock response."
+    # Only the first request reaches the provider
+    assert llm_openai.async_client.chat.completions.create.await_count == 1
+    stats = client.get("/api/workflow/cache").json()
+    assert stats["exact_hits"] == 1
+    assert stats["misses"] == 1
+
+def test_run_workflow_batch_streams_ndjson(client, mock_openai, mock_serpapi, mock_chat_logs):
+    queries = ["What is the capital of France?", "What is the capital of Spain?"]
+    hits = [[{'id': str(i), 'text': f'doc {i}', 'metadata': {}, 'distance': 0.1}] for i in range(len(queries))]
+    batch = {
+        "id": 1,
+        "definition": [
+            {"id": "1", "type": "user_query", "config": {}},
+            {"id": "2", "type": "knowledge_base", "config": {"n_results": 2}},
+            {"id": "3", "type": "llm_engine", "config": {"model": "gpt-3.5-turbo"}},
+        ],
+        "queries": queries,
+    }
+    with patch.object(retriever, 'search', AsyncMock(return_value=hits)) as mock_search:
+        response = client.post("/api/workflow/run_batch", json=batch)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+    assert [r["query"] for r in results] == queries
+    assert all(r["response"] == "This is a mock response." for r in results)
+    # One multi-query retrieval for the whole batch; logs go to the write-behind buffer
+    mock_search.assert_called_once_with(
+        queries, n_results=2, where=None, provider=None, mode="hybrid", rerank=False, knowledge_bases=["default"]
+    )
+    assert mock_chat_logs.call_count == 2
+
+def test_run_workflow_sheds_load_with_retry_after(client, mock_serpapi):
+    scheduler = WorkflowScheduler(max_concurrency=1)
+    asyncio.run(scheduler.acquire(client="someone-else"))
+    scheduler.service_time = 12.0
+    workflow = {
+        "definition": [{"id": "1", "type": "user_query", "config": {}}, {"id": "2", "type": "llm_engine", "config": {}}],
+        "query": "What is the capital of France?",
+        "use_cache": False,
+        "deadline": 5,
+    }
+    with patch("app.endpoints.workflow.workflow_scheduler", scheduler):
+        response = client.post("/api/workflow/run", json=workflow)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "12"
+    assert scheduler.stats()["rejected"] == 1
+
+@pytest.fixture
+def mock_chat_logs():
+    with patch.object(chat_log_writer, "add") as mock_add:
+        yield mock_add
+
+@pytest.fixture
+def sqlite_db(monkeypatch):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import StaticPool
+    from app.engine.plans import plan_cache
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    def create_tables_sync(conn):
+        # mock_db replaces metadata.create_all, so create tables one by one
+        for table in models.Base.metadata.sorted_tables:
+            table.create(conn)
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(create_tables_sync)
+
+    asyncio.run(create_tables())
+    monkeypatch.setattr(database, "AsyncSessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+    plan_cache.clear()
+    yield plan_cache
+    plan_cache.clear()
+    asyncio.run(engine.dispose())
+
+def test_saved_workflow_crud_and_run_by_id(client, sqlite_db, mock_openai, mock_serpapi, mock_chat_logs):
+    workflow = {
+        "name": "Capitals",
+        "definition": [
+            {"id": "1", "type": "user_query", "config": {}},
+            {"id": "2", "type": "llm_engine", "config": {"model": "gpt-3.5-turbo"}},
+        ],
+        "edges": [{"source": "1", "target": "2"}],
+    }
+    created = client.post("/api/workflow/", json=workflow).json()
+    workflow_id = created["id"]
+    assert created["name"] == "Capitals"
+    assert client.get("/api/workflow/").json()[0]["id"] == workflow_id
+
+    sqlite_db.clear()
+    for _ in range(2):
+        response = client.post(f"/api/workflow/{workflow_id}/run", json={"query": "Capital of France?", "use_cache": False})
+        assert response.json()["response"] == "This is a mock response."
+    assert sqlite_db.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+    workflow["definition"][1]["config"]["model"] = "gpt-4"
+    assert client.put(f"/api/workflow/{workflow_id}", json=workflow).status_code == 200
+    client.post(f"/api/workflow/{workflow_id}/run", json={"query": "Capital of France?", "use_cache": False})
+    from app.llm import openai as openai_module
+    assert openai_module.async_client.chat.completions.create.call_args.kwargs["model"] == "gpt-4"
+
+    assert client.delete(f"/api/workflow/{workflow_id}").status_code == 200
+    assert client.post(f"/api/workflow/{workflow_id}/run", json={"query": "q"}).status_code == 404
+    assert client.get(f"/api/workflow/{workflow_id}").status_code == 404
+
+def test_saved_workflow_rejects_cycles(client, sqlite_db):
+    workflow = {
+        "definition": [
+            {"id": "1", "type": "llm_engine", "config": {}},
+            {"id": "2", "type": "llm_engine", "config": {}},
+        ],
+        "edges": [{"source": "1", "target": "2"}, {"source": "2", "target": "1"}],
+    }
+    assert client.post("/api/workflow/", json=workflow).status_code == 400
+
+def test_chat_log_writer_batches_inserts(sqlite_db):
+    from sqlalchemy import func, select
+    from app.db.chat_logs import ChatLogWriter
+
+    writer = ChatLogWriter(batch_size=2, interval=60)
+
+    async def run():
+        for index in range(5):
+            writer.add(workflow_id=1, query=f"q{index}", response="a")
+        assert writer.pending == 5
+        await writer.close()
+        async with database.AsyncSessionLocal() as db:
+            return await db.scalar(select(func.count()).select_from(models.ChatLog))
+
+    assert asyncio.run(run()) == 5
+    assert writer.pending == 0 and writer.written == 5
+
+def test_history_is_keyset_paginated_and_fed_to_the_prompt(client, sqlite_db, mock_openai):
+    from app.db.chat_logs import ChatLogWriter
+    from app.engine.history import conversation_history
+
+    writer = ChatLogWriter(interval=60)
+
+    async def seed():
+        for index in range(5):
+            writer.add(workflow_id=7, query=f"q{index}", response=f"a{index}", session_id="s1")
+        writer.add(workflow_id=7, query="other", response="x", session_id="s2")
+        await writer.close()
+
+    asyncio.run(seed())
+
+    first = client.get("/api/workflow/7/history", params={"session_id": "s1", "limit": 3}).json()
+    assert [item["query"] for item in first["items"]] == ["q4", "q3", "q2"]
+    second = client.get(
+        "/api/workflow/7/history", params={"session_id": "s1", "limit": 3, "before": first["next_cursor"]}
+    ).json()
+    assert [item["query"] for item in second["items"]] == ["q1", "q0"]
+    assert second["next_cursor"] is None
+
+    block = asyncio.run(conversation_history.prompt_block("s1", 2))
+    assert block == "User: q3\nAssistant: a3\nUser: q4\nAssistant: a4"
+
+    workflow = {
+        "definition": [
+            {"id": "1", "type": "user_query", "config": {}},
+            {"id": "2", "type": "llm_engine", "config": {"model": "gpt-3.5-turbo", "history_turns": 2}},
+        ],
+        "query": "and the next one?",
+        "session_id": "s1",
+    }
+    with patch.object(conversation_history, "schedule_refresh") as mock_refresh, \
+            patch.object(chat_log_writer, "add"):
+        response = client.post("/api/workflow/run", json=workflow)
+    assert response.json()["response"] == "This is a mock response."
+    from app.llm import openai as openai_module
+    prompt = openai_module.async_client.chat.completions.create.call_args.kwargs["messages"][0]["content"]
+    assert prompt.startswith("Conversation so far:\nUser: q3")
+    assert mock_refresh.call_args.args[:2] == ("s1", 2)
+
+def test_refresh_summary_folds_older_turns(sqlite_db):
+    from app.db.chat_logs import ChatLogWriter
+    from app.engine.history import conversation_history
+
+    writer = ChatLogWriter(interval=60)
+    prompts = []
+
+    async def summarize(prompt):
+        prompts.append(prompt)
+        return "talked about q0 to q2"
+
+    async def run():
+        for index in range(5):
+            writer.add(workflow_id=1, query=f"q{index}", response=f"a{index}", session_id="s1")
+        await writer.close()
+        await conversation_history.refresh_summary("s1", 2, summarize)
+        # Nothing new to fold on a second pass
+        await conversation_history.refresh_summary("s1", 2, summarize)
+        return await conversation_history.prompt_block("s1", 2)
+
+    block = asyncio.run(run())
+    assert len(prompts) == 1
+    assert "User: q2" in prompts[0] and "q3" not in prompts[0]
+    assert block.startswith("Summary of earlier conversation: talked about q0 to q2\nUser: q3")
+
+def test_metrics_endpoint_reports_stages_tokens_and_caches(client, mock_db, mock_openai, mock_serpapi, mock_chroma):
+    workflow = {
+        "definition": [
+            {"id": "1", "type": "user_query", "config": {}},
+            {"id": "2", "type": "knowledge_base", "config": {}},
+            {"id": "3", "type": "llm_engine", "config": {"model": "gpt-3.5-turbo"}},
+        ],
+        "query": "What is the capital of France?",
+    }
+    client.post("/api/workflow/run", json=workflow)
+    mock_db.get.return_value = None
+    client.get("/api/knowledge_base/jobs/missing-job")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'workflow_stage_seconds_count{stage="knowledge_base"}' in body
+    assert 'workflow_stage_seconds_count{stage="llm_engine"}' in body
+    assert 'llm_tokens_total{model="gpt-3.5-turbo",provider="openai",type="prompt"}' in body
+    assert 'cache_lookups_total{cache="response",result="misses"}' in body
+    assert 'http_request_seconds_count{method="POST",route="/api/workflow/run",status="200"}' in body
+    assert 'http_request_seconds_count{method="GET",route="/api/knowledge_base/jobs/{job_id}",status="404"}' in body
+    assert 'queue_depth{queue="chat_logs"}' in body
+
+def test_web_search_caches_coalesces_and_merges_reformulations(mock_serpapi):
+    results = {
+        "q1": {"organic_results": [{"link": "a", "snippet": "A"}, {"link": "b", "snippet": "B"}]},
+        "q1 docs": {"organic_results": [{"link": "b", "snippet": "B"}, {"link": "c", "snippet": "C"}]},
+    }
+
+    async def fetch(params):
+        await asyncio.sleep(0.01)
+        return results[params["q"]]
+
+    mock_serpapi.fetch = AsyncMock(side_effect=fetch)
+
+    async def run():
+        # Identical concurrent searches share one call; a repeat is a cache hit
+        await asyncio.gather(mock_serpapi.asearch("q1"), mock_serpapi.asearch(" Q1 "))
+        await mock_serpapi.asearch("q1")
+        return await mock_serpapi.asearch_many(["q1", "q1 docs"])
+
+    merged = asyncio.run(run())
+    assert [item["link"] for item in merged] == ["a", "b", "c"]
+    assert mock_serpapi.fetch.await_count == 2
+    assert mock_serpapi.stats() == {"entries": 2, "hits": 2, "misses": 2, "coalesced": 1}
+
+
+def test_health_probes_report_liveness_before_startup_finishes(client):
+    assert client.get("/health/live").json() == {"status": "alive"}
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"]["database"] == "pending"
+
+
+def test_lifecycle_retries_schema_creation_until_database_is_up():
+    lifecycle = Lifecycle()
+    create_all = MagicMock(side_effect=[OperationalError("CREATE TABLE", {}, Exception("connection refused")), None])
+    with patch("app.lifecycle.DB_CONNECT_BACKOFF", 0), \
+            patch.object(models.Base.metadata, "create_all", create_all), \
+            patch.object(migrations, "add_missing_columns", MagicMock()), \
+            patch("app.lifecycle._ping_database", AsyncMock()):
+        asyncio.run(lifecycle.init_database())
+        ready, checks = asyncio.run(lifecycle.readiness())
+
+    assert create_all.call_count == 2
+    assert ready
+    assert checks["database"] == "ok"
+
+
+
+def test_add_missing_columns_upgrades_a_database_from_before_the_new_columns(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE documents (id INTEGER PRIMARY KEY, name VARCHAR, meta_data JSON, "
+                          "created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"))
+        conn.execute(text("INSERT INTO documents (name, meta_data) VALUES ('manual.pdf', '{}')"))
+    with engine.begin() as conn:
+        # mock_db replaces metadata.create_all, so create tables one by one
+        for table in models.Base.metadata.sorted_tables:
+            table.create(conn, checkfirst=True)
+
+    migrations.add_missing_columns(engine)
+    migrations.add_missing_columns(engine)
+
+    inspector = inspect(engine)
+    assert {c["name"] for c in inspector.get_columns("documents")} >= {
+        "document_key", "knowledge_base", "content_hash", "version", "updated_at"
+    }
+    assert "ix_documents_document_key" in {i["name"] for i in inspector.get_indexes("documents")}
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT knowledge_base, version, updated_at FROM documents")).one()
+    assert row.knowledge_base == "default"
+    assert row.version == 1
+    assert row.updated_at is not None
+
+
+def test_serpapi_http_client_is_recreated_after_shutdown_closes_it():
+    from app.tools import serpapi
+
+    first = serpapi.get_http_client()
+    asyncio.run(serpapi_client.close())
+
+    assert first.is_closed
+    second = serpapi.get_http_client()
+    assert second is not first and not second.is_closed
+
+
+def test_lifecycle_retries_required_warmups_until_they_pass():
+    lifecycle = Lifecycle()
+    open_store = MagicMock(side_effect=[RuntimeError("chroma unavailable"), None])
+    with patch("app.lifecycle.DB_CONNECT_BACKOFF", 0):
+        asyncio.run(lifecycle._warm("vector_store", open_store))
+        asyncio.run(lifecycle._warm("gemini", MagicMock(side_effect=RuntimeError("no key"))))
+
+    assert open_store.call_count == 2
+    assert lifecycle.checks["vector_store"] == "ok"
+    assert lifecycle.checks["gemini"].startswith("failed")
@@ -0,0 +1,35 @@
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest
+
+from app.metrics import add_collector, record_llm_usage, stats_families
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_scrape_collectors_report_stats_and_survive_failures():
+    registry = CollectorRegistry()
+
+    def collect():
+        cache_lookups, cache_hit_ratio, _, _ = stats_families()
+        cache_lookups.add_metric(["plan", "hits"], 3)
+        cache_hit_ratio.add_metric(["plan"], 0.75)
+        return [cache_lookups, cache_hit_ratio]
+
+    def broken():
+        raise RuntimeError("stats unavailable")
+
+    add_collector(collect, registry)
+    add_collector(broken, registry)
+
+    body = generate_latest(registry).decode()
+    assert 'cache_lookups_total{cache="plan",result="hits"} 3.0' in body
+    assert 'cache_hit_ratio{cache="plan"} 0.75' in body
+
+
+def test_record_llm_usage_prefers_reported_tokens_and_prices_them():
+    before = sample("llm_cost_usd_total", provider="openai", model="gpt-4")
+    record_llm_usage("openai", "gpt-4", "prompt", "answer", prompt_tokens=1000, completion_tokens=500)
+
+    assert sample("llm_tokens_total", provider="openai", model="gpt-4", type="completion") >= 500
+    assert round(sample("llm_cost_usd_total", provider="openai", model="gpt-4") - before, 6) == 0.06
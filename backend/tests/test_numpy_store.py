@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from app.vector_store import numpy_store
+from app.vector_store.numpy_store import NumpyStore
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_upsert_query_and_filters(tmp_path):
+    collection = NumpyStore(str(tmp_path)).collection("openai", "small")
+    collection.upsert_documents(
+        documents=["cats", "dogs", "birds"],
+        metadatas=[{"filename": "a.pdf"}, {"filename": "b.pdf"}, {"filename": "a.pdf"}],
+        ids=["1", "2", "3"],
+        embeddings=[unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)],
+    )
+
+    results = collection.query([unit(1, 0.1, 0), unit(0, 0, 1)], n_results=2)
+    assert [ids[0] for ids in results["ids"]] == ["1", "3"]
+    assert results["distances"][0][0] == pytest.approx(1 - unit(1, 0.1, 0)[0], abs=1e-5)
+
+    filtered = collection.query([unit(0, 1, 0)], n_results=3, where={"filename": "a.pdf"})
+    assert sorted(filtered["ids"][0]) == ["1", "3"]
+    assert collection.get_documents(["2", "9"]) == {"ids": ["2"], "metadatas": [{"filename": "b.pdf"}]}
+
+
+def test_tombstones_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_store, "NUMPY_COMPACT_RATIO", 0.5)
+    store = NumpyStore(str(tmp_path))
+    collection = store.collection("gemini", "embedding-001")
+    collection.upsert_documents(["a", "b", "c", "d"], [{}] * 4, ["a", "b", "c", "d"],
+                                [unit(1, 0), unit(0, 1), unit(1, 1), unit(1, -1)])
+
+    collection.upsert_documents(["b2"], [{}], ["b"], [unit(0, 1)])
+    assert collection.count() == 4
+    assert collection.query([unit(0, 1)], n_results=1)["documents"] == [["b2"]]
+
+    collection.delete_documents(["a", "c"])
+    # 3 of 5 rows were tombstoned, which crossed the ratio and compacted the file
+    assert collection._read_manifest()["rows"] == 2
+    assert sorted(collection.query([unit(1, 0)], n_results=5)["ids"][0]) == ["b", "d"]
+
+    reopened = NumpyStore(str(tmp_path))
+    assert [c.model for c in reopened.collections()] == ["embedding-001"]
+    assert reopened.collection("gemini", "embedding-001").count() == 2
+
+
+def test_query_against_state_from_before_compaction_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_store, "NUMPY_COMPACT_RATIO", 1.1)
+    collection = NumpyStore(str(tmp_path)).collection("openai", "small")
+    collection.upsert_documents(["a", "b", "c"], [{}] * 3, ["a", "b", "c"], [unit(1, 0), unit(0, 1), unit(1, 1)])
+    before = collection._load()
+
+    collection.delete_documents(["a"])
+    collection.compact()
+
+    # Row 1 was "b" before compaction and is "c" after it
+    with pytest.raises(numpy_store.StaleState):
+        collection._query(before, [unit(0, 1)], 1, None)
+    assert collection.query([unit(0, 1)], n_results=1)["ids"] == [["b"]]
+    assert collection._read_manifest()["generation"] == 1
+
+
+def test_ivf_index_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(400, 8)).astype(np.float32)
+    collection = NumpyStore(str(tmp_path)).collection("openai", "small")
+    ids = [str(i) for i in range(400)]
+    collection.upsert_documents(ids, [{}] * 400, ids, vectors)
+
+    queries = vectors[:5]
+    exact = collection.query(queries, n_results=1)["ids"]
+    collection.build_index(n_lists=4)
+    assert collection._load()["index"] is not None
+    approximate = collection.query(queries, n_results=1)["ids"]
+
+    assert approximate == exact == [[str(i)] for i in range(5)]
+
+
+def test_failed_upsert_leaves_no_misaligned_vectors(tmp_path, monkeypatch):
+    collection = NumpyStore(str(tmp_path)).collection("openai", "small")
+    collection.upsert_documents(["a", "b"], [{}] * 2, ["a", "b"], [unit(1, 0, 0), unit(0, 1, 0)])
+
+    with pytest.raises(ValueError):
+        collection.upsert_documents(["x", "y"], [{}] * 2, ["x", "x"], [unit(1, 1, 0), unit(1, 1, 1)])
+
+    write_vectors = collection._write_vectors
+
+    def write_then_fail(manifest, start, vectors):
+        # Disk full after part of the batch reached the file
+        write_vectors(manifest, start, vectors)
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(collection, "_write_vectors", write_then_fail)
+    with pytest.raises(OSError):
+        collection.upsert_documents(["x", "y"], [{}] * 2, ["x", "y"], [unit(1, 1, 0), unit(1, 1, 1)])
+    monkeypatch.undo()
+
+    collection.upsert_documents(["c"], [{}], ["c"], [unit(0, 0, 1)])
+    results = collection.query([unit(0, 0, 1), unit(1, 0, 0)], n_results=1)
+    assert [ids[0] for ids in results["ids"]] == ["c", "a"]
+    assert results["distances"][0][0] == pytest.approx(0, abs=1e-5)
+    assert collection.count() == 3
@@ -0,0 +1,161 @@
+import asyncio
+
+import chromadb
+from unittest.mock import AsyncMock, patch
+
+from app.vector_store.chroma import ChromaDB, collection_name
+from app.vector_store.bm25 import BM25Index
+from app.vector_store.retrieval import Retriever, reciprocal_rank_fusion, rerank_hits
+
+
+def make_store():
+    store = ChromaDB()
+    store.client = chromadb.EphemeralClient()
+    for name in [c if isinstance(c, str) else c.name for c in store.client.list_collections()]:
+        store.client.delete_collection(name)
+    return store
+
+
+def test_collection_name_is_valid_for_chroma():
+    assert collection_name("gemini", "models/embedding-001") == "documents__gemini__models-embedding-001"
+
+
+def test_retriever_embeds_queries_with_each_collections_model():
+    store = make_store()
+    store.collection("openai", "small").upsert_documents(
+        documents=["cats", "dogs"], metadatas=[{"kind": "a"}, {"kind": "b"}],
+        ids=["o1", "o2"], embeddings=[[1.0, 0.0], [0.0, 1.0]],
+    )
+    store.collection("gemini", "embedding-001").upsert_documents(
+        documents=["birds"], metadatas=[{"kind": "a"}], ids=["g1"], embeddings=[[0.0, 1.0, 0.0]],
+    )
+    openai = AsyncMock()
+    openai.aget_embeddings.return_value = [[1.0, 0.0], [0.6, 0.8]]
+    gemini = AsyncMock()
+    gemini.aget_embeddings.return_value = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+    retriever = Retriever(store, {"openai": openai, "gemini": gemini})
+
+    results = asyncio.run(retriever.search(["feline", "avian"], n_results=2))
+
+    openai.aget_embeddings.assert_awaited_once_with(["feline", "avian"], model="small")
+    gemini.aget_embeddings.assert_awaited_once_with(["feline", "avian"], model="embedding-001")
+    # Each collection's best hit for its own query embedding, fused by rank
+    assert [sorted(hit["text"] for hit in hits) for hits in results] == [["birds", "cats"], ["birds", "dogs"]]
+
+    filtered = asyncio.run(retriever.search(["feline"], n_results=5, where={"kind": "b"}, provider="openai"))
+    assert [hit["text"] for hit in filtered[0]] == ["dogs"]
+
+
+def test_collections_reuses_handles_until_a_collection_is_created_or_deleted():
+    store = make_store()
+    store.collection("openai", "small").upsert_documents(
+        documents=["cats"], metadatas=[{"kind": "a"}], ids=["o1"], embeddings=[[1.0, 0.0]],
+    )
+    store._handles, store._collections, store._names = {}, {}, None
+    with patch.object(store.client, "list_collections", wraps=store.client.list_collections) as listed, \
+            patch.object(store.client, "get_collection", wraps=store.client.get_collection) as opened:
+        assert [c.model for c in store.collections()] == ["small"]
+        assert [c.model for c in store.collections()] == ["small"]
+        store.collection("openai", "large", "hr")
+        assert sorted(c.model for c in store.collections()) == ["large", "small"]
+        store.delete_collection("openai", "small")
+        assert [c.model for c in store.collections()] == ["large"]
+
+    assert listed.call_count == 1
+    assert opened.call_count == 1
+
+
+def test_bm25_index_updates_incrementally(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add(
+        ["a", "b", "c"],
+        ["the quick brown fox", "a lazy dog sleeps", "brown bears and brown foxes"],
+        [{"filename": "x.pdf"}, {"filename": "x.pdf"}, {"filename": "y.pdf"}],
+    )
+    assert [hit["id"] for hit in index.search(["brown fox"], n_results=3)[0]] == ["a", "c"]
+    assert [hit["id"] for hit in index.search(["brown"], where={"filename": "y.pdf"})[0]] == ["c"]
+
+    # Re-adding an id replaces its postings; deleting removes them
+    index.add(["a"], ["a sleepy cat"], [{"filename": "x.pdf"}])
+    assert [hit["id"] for hit in index.search(["fox"])[0]] == []
+    index.delete(["b"])
+    assert [hit["id"] for hit in index.search(["sleeps cat"])[0]] == ["a"]
+
+
+def test_search_is_scoped_to_the_named_knowledge_bases(tmp_path):
+    store = make_store()
+    keyword_index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    corpora = {"default": ("d1", "default cats"), "hr": ("h1", "hr cats"), "legal": ("l1", "legal cats")}
+    for knowledge_base, (id, text) in corpora.items():
+        store.collection("openai", "small", knowledge_base).upsert_documents(
+            documents=[text], metadatas=[{"knowledge_base": knowledge_base}], ids=[id], embeddings=[[1.0, 0.0]],
+        )
+        keyword_index.shard(knowledge_base).add([id], [text], [{"knowledge_base": knowledge_base}])
+    openai = AsyncMock()
+    openai.aget_embeddings.return_value = [[1.0, 0.0]]
+    retriever = Retriever(store, {"openai": openai}, keyword_index=keyword_index)
+
+    def ids(**options):
+        return sorted(hit["id"] for hit in asyncio.run(retriever.search(["cats"], n_results=5, **options))[0])
+
+    assert ids(knowledge_bases=["hr"]) == ["h1"]
+    assert ids(knowledge_bases=["hr", "legal"], mode="sparse") == ["h1", "l1"]
+    assert ids(knowledge_bases=["hr", "legal"], mode="dense") == ["h1", "l1"]
+    assert ids(knowledge_bases=["missing"]) == []
+    assert ids() == ["d1", "h1", "l1"]
+    # Shards of several knowledge bases share one query embedding
+    assert openai.aget_embeddings.await_count == 3
+    assert keyword_index.knowledge_bases() == ["default", "hr", "legal"]
+
+
+def test_keyword_search_fuses_shards_by_rank_not_raw_score(tmp_path):
+    keyword_index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    # "cats" is rare in hr, so its BM25 scores dwarf those from legal, where it is common
+    keyword_index.shard("hr").add(
+        [f"h{i}" for i in range(10)], ["cats cats", "cats"] + ["dogs"] * 8, [{}] * 10
+    )
+    keyword_index.shard("legal").add(["l1", "l2", "l3", "l4"], ["cats cats", "cats", "cats", "dogs"], [{}] * 4)
+
+    hits = asyncio.run(keyword_index.asearch(["cats"], n_results=2, knowledge_bases=["hr", "legal"]))[0]
+
+    assert sorted(hit["id"] for hit in hits) == ["h0", "l1"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [{"id": "x", "text": "x", "distance": 0.1}, {"id": "y", "text": "y", "distance": 0.2}]
+    sparse = [{"id": "y", "text": "y", "score": 3.0}, {"id": "z", "text": "z", "score": 1.0}]
+
+    fused = reciprocal_rank_fusion([dense, sparse])
+
+    assert [hit["id"] for hit in fused] == ["y", "x", "z"]
+    assert fused[0]["distance"] == 0.2
+
+
+def test_rerank_orders_by_query_term_coverage():
+    hits = [
+        {"id": "1", "text": "paris is large"},
+        {"id": "2", "text": "the capital of france is paris"},
+        {"id": "3", "text": "france capital city"},
+    ]
+    assert [hit["id"] for hit in rerank_hits("capital of France", hits)] == ["2", "3", "1"]
+
+
+def test_retriever_fuses_dense_and_keyword_hits(tmp_path):
+    store = make_store()
+    store.collection("openai", "small").upsert_documents(
+        documents=["cats purr", "error code E1234 means overheating"], metadatas=[{"kind": "a"}, {"kind": "b"}],
+        ids=["d1", "d2"], embeddings=[[1.0, 0.0], [0.0, 1.0]],
+    )
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add(["d1", "d2"], ["cats purr", "error code E1234 means overheating"], [{}, {}])
+    openai = AsyncMock()
+    openai.aget_embeddings.return_value = [[1.0, 0.0]]
+    retriever = Retriever(store, {"openai": openai}, keyword_index=index)
+
+    dense = asyncio.run(retriever.search(["E1234"], n_results=1, mode="dense"))
+    sparse = asyncio.run(retriever.search(["E1234"], n_results=1, mode="sparse"))
+    hybrid = asyncio.run(retriever.search(["E1234"], n_results=2, rerank=True))
+
+    assert dense[0][0]["id"] == "d1"
+    assert sparse[0][0]["id"] == "d2"
+    assert [hit["id"] for hit in hybrid[0]] == ["d2", "d1"]
@@ -1,11 +1,12 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 import { Send } from 'lucide-react';
 
-export default function Chat({ workflow }) {
+export default function Chat({ workflowId }) {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
+  // One session per open chat, so engines with history see this conversation
+  const [sessionId] = useState(() => crypto.randomUUID());
 
   const handleSend = async () => {
     if (!input.trim() || loading) return;
@@ -16,19 +17,48 @@ export default function Chat({ workflow }) {
     setLoading(true);
 
     try {
-      const response = await axios.post('http://127.0.0.1:8000/api/workflow/run', {
-        query: input,
-        definition: workflow.nodes.map(node => ({
-          id: node.id,
-          type: node.type,
-          config: node.data || {}
-        }))
+      // The stack is saved before chat opens, so only the query is sent
+      const response = await fetch(`http://127.0.0.1:8000/api/workflow/${workflowId}/run/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ query: input, session_id: sessionId })
       });
+      if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || response.statusText);
+      }
 
-      const aiMessage = { role: 'assistant', content: response.data.response || 'No response' };
-      setMessages(prev => [...prev, aiMessage]);
+      // Show tokens as they arrive, then replace with the final response
+      setMessages(prev => [...prev, { role: 'assistant', content: '' }]);
+      const updateAssistant = (update) => setMessages(prev => {
+        const next = [...prev];
+        next[next.length - 1] = update(next[next.length - 1]);
+        return next;
+      });
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          if (!raw.startsWith('data: ')) continue;
+          const event = JSON.parse(raw.slice(6));
+          if (event.type === 'token') {
+            updateAssistant(msg => ({ ...msg, content: msg.content + event.token }));
+          } else if (event.type === 'done') {
+            updateAssistant(msg => ({ ...msg, content: event.response || 'No response' }));
+          } else if (event.type === 'error') {
+            updateAssistant(() => ({ role: 'error', content: 'Error: ' + event.detail }));
+          }
+        }
+      }
     } catch (error) {
-      const errorMessage = { role: 'error', content: 'Error: ' + (error.response?.data?.detail || error.message) };
+      const errorMessage = { role: 'error', content: 'Error: ' + error.message };
       setMessages(prev => [...prev, errorMessage]);
     } finally {
       setLoading(false);
@@ -1,13 +1,23 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Plus } from 'lucide-react';
 
 export default function MyStacks() {
   const navigate = useNavigate();
   
-  const stacks = [
-   
-  ];
+  const [stacks, setStacks] = useState([]);
+
+  useEffect(() => {
+    fetch('http://127.0.0.1:8000/api/workflow/')
+      .then(response => (response.ok ? response.json() : []))
+      .then(workflows => setStacks(workflows.map(workflow => ({
+        id: workflow.id,
+        name: workflow.name,
+        icon: '🧩',
+        description: `${workflow.definition.length} components`,
+      }))))
+      .catch(() => setStacks([]));
+  }, []);
 
   return (
     <div className="min-h-screen bg-gradient-to-br from-blue-50 to-indigo-100 p-8">
@@ -1,4 +1,4 @@
-import React, { useState, useCallback, useMemo } from 'react';
+import React, { useState, useCallback, useMemo, useEffect } from 'react';
 import ReactFlow, {
   ReactFlowProvider,
   addEdge,
@@ -13,13 +13,23 @@ import UserQueryNode from './nodes/UserQueryNode';
 import KnowledgeBaseNode from './nodes/KnowledgeBaseNode';
 import LLMEngineNode from './nodes/LLMEngineNode';
 import OutputNode from './nodes/OutputNode';
-import { useNavigate } from 'react-router-dom';
+import { useNavigate, useParams } from 'react-router-dom';
 import { ArrowLeft, Play, MessageSquare } from 'lucide-react';
 import Chat from './Chat';
 import { toast } from 'react-toastify';
 
 const initialNodes = [];
 const id = () => `dndnode_${+new Date()}`;
+const API_URL = 'http://127.0.0.1:8000/api/workflow';
+
+// Saved workflows keep the components and edges the backend runs, plus node
+// positions so the canvas can be redrawn.
+const toWorkflow = (name, nodes, edges) => ({
+    name,
+    definition: nodes.map(node => ({ id: node.id, type: node.type, config: node.data || {} })),
+    edges: edges.map(edge => ({ source: edge.source, target: edge.target })),
+    layout: Object.fromEntries(nodes.map(node => [node.id, node.position])),
+});
 
 const WorkflowBuilder = () => {
     const navigate = useNavigate();
@@ -27,6 +37,52 @@ const WorkflowBuilder = () => {
     const [edges, setEdges, onEdgesChange] = useEdgesState([]);
     const [reactFlowInstance, setReactFlowInstance] = useState(null);
     const [isChatOpen, setChatOpen] = useState(false);
+    const { stackId } = useParams();
+    const [workflowId, setWorkflowId] = useState(stackId !== 'new' ? stackId : null);
+    const [name, setName] = useState('Untitled Stack');
+
+    useEffect(() => {
+        if (!stackId || stackId === 'new') return;
+        fetch(`${API_URL}/${stackId}`)
+            .then(response => {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.json();
+            })
+            .then(workflow => {
+                const layout = workflow.layout || {};
+                setName(workflow.name);
+                setNodes(workflow.definition.map((component, index) => ({
+                    id: component.id,
+                    type: component.type,
+                    position: layout[component.id] || { x: index * 250, y: 100 },
+                    data: component.config,
+                })));
+                setEdges((workflow.edges || []).map(edge => ({
+                    id: `e${edge.source}-${edge.target}`,
+                    source: edge.source,
+                    target: edge.target,
+                })));
+            })
+            .catch(error => toast.error('Could not load stack: ' + error.message));
+    }, [stackId, setNodes, setEdges]);
+
+    const saveWorkflow = async () => {
+        const response = await fetch(workflowId ? `${API_URL}/${workflowId}` : `${API_URL}/`, {
+            method: workflowId ? 'PUT' : 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(toWorkflow(name, nodes, edges)),
+        });
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.detail || response.statusText);
+        }
+        const saved = await response.json();
+        if (!workflowId) {
+            setWorkflowId(saved.id);
+            navigate(`/editor/${saved.id}`, { replace: true });
+        }
+        return saved;
+    };
 
     const nodeTypes = useMemo(() => ({ 
         userQuery: UserQueryNode,
@@ -75,7 +131,11 @@ const WorkflowBuilder = () => {
                 <button onClick={() => navigate('/')} className="p-2 text-slate-500 hover:text-slate-800 hover:bg-slate-100 rounded-full transition-colors">
                     <ArrowLeft size={18} />
                 </button>
-                <span className="font-semibold text-slate-800 text-sm">Workflow Builder</span>
+                <input
+                    value={name}
+                    onChange={(e) => setName(e.target.value)}
+                    className="font-semibold text-slate-800 text-sm bg-transparent outline-none border-b border-transparent focus:border-slate-300"
+                />
             </div>
         </div>
 
@@ -104,12 +164,18 @@ const WorkflowBuilder = () => {
             <div className="absolute bottom-6 right-6 flex flex-col gap-3 z-50">
                  <button 
                     className="flex items-center gap-2 px-4 py-3 bg-emerald-500 hover:bg-emerald-600 text-white rounded-full shadow-lg font-semibold text-sm transition-all"
-                    onClick={() => {
+                    onClick={async () => {
                          if (nodes.length < 2 || edges.length === 0) {
                             toast.warning('Please create a valid workflow (at least 2 connected nodes).');
                             return;
                         }
-                        toast.success('Workflow validated! Opening chat...');
+                        try {
+                            await saveWorkflow();
+                        } catch (error) {
+                            toast.error('Could not save stack: ' + error.message);
+                            return;
+                        }
+                        toast.success('Workflow saved! Opening chat...');
                         setChatOpen(true);
                     }}
                  >
@@ -129,7 +195,7 @@ const WorkflowBuilder = () => {
                         </button>
                     </div>
                     <div className="flex-1 overflow-hidden">
-                        <Chat workflow={{ nodes, edges }} />
+                        <Chat workflowId={workflowId} />
                     </div>
                 </div>
             </div>
@@ -37,6 +37,18 @@ export default memo(({ id, data }) => {
             <span className="text-xs font-medium text-slate-500 ml-2">Query</span>
         </div>
 
+        <div className="flex flex-col gap-1.5">
+            <label className="text-xs font-medium text-slate-600">Knowledge Bases</label>
+            <input
+                type="text"
+                name="knowledge_bases"
+                className="w-full px-3 py-2 border border-slate-300 rounded-md text-sm text-slate-800 bg-white outline-none focus:border-blue-500 transition-all nodrag"
+                placeholder="default"
+                defaultValue={data.knowledge_bases}
+                onChange={onChange}
+            />
+        </div>
+
         <div className="flex flex-col gap-1.5">
             <label className="text-xs font-medium text-slate-600">File for Knowledge Base</label>
             <div 
@@ -62,6 +74,9 @@ export default memo(({ id, data }) => {
 
                     const formData = new FormData();
                     formData.append('files', file);
+                    // Uploads go into the first knowledge base listed
+                    const knowledgeBase = (data.knowledge_bases || '').split(',')[0].trim();
+                    formData.append('knowledge_base', knowledgeBase || 'default');
 
                     const uploadToast = toast.loading('Uploading file...');
 
@@ -71,7 +86,19 @@ export default memo(({ id, data }) => {
                             body: formData,
                         });
                         
-                        if (response.ok) {
+                        const result = await response.json();
+                        if (response.ok && result.job_id) {
+                            toast.update(uploadToast, { render: 'Processing file...' });
+                            let job = { status: 'queued' };
+                            while (job.status === 'queued' || job.status === 'running') {
+                                await new Promise((resolve) => setTimeout(resolve, 1000));
+                                const jobResponse = await fetch(`http://127.0.0.1:8000/api/knowledge_base/jobs/${result.job_id}`);
+                                job = await jobResponse.json();
+                            }
+                            if (job.status !== 'completed') {
+                                const failedFile = (job.files || []).find((f) => f.status === 'failed');
+                                throw new Error(failedFile?.error || 'Processing failed');
+                            }
                             toast.update(uploadToast, {
                                 render: 'File uploaded successfully!',
                                 type: 'success',
@@ -87,9 +114,8 @@ export default memo(({ id, data }) => {
                                 })
                             );
                         } else {
-                            const error = await response.json();
                             toast.update(uploadToast, {
-                                render: `Upload failed: ${error.detail || 'Unknown error'}`,
+                                render: `Upload failed: ${result.detail || result.error || 'Unknown error'}`,
                                 type: 'error',
                                 isLoading: false,
                                 autoClose: 5000
@@ -98,7 +124,7 @@ export default memo(({ id, data }) => {
                     } catch (err) {
                         console.error(err);
                         toast.update(uploadToast, {
-                            render: 'Error uploading file. Please check if backend is running.',
+                            render: `Error uploading file: ${err.message}`,
                             type: 'error',
                             isLoading: false,
                             autoClose: 5000
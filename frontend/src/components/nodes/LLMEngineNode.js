@@ -39,6 +39,7 @@ export default memo(({ id, data }) => {
           <select name="llm_provider" className="w-full px-3 py-2 border border-slate-300 rounded-md text-sm text-slate-800 bg-white outline-none focus:border-blue-500 transition-all nodrag" defaultValue={data.llm_provider} onChange={onChange}>
             <option value="openai">OpenAI</option>
             <option value="gemini">Gemini</option>
+            <option value="router">Auto (fastest available)</option>
           </select>
         </div>
 
@@ -64,6 +65,19 @@ export default memo(({ id, data }) => {
           />
         </div>
 
+        <div className="flex flex-col gap-1.5">
+          <label className="text-xs font-medium text-slate-600">History Turns</label>
+          <input
+            type="number"
+            name="history_turns"
+            min="0"
+            className="w-full px-3 py-2 border border-slate-300 rounded-md text-sm text-slate-800 bg-white outline-none focus:border-blue-500 transition-all nodrag"
+            placeholder="0 (no memory)"
+            defaultValue={data.history_turns}
+            onChange={onChange}
+          />
+        </div>
+
         <div className="flex items-center gap-2">
           <input 
             type="checkbox" 
@@ -87,6 +101,27 @@ export default memo(({ id, data }) => {
           </label>
         </div>
 
+        <div className="flex flex-col gap-1.5">
+          <label className="text-xs font-medium text-slate-600">Extra Search Queries (Optional)</label>
+          <textarea
+            className="w-full px-3 py-2 border border-slate-300 rounded-md text-sm text-slate-800 bg-white outline-none focus:border-blue-500 transition-all nodrag resize-none"
+            rows="2"
+            placeholder={'One per line, e.g. {query} site:wikipedia.org'}
+            defaultValue={(data.search_queries || []).join('\n')}
+            onChange={(e) => {
+              const queries = e.target.value.split('\n').map((q) => q.trim()).filter(Boolean);
+              setNodes((nds) =>
+                nds.map((node) => {
+                  if (node.id === id) {
+                    node.data = { ...node.data, search_queries: queries };
+                  }
+                  return node;
+                })
+              );
+            }}
+          />
+        </div>
+
         <div className="relative flex items-center justify-end pt-1">
             <span className="text-xs font-medium text-slate-500 mr-2">Response</span>
             <Handle type="source" position={Position.Right} id="response" className="!w-3 !h-3 !bg-blue-500 !border-2 !border-white" style={{ right: '-21px' }} />